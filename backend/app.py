@@ -2,20 +2,46 @@ import os
 import random
 import json
 import math
+import base64
+import binascii
+import time
+import threading
+import smtplib
+import io
+import functools
+import queue
+import atexit
+import re
+import unicodedata
+import bisect
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 # Import secrets for token generation and mail sending mock
-from flask import Flask, request, session, jsonify, send_from_directory, abort, redirect
+from flask import Flask, Response, request, session, jsonify, send_from_directory, abort, redirect, g, has_app_context, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
+import click
 from werkzeug.utils import secure_filename
 from sqlalchemy import func, event
 from sqlalchemy.orm import joinedload
 from sqlalchemy.engine import Engine
-from sqlalchemy import or_
+from sqlalchemy import or_, and_, inspect, text, literal_column
+from sqlalchemy import table as sql_table, column as sql_column
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
 import secrets
 from flask_mail import Mail, Message
 from flask_cors import CORS  # NEW: Import CORS
 import boto3 # NEW: Import boto3 for AWS S3
 from botocore.exceptions import NoCredentialsError
+import numpy as np
+from PIL import Image, ImageOps
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import multiprocess
 
 # --- Configuration ---
 app = Flask(__name__, static_folder='static', static_url_path='/static')
@@ -26,30 +52,334 @@ CORS(app, supports_credentials=True)
 
 # --- NEW: Load configuration dynamically from config.py ---
 try:
-    from config import Config
-    app.config.from_object(Config)
+    from config import load_config
+    app.config.from_object(load_config(os.environ.get('FLASK_ENV', 'production')))
 except ImportError:
     # Fallback if config.py is missing in this context
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['STYLIST_READ_MODEL'] = True
+    app.config['STYLIST_READ_MODEL_MAX_AGE'] = 300
+    app.config['PROFILE_CACHE_MAX_ENTRIES'] = 500
+    app.config['PROFILE_CACHE_TTL'] = 60
+    app.config['IDENTITY_CACHE_MAX_ENTRIES'] = 2000
+    app.config['IDENTITY_CACHE_TTL'] = 30
+    app.config['S3_UPLOAD_WORKERS'] = 4
+    app.config['DB_POOL_SIZE'] = 5
+    app.config['DB_MAX_OVERFLOW'] = 10
+    app.config['DB_POOL_TIMEOUT'] = 10
+    app.config['DB_POOL_RECYCLE'] = 1800
+    app.config['DB_POOL_PRE_PING'] = True
+    app.config['DB_STATEMENT_TIMEOUT_MS'] = 0
+    app.config['SQLALCHEMY_REPLICA_URI'] = None
+    app.config['READ_YOUR_WRITES_SECONDS'] = 10
+    app.config['SERVER_TIMING'] = True
+    app.config['SQL_SLOW_QUERY_MS'] = 100
+    app.config['SQL_EXPLAIN_SLOW_QUERIES'] = True
+    app.config['SQL_QUERY_COUNT_WARN'] = 30
+    app.config['SEED_DEMO_DATA'] = True
+    app.config['LIVE_POLL_INTERVAL'] = 1.0
+    app.config['LIVE_EVENT_RETENTION'] = 600
+    app.config['LIVE_MAX_SUBSCRIBERS'] = 1500
+    app.config['LOCATION_WRITE_BEHIND'] = True
+    app.config['LOCATION_FLUSH_INTERVAL'] = 5.0
+    app.config['LOCATION_MIN_MOVE_METERS'] = 25
+    app.config['LOCATION_REFRESH_SECONDS'] = 60
+    app.config['SALON_TIMEZONE'] = 'Africa/Casablanca'
 
 # --------------------------------------------------------
 
 app.config['SECRET_KEY'] = 'a_very_secret_and_long_key_for_myhair'
 
 # --- EMAIL CONFIGURATION ---
-app.config['MAIL_SERVER'] = 'mail.spacemail.com'
-app.config['MAIL_PORT'] = 465
-app.config['MAIL_USE_TLS'] = False
-app.config['MAIL_USE_SSL'] = True
-app.config['MAIL_USERNAME'] = 'contact@7ela9.com'
-app.config['MAIL_PASSWORD'] = 'dc9dnn9W@'
-app.config['MAIL_DEFAULT_SENDER'] = 'contact@7ela9.com'
+# Overridable from the environment, e.g. to point the outbox worker at a local
+# SMTP stand-in: MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_SSL=false
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'mail.spacemail.com')
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 465))
+app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', 'false').lower() == 'true'
+app.config['MAIL_USE_SSL'] = os.environ.get('MAIL_USE_SSL', 'true').lower() == 'true'
+app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME', 'contact@7ela9.com')
+app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD', 'dc9dnn9W@')
+app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'contact@7ela9.com')
 # ------------------------------------------------------------------------
 
-db = SQLAlchemy(app)
+# --- Metrics ---
+# Prometheus metrics served on /metrics. Under gunicorn, PROMETHEUS_MULTIPROC_DIR
+# points to a directory shared by the workers (see gunicorn.conf.py): each
+# worker writes its samples there and /metrics aggregates all of them. The
+# queue workers (`flask deliver-emails`, `flask process-images`) count emails
+# and jobs, so they must run on the same host with the same
+# PROMETHEUS_MULTIPROC_DIR (default /tmp/myhair-prometheus) to be exported.
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    # A worker may start before gunicorn has created it
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by route and status.',
+    ['method', 'route', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'Requests being handled.',
+    ['method', 'route'], multiprocess_mode='livesum'
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Response body size by route.',
+    ['method', 'route'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+)
+DB_ERRORS = Counter('db_errors_total', 'Database errors by exception type.', ['error'])
+# Constraint violations are how concurrent bookings, likes and subscriptions
+# detect a duplicate, so they are counted apart from the errors worth alerting on
+DB_CONFLICTS = Counter('db_conflicts_total', 'Integrity errors (expected duplicate or conflicting writes).')
+DB_POOL_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection.',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+S3_ERRORS = Counter('s3_errors_total', 'Failed S3 operations.', ['operation'])
+EMAILS_SENT = Counter('emails_sent_total', 'Emails accepted by the SMTP server.')
+EMAIL_SEND_ERRORS = Counter('email_send_errors_total', 'Failed email sends.', ['reason'])
+BACKGROUND_JOBS = Counter('background_jobs_total', 'Processed queue rows.', ['queue', 'result'])
+LIVE_SUBSCRIBERS = Gauge('live_subscribers', 'Open /api/live streams.', multiprocess_mode='livesum')
+LIVE_EVENTS_SENT = Counter('live_events_sent_total', 'Events queued to /api/live streams.', ['kind'])
+LOCATION_FIXES = Counter('location_fixes_total', 'Stylist GPS fixes by outcome.', ['result'])
+BOOKINGS = Counter('bookings_total', 'Reservation attempts by outcome.', ['result'])
+
+def metrics_route():
+    # The URL rule, not the path, keeps label cardinality bounded
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+@app.before_request
+def _start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.metrics_route = metrics_route()
+    REQUESTS_IN_PROGRESS.labels(request.method, g.metrics_route).inc()
+
+@app.after_request
+def _record_request_metrics(response):
+    route = g.get('metrics_route', 'unmatched')
+    REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(
+        time.perf_counter() - g.get('request_started', time.perf_counter())
+    )
+    # Streamed bodies (/api/live) must not be buffered to measure them
+    size = None if response.is_streamed else response.calculate_content_length()
+    if size is not None:
+        RESPONSE_SIZE.labels(request.method, route).observe(size)
+    return response
+
+@app.teardown_request
+def _finish_request_metrics(exc):
+    if 'metrics_route' in g:
+        REQUESTS_IN_PROGRESS.labels(request.method, g.pop('metrics_route')).dec()
+
+# --- Database Engine ---
+class PoolStats:
+    """Connection pool counters of this worker process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+        self.invalidated = 0
+        self.peak_in_use = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_checkout(self, wait, in_use, overflow):
+        with self._lock:
+            self.checkouts += 1
+            self.overflow_checkouts += overflow
+            self.peak_in_use = max(self.peak_in_use, in_use)
+            self.wait_seconds_total += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+
+    def record_timeout(self, wait):
+        with self._lock:
+            self.timeouts += 1
+            self.wait_seconds_total += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+
+    def record_invalidated(self):
+        with self._lock:
+            self.invalidated += 1
+
+    def stats(self, pool=None):
+        with self._lock:
+            result = {
+                'checkouts': self.checkouts,
+                'overflow_checkouts': self.overflow_checkouts,
+                'timeouts': self.timeouts,
+                'invalidated': self.invalidated,
+                'peak_in_use': self.peak_in_use,
+                'wait_seconds_total': round(self.wait_seconds_total, 6),
+                'wait_seconds_max': round(self.wait_seconds_max, 6),
+                'wait_seconds_avg': round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+            }
+        if isinstance(pool, QueuePool):
+            result.update(
+                pool_size=pool.size(),
+                in_use=pool.checkedout(),
+                idle=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+                max_overflow=pool._max_overflow,
+            )
+        return result
+
+pool_stats = PoolStats()
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool recording checkout waits, overflow use and timeouts in pool_stats."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.record_timeout(time.perf_counter() - start)
+            DB_ERRORS.labels('PoolTimeout').inc()
+            raise
+        wait = time.perf_counter() - start
+        in_use = self.checkedout()
+        pool_stats.record_checkout(wait, in_use, in_use > self.size())
+        DB_POOL_WAIT.observe(wait)
+        return conn
+
+@event.listens_for(InstrumentedQueuePool, 'invalidate')
+def _count_invalidated_connection(dbapi_connection, connection_record, exception):
+    # Stale connections found by pre-ping, or connections dropped after a disconnect error
+    pool_stats.record_invalidated()
+
+def build_engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS from the DB_POOL_* / DB_STATEMENT_TIMEOUT_MS settings."""
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    options = {
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    }
+    if uri.startswith('sqlite') and (uri.endswith(':memory:') or uri.rstrip('/') == 'sqlite:'):
+        # Flask-SQLAlchemy gives in-memory SQLite a single static connection
+        return options
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=config['DB_POOL_SIZE'],
+        max_overflow=config['DB_MAX_OVERFLOW'],
+        pool_timeout=config['DB_POOL_TIMEOUT'],
+    )
+    timeout_ms = int(config.get('DB_STATEMENT_TIMEOUT_MS') or 0)
+    if timeout_ms and uri.startswith('postgresql'):
+        options['connect_args'] = {'options': f'-c statement_timeout={timeout_ms}'}
+    elif timeout_ms and uri.startswith('mysql'):
+        # MySQL only enforces max_execution_time on SELECT statements
+        options['connect_args'] = {'init_command': f'SET SESSION max_execution_time={timeout_ms}'}
+    return options
+
+app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', build_engine_options(app.config))
+
+# --- Read Replica Routing ---
+# With SQLALCHEMY_REPLICA_URI set, views decorated with @replica_read run their
+# ORM reads on the 'replica' bind. Writes, flushes, every other view and code
+# using db.engine directly (read model, workers, CLI) stay on the primary.
+if app.config.get('SQLALCHEMY_REPLICA_URI'):
+    app.config.setdefault('SQLALCHEMY_BINDS', {})['replica'] = app.config['SQLALCHEMY_REPLICA_URI']
+
+class RoutingSession(FlaskSQLAlchemySession):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get('db_read_replica'):
+            return db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
 mail = Mail(app)
 
+# --- SQL Accounting ---
+# Every statement run through SQLAlchemy is timed. Per request, the totals go
+# out as a Server-Timing header; statements slower than SQL_SLOW_QUERY_MS are
+# logged with their plan, and so are requests running more than
+# SQL_QUERY_COUNT_WARN statements (usually a query inside a loop).
+class RequestSQLStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        # (seconds, engine, statement, parameters); parameters are only used to
+        # EXPLAIN, never logged, as they can hold emails and passwords
+        self.slow = []
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'handle_error')
+def _drop_statement_timer(exception_context):
+    if isinstance(exception_context.sqlalchemy_exception, IntegrityError):
+        DB_CONFLICTS.inc()
+    else:
+        DB_ERRORS.labels(type(exception_context.original_exception).__name__).inc()
+    started = exception_context.connection.info.get('statement_started') if exception_context.connection else None
+    if started:
+        started.pop()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['statement_started'].pop()
+    if has_app_context() and g.get('sql_explaining'):
+        return
+    slow = elapsed * 1000 >= app.config.get('SQL_SLOW_QUERY_MS', 100)
+    stats = g.get('sql_stats') if has_request_context() else None
+    if stats is not None:
+        stats.count += 1
+        stats.total += elapsed
+        stats.slowest = max(stats.slowest, elapsed)
+        if slow and not executemany:
+            stats.slow.append((elapsed, conn.engine, statement, parameters))
+    elif slow and not executemany:
+        # Workers and CLI commands: no request to attach a plan to
+        app.logger.warning("Slow SQL (%.1f ms): %s", elapsed * 1000, statement)
+
+def explain_statement(engine, statement, parameters):
+    """Plan of a logged SELECT as a list of lines, run on a separate connection."""
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return []
+    sqlite = engine.dialect.name == 'sqlite'
+    g.sql_explaining = True
+    try:
+        with engine.connect() as conn:
+            rows = conn.exec_driver_sql(('EXPLAIN QUERY PLAN ' if sqlite else 'EXPLAIN ') + statement, parameters).all()
+        return [str(row[-1]) if sqlite else ' '.join(str(v) for v in row if v is not None) for row in rows]
+    except Exception as e:
+        return [f"EXPLAIN failed: {e}"]
+    finally:
+        g.sql_explaining = False
+
+@app.before_request
+def _start_request_accounting():
+    g.sql_stats = RequestSQLStats()
+
+@app.after_request
+def _finish_request_accounting(response):
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+        return response
+    if app.config.get('SERVER_TIMING', True):
+        response.headers['Server-Timing'] = (
+            f'db;dur={stats.total * 1000:.1f};desc="{stats.count} queries", '
+            f'db-slowest;dur={stats.slowest * 1000:.1f}, '
+            f'app;dur={(time.perf_counter() - g.request_started) * 1000:.1f}'
+        )
+    if stats.count > app.config.get('SQL_QUERY_COUNT_WARN', 30):
+        app.logger.warning(
+            "%s %s ran %d SQL statements (%.1f ms)",
+            request.method, request.path, stats.count, stats.total * 1000
+        )
+    for elapsed, engine, statement, parameters in stats.slow:
+        plan = explain_statement(engine, statement, parameters) if app.config.get('SQL_EXPLAIN_SLOW_QUERIES', True) else []
+        app.logger.warning(
+            "Slow SQL (%.1f ms) in %s %s: %s%s",
+            elapsed * 1000, request.method, request.path, statement,
+            ''.join(f"\n  plan: {line}" for line in plan)
+        )
+    return response
+
 # Define file upload path (Kept for fallback, though S3 is primary now)
 UPLOAD_FOLDER = 'static/uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
@@ -59,80 +389,201 @@ if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
 # --- AWS S3 Client Setup ---
+# One client shared by the request threads and the upload pool (boto3 clients
+# are thread-safe). AWS_S3_ENDPOINT_URL points it at a local stand-in (moto
+# server, MinIO) for development and tests.
 s3_client = boto3.client(
     's3',
     aws_access_key_id=app.config.get('AWS_ACCESS_KEY_ID'),
     aws_secret_access_key=app.config.get('AWS_SECRET_ACCESS_KEY'),
-    region_name=app.config.get('AWS_REGION')
+    region_name=app.config.get('AWS_REGION'),
+    endpoint_url=app.config.get('AWS_S3_ENDPOINT_URL')
 )
 
+# Bounded pool for uploading the images of one request concurrently
+s3_upload_pool = ThreadPoolExecutor(
+    max_workers=app.config.get('S3_UPLOAD_WORKERS', 4),
+    thread_name_prefix='s3-upload'
+)
+
+PRESIGNED_UPLOAD_EXPIRES = 300  # seconds
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
 # --- Utility for File Upload Validation ---
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 # --- Utility for S3 Upload ---
-def upload_file_to_s3(file, prefix='upload'):
+def build_upload_key(filename, prefix='upload'):
     """
-    Uploads a file to S3 and returns the public URL.
-    Uses the existing naming convention pattern.
+    Object key for an upload, following the existing naming pattern
+    <prefix>_<user_id>_<timestamp>_<filename>. A short random part keeps keys
+    unique when several files of one request share a name and a second.
     """
+    filename = secure_filename(filename)
+    timestamp = int(datetime.now().timestamp())
+    # Use session user_id if available, else 'anon'
+    user_id = session.get('user_id', 'anon')
+    return f"{prefix}_{user_id}_{timestamp}_{secrets.token_hex(3)}_{filename}"
+
+def s3_public_url(key):
+    bucket_name = app.config.get('BUCKET_NAME')
+    endpoint = app.config.get('AWS_S3_ENDPOINT_URL')
+    if endpoint:
+        return f"{endpoint.rstrip('/')}/{bucket_name}/{key}"
+    return f"https://{bucket_name}.s3.{app.config.get('AWS_REGION')}.amazonaws.com/{key}"
+
+def _put_s3_object(fileobj, key, content_type):
+    """Uploads one object; safe to run outside the request context."""
     try:
-        filename = secure_filename(file.filename)
-        # Generate unique filename similar to existing logic
-        timestamp = int(datetime.now().timestamp())
-        # Use session user_id if available, else 'anon'
-        user_id = session.get('user_id', 'anon')
-        unique_filename = f"{prefix}_{user_id}_{timestamp}_{filename}"
-        
-        bucket_name = app.config.get('BUCKET_NAME')
-        region = app.config.get('AWS_REGION')
-        
         s3_client.upload_fileobj(
-            file,
-            bucket_name,
-            unique_filename,
+            fileobj,
+            app.config.get('BUCKET_NAME'),
+            key,
             ExtraArgs={
                 "ACL": "public-read",
-                "ContentType": file.content_type
+                "ContentType": content_type
             }
         )
-        
-        return f"https://{bucket_name}.s3.{region}.amazonaws.com/{unique_filename}"
-    
+        return s3_public_url(key)
     except Exception as e:
         print(f"S3 Upload Error: {e}")
+        S3_ERRORS.labels('upload').inc()
         return None
 
+def upload_file_to_s3(file, prefix='upload'):
+    """
+    Uploads a file to S3 and returns the public URL.
+    Uses the existing naming convention pattern.
+    """
+    return _put_s3_object(file, build_upload_key(file.filename, prefix), file.content_type)
+
+def upload_files_to_s3(files, prefix='upload'):
+    """
+    Uploads several files concurrently through s3_upload_pool.
+    Returns the public URLs in input order, None for failed uploads.
+    """
+    # Keys use the session, so they are computed here in the request thread
+    jobs = [(file, build_upload_key(file.filename, prefix), file.content_type) for file in files]
+    return list(s3_upload_pool.map(lambda job: _put_s3_object(*job), jobs))
+
+def s3_object_exists(key):
+    try:
+        s3_client.head_object(Bucket=app.config.get('BUCKET_NAME'), Key=key)
+        return True
+    except Exception:
+        return False
+
+# --- Image Variants ---
+# Uploaded avatars and publication images are re-encoded to WebP at a few
+# sizes by `flask process-images`, outside the request. Variants are stored
+# next to the original: in the bucket for S3 uploads, in static/uploads for
+# local files.
+IMAGE_VARIANTS = {'thumb': 160, 'card': 480, 'full': 1600}  # longest side, px
+IMAGE_WEBP_QUALITY = 80
+IMAGE_JOB_BATCH_SIZE = 10
+IMAGE_JOB_MAX_ATTEMPTS = 4
+
+def pick_image_variant(url, variants_json, size):
+    if not variants_json:
+        return url
+    try:
+        return json.loads(variants_json).get(size) or url
+    except ValueError:
+        return url
+
+def queue_image_job(kind, target_id, urls):
+    """Queues variant generation; the job becomes visible when the transaction commits."""
+    if urls:
+        db.session.add(ImageJob(kind=kind, target_id=target_id, source_urls=json.dumps(urls)))
+
+def local_static_path(url):
+    return os.path.join(app.static_folder, url[len('/static/'):])
+
+def read_image_source(url):
+    """Returns (image bytes, 's3' or 'local') for an image this app stored."""
+    if url.startswith('/static/'):
+        with open(local_static_path(url), 'rb') as f:
+            return f.read(), 'local'
+    s3_prefix = s3_public_url('')
+    if app.config.get('BUCKET_NAME') and url.startswith(s3_prefix):
+        obj = s3_client.get_object(Bucket=app.config.get('BUCKET_NAME'), Key=url[len(s3_prefix):])
+        return obj['Body'].read(), 's3'
+    raise ValueError(f"Unsupported image location: {url}")
+
+def render_image_variants(data):
+    """Returns {size name: WebP bytes}, never upscaling the original."""
+    variants = {}
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+        for name, size in IMAGE_VARIANTS.items():
+            variant = img.copy()
+            variant.thumbnail((size, size), Image.LANCZOS)
+            buf = io.BytesIO()
+            variant.save(buf, 'WEBP', quality=IMAGE_WEBP_QUALITY, method=4)
+            variants[name] = buf.getvalue()
+    return variants
+
+def store_image_variant(data, source_url, store, size_name):
+    stem = os.path.splitext(source_url.rsplit('/', 1)[-1])[0]
+    name = f"{stem}_{size_name}.webp"
+    if store == 's3':
+        s3_client.put_object(
+            Bucket=app.config.get('BUCKET_NAME'), Key=name, Body=data,
+            ACL='public-read', ContentType='image/webp'
+        )
+        return s3_public_url(name)
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], name), 'wb') as f:
+        f.write(data)
+    return f"/static/uploads/{name}"
+
+def process_image_job(job):
+    variants = []
+    urls = json.loads(job.source_urls)
+    for url in urls:
+        data, store = read_image_source(url)
+        rendered = render_image_variants(data)
+        variants.append({name: store_image_variant(blob, url, store, name) for name, blob in rendered.items()})
+
+    if job.kind == 'avatar':
+        coiffeur = Coiffeur.query.get(job.target_id)
+        # Skip if the avatar was replaced while this job waited
+        if coiffeur and coiffeur.profile_image == urls[0]:
+            coiffeur.profile_image_variants = json.dumps(variants[0])
+    else:
+        pub = Publication.query.get(job.target_id)
+        if pub:
+            pub.image_variants = json.dumps(variants)
+    job.status = 'done'
+
 # --- Utility Functions for Email ---
+# Emails are not sent inside the request: they are written to the email_outbox
+# table in the caller's transaction and delivered by `flask deliver-emails`.
 
 def generate_confirmation_token():
     return ''.join(random.choices('0123456789', k=6))
 
+def queue_email(recipient, subject, body):
+    """Adds an email to the outbox; it is sent once the current transaction commits."""
+    db.session.add(EmailOutbox(recipient=recipient, subject=subject, body=body))
+
 def send_confirmation_email(user, code):
-    try:
-        msg = Message(
-            'Your 7ela9 Account Confirmation Code',
-            recipients=[user.email],
-            sender=app.config['MAIL_DEFAULT_SENDER']
-        )
-        msg.body = f"Dear {user.name},\n\nYour 6-digit code is:\n\nCODE: {code}\n\n"
-        mail.send(msg)
-    except Exception as e:
-        print(f"ERROR: EMAIL SENDING FAILED ({e}) - CODE: {code}")
+    queue_email(
+        user.email,
+        'Your 7ela9 Account Confirmation Code',
+        f"Dear {user.name},\n\nYour 6-digit code is:\n\nCODE: {code}\n\n"
+    )
     return code
 
 def send_reset_email(user, code):
-    try:
-        msg = Message(
-            'Your 7ela9 Password Reset Code',
-            recipients=[user.email],
-            sender=app.config['MAIL_DEFAULT_SENDER']
-        )
-        msg.body = f"Dear {user.name},\n\nYour reset code is:\n\nCODE: {code}\n\n"
-        mail.send(msg)
-    except Exception as e:
-        print(f"ERROR: EMAIL SENDING FAILED ({e}) - CODE: {code}")
+    queue_email(
+        user.email,
+        'Your 7ela9 Password Reset Code',
+        f"Dear {user.name},\n\nYour reset code is:\n\nCODE: {code}\n\n"
+    )
     return code
 
 
@@ -149,9 +600,205 @@ def haversine(lat1, lon1, lat2, lon2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     return R * c
 
+# --- Geohash Spatial Index ---
+# Coiffeur positions are stored with a geohash so that nearby lookups can use a
+# plain B-tree index: every point inside a geohash cell shares the cell's prefix,
+# so a cell becomes a range scan `prefix <= geohash < prefix + '~'`.
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # ~5m cells, plenty for a salon position
+GEOHASH_MAX_CELLS = 16  # Upper bound on range scans issued for one lookup
+KM_PER_DEGREE_LAT = 111.32
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # Geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits = bits << 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+def geohash_cell_size(precision):
+    """Returns the (lat, lon) size in degrees of a geohash cell."""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+def bounding_box(lat, lon, radius_km):
+    """Returns (min_lat, max_lat, min_lon, max_lon) enclosing a circle of radius_km."""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = max(math.cos(math.radians(lat)), 0.01)
+    dlon = min(radius_km / (KM_PER_DEGREE_LAT * cos_lat), 180.0)
+    return max(lat - dlat, -90.0), min(lat + dlat, 90.0), max(lon - dlon, -180.0), min(lon + dlon, 180.0)
+
+def geohash_cells_for_box(min_lat, max_lat, min_lon, max_lon):
+    """
+    Returns the geohash prefixes covering a bounding box, using the finest
+    precision that needs at most GEOHASH_MAX_CELLS cells.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        cell_lat, cell_lon = geohash_cell_size(precision)
+        rows = int(math.floor((max_lat + 90.0) / cell_lat) - math.floor((min_lat + 90.0) / cell_lat)) + 1
+        cols = int(math.floor((max_lon + 180.0) / cell_lon) - math.floor((min_lon + 180.0) / cell_lon)) + 1
+        if rows * cols > GEOHASH_MAX_CELLS:
+            continue
+        cells = set()
+        for row in range(rows):
+            sample_lat = min(min_lat + row * cell_lat, max_lat)
+            for col in range(cols):
+                sample_lon = min(min_lon + col * cell_lon, max_lon)
+                cells.add(geohash_encode(sample_lat, sample_lon, precision))
+        # Corners may fall into an extra cell when the box is not cell aligned
+        for corner_lat in (min_lat, max_lat):
+            for corner_lon in (min_lon, max_lon):
+                cells.add(geohash_encode(corner_lat, corner_lon, precision))
+        return sorted(cells)
+    return []
+
+# --- Offline Geocoding ---
+# Déplacement requests carry a free-text client location ("Maârif, Casablanca").
+# It is resolved against this gazetteer of Moroccan cities and neighborhoods,
+# without any external service. Names are matched accent and case insensitively.
+GAZETTEER_CITIES = {
+    # city: (latitude, longitude, other spellings)
+    'Casablanca': (33.5731, -7.5898, ('casa', 'dar el beida', 'dar beida')),
+    'Rabat': (34.0209, -6.8416, ()),
+    'Salé': (34.0531, -6.7985, ('sla',)),
+    'Témara': (33.9287, -6.9063, ()),
+    'Marrakech': (31.6295, -7.9811, ('marrakesh', 'marrakch')),
+    'Fès': (34.0181, -5.0078, ('fez',)),
+    'Tanger': (35.7595, -5.8340, ('tangier', 'tangiers', 'tanja')),
+    'Agadir': (30.4278, -9.5981, ()),
+    'Meknès': (33.8935, -5.5473, ()),
+    'Oujda': (34.6814, -1.9086, ()),
+    'Kénitra': (34.2610, -6.5802, ()),
+    'Tétouan': (35.5889, -5.3626, ('tetuan',)),
+    'Mohammédia': (33.6866, -7.3830, ()),
+    'El Jadida': (33.2316, -8.5007, ('jadida',)),
+    'Safi': (32.2994, -9.2372, ()),
+    'Béni Mellal': (32.3373, -6.3498, ()),
+    'Nador': (35.1681, -2.9335, ()),
+    'Khouribga': (32.8811, -6.9063, ()),
+    'Settat': (33.0010, -7.6166, ()),
+    'Berrechid': (33.2655, -7.5876, ()),
+    'Essaouira': (31.5085, -9.7595, ('mogador',)),
+    'Ifrane': (33.5228, -5.1109, ()),
+    'Larache': (35.1932, -6.1557, ()),
+    'Khémisset': (33.8241, -6.0663, ()),
+    'Taza': (34.2100, -4.0100, ()),
+    'Al Hoceïma': (35.2517, -3.9372, ('hoceima',)),
+    'Ouarzazate': (30.9335, -6.9370, ()),
+    'Errachidia': (31.9314, -4.4247, ()),
+    'Laâyoune': (27.1253, -13.1625, ('layoune',)),
+    'Dakhla': (23.6848, -15.9580, ()),
+}
+GAZETTEER_NEIGHBORHOODS = {
+    # city: {neighborhood: (latitude, longitude)}
+    'Casablanca': {
+        'Maârif': (33.5800, -7.6330), 'Anfa': (33.5890, -7.6560), 'Aïn Diab': (33.5960, -7.6800),
+        'Bourgogne': (33.6000, -7.6350), 'Gauthier': (33.5930, -7.6270), 'Racine': (33.5890, -7.6400),
+        'Sidi Maârouf': (33.5300, -7.6450), 'Hay Hassani': (33.5650, -7.6700), 'Oasis': (33.5550, -7.6250),
+        'Californie': (33.5400, -7.6200), 'Derb Sultan': (33.5750, -7.6000), 'Belvédère': (33.5990, -7.5980),
+        'Hay Mohammadi': (33.5900, -7.5500), 'Aïn Sebaâ': (33.6080, -7.5350),
+        'Sidi Bernoussi': (33.6100, -7.5000), 'Médina': (33.6030, -7.6190), 'Centre': (33.5950, -7.6180),
+    },
+    'Rabat': {
+        'Agdal': (33.9980, -6.8520), 'Hay Riad': (33.9590, -6.8720), 'Hassan': (34.0200, -6.8300),
+        'Océan': (34.0250, -6.8450), 'Souissi': (33.9800, -6.8300), 'Akkari': (34.0100, -6.8600),
+        'Yacoub El Mansour': (34.0000, -6.8750), 'Médina': (34.0250, -6.8370), 'Centre': (34.0180, -6.8350),
+    },
+    'Salé': {
+        'Hay Salam': (34.0480, -6.7750), 'Tabriquet': (34.0500, -6.8000), 'Bettana': (34.0420, -6.8050),
+        'Médina': (34.0370, -6.8130),
+    },
+    'Marrakech': {
+        'Gueliz': (31.6340, -8.0100), 'Hivernage': (31.6230, -8.0150), 'Palmeraie': (31.6700, -7.9600),
+        'Daoudiate': (31.6550, -8.0050), 'Massira': (31.6150, -8.0600),
+        'Sidi Youssef Ben Ali': (31.6050, -7.9700), 'Médina': (31.6310, -7.9890), 'Centre': (31.6300, -8.0000),
+    },
+    'Fès': {
+        'Ville Nouvelle': (34.0330, -5.0000), 'Saïss': (34.0000, -5.0000), 'Narjiss': (34.0150, -4.9900),
+        'Zouagha': (34.0200, -5.0400), 'Médina': (34.0640, -4.9730), 'Centre': (34.0330, -5.0000),
+    },
+    'Tanger': {
+        'Malabata': (35.7700, -5.7800), 'Marshan': (35.7870, -5.8200), 'Iberia': (35.7750, -5.8150),
+        'Boukhalef': (35.7300, -5.8900), 'Médina': (35.7870, -5.8130), 'Centre': (35.7780, -5.8130),
+    },
+    'Agadir': {
+        'Talborjt': (30.4250, -9.5950), 'Founty': (30.4000, -9.5900), 'Hay Mohammadi': (30.4100, -9.5600),
+        'Centre': (30.4200, -9.5950),
+    },
+    'Meknès': {
+        'Hamria': (33.8950, -5.5400), 'Médina': (33.8970, -5.5600), 'Centre': (33.8950, -5.5450),
+    },
+}
+
+def normalize_place(text):
+    """'Maârif,  CASABLANCA' -> 'maarif casablanca'."""
+    stripped = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', stripped.lower()).split())
+
+def _build_gazetteer():
+    cities = {}
+    for city, (lat, lng, aliases) in GAZETTEER_CITIES.items():
+        for name in (city,) + aliases:
+            cities[normalize_place(name)] = (city, lat, lng)
+    neighborhoods = {}
+    for city, places in GAZETTEER_NEIGHBORHOODS.items():
+        for name, (lat, lng) in places.items():
+            neighborhoods.setdefault(normalize_place(name), {})[city] = (lat, lng)
+    return cities, neighborhoods
+
+GAZETTEER_CITY_INDEX, GAZETTEER_NEIGHBORHOOD_INDEX = _build_gazetteer()
+
+def _longest_place_match(padded, names):
+    """The longest of `names` that appears as whole words in ' padded text '."""
+    found = [name for name in names if f' {name} ' in padded]
+    return max(found, key=len) if found else None
+
+@functools.lru_cache(maxsize=4096)
+def geocode_place(text):
+    """
+    Returns (latitude, longitude) for a Moroccan city or neighborhood named in
+    `text`, or None. A neighborhood is only used with its city, unless its name
+    is unique to one city ("Gueliz"); otherwise the city centre is returned.
+    """
+    padded = f' {normalize_place(text or "")} '
+    city_key = _longest_place_match(padded, GAZETTEER_CITY_INDEX)
+    city = GAZETTEER_CITY_INDEX[city_key][0] if city_key else None
+    place_key = _longest_place_match(
+        padded, [name for name, cities in GAZETTEER_NEIGHBORHOOD_INDEX.items()
+                 if (city in cities if city else len(cities) == 1)]
+    )
+    if place_key:
+        cities = GAZETTEER_NEIGHBORHOOD_INDEX[place_key]
+        return cities[city] if city else next(iter(cities.values()))
+    if city_key:
+        return GAZETTEER_CITY_INDEX[city_key][1:]
+    return None
+
 # --- Database Models ---
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_city', 'city'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
@@ -175,18 +822,33 @@ class User(db.Model):
 
 class Coiffeur(db.Model):
     __tablename__ = 'coiffeurs'
+    __table_args__ = (
+        # Listing filters on status then orders by rating or waiting (id as tiebreaker)
+        db.Index('ix_coiffeurs_status_rating', 'status', 'rating', 'user_id'),
+        db.Index('ix_coiffeurs_status_waiting', 'status', 'people_waiting', 'user_id'),
+        db.Index('ix_coiffeurs_status_category', 'status', 'category'),
+    )
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
     profile_image = db.Column(db.String(200), default='/static/uploads/default_coiffeur.png')
+    # JSON {"thumb": url, "card": url, "full": url} written by `flask process-images`
+    profile_image_variants = db.Column(db.Text, nullable=True)
     category = db.Column(db.String(50), nullable=False)
     description = db.Column(db.Text)
     address = db.Column(db.String(200))
     people_waiting = db.Column(db.Integer, default=0)
     current_capacity = db.Column(db.Integer, default=0) 
     rating = db.Column(db.Float, default=4.5)
+    subscriber_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     latitude = db.Column(db.Float(precision=8), nullable=True)
     longitude = db.Column(db.Float(precision=8), nullable=True)
+    geohash = db.Column(db.String(12), nullable=True, index=True)
     location_updated_at = db.Column(db.DateTime, nullable=True)
+    # Mobile ('Déplacé') stylists are offered déplacement requests within this distance
+    service_radius_km = db.Column(db.Float, nullable=False, default=10, server_default='10')
+    # Set once the stylist saved their working hours: no rows then means closed
+    # every day, not DEFAULT_WORKING_HOURS
+    working_hours_set = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     
     status = db.Column(db.String(50), default='pending email confirmation')
     virement_name = db.Column(db.String(100), nullable=True) 
@@ -204,15 +866,55 @@ class Coiffeur(db.Model):
     menu_items = db.relationship('Menu', backref='coiffeur', lazy='dynamic')
     made_price_proposals = db.relationship('PriceProposal', foreign_keys='PriceProposal.coiffeur_id', lazy='dynamic')
 
+    def set_location(self, latitude, longitude):
+        """Updates the position and keeps the geohash index column in sync."""
+        self.latitude = latitude
+        self.longitude = longitude
+        if latitude is not None and longitude is not None:
+            self.geohash = geohash_encode(latitude, longitude)
+        else:
+            self.geohash = None
+        self.location_updated_at = datetime.utcnow()
+
+    def set_profile_image(self, url):
+        """Replaces the avatar and queues its resized variants."""
+        self.profile_image = url
+        self.profile_image_variants = None
+        queue_image_job('avatar', self.user_id, [url])
+
+    def image_variant(self, size):
+        """URL of the `size` avatar variant, or the original until it is generated."""
+        return pick_image_variant(self.profile_image, self.profile_image_variants, size)
+
 class Service(db.Model):
     __tablename__ = 'services'
+    __table_args__ = (
+        db.Index('ix_services_coiffeur', 'coiffeur_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     coiffeur_id = db.Column(db.Integer, db.ForeignKey('coiffeurs.user_id'), nullable=False)
     service_name = db.Column(db.String(100), nullable=False)
     price = db.Column(db.Float, nullable=False)
+    # Time blocked in the stylist's schedule by a reservation of this service
+    duration_minutes = db.Column(db.Integer, nullable=False, default=30, server_default='30')
+
+class WorkingHours(db.Model):
+    """One opening interval of a stylist on a weekday (several per day for breaks)."""
+    __tablename__ = 'working_hours'
+    __table_args__ = (
+        db.Index('ix_working_hours_coiffeur_weekday', 'coiffeur_id', 'weekday'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    coiffeur_id = db.Column(db.Integer, db.ForeignKey('coiffeurs.user_id'), nullable=False)
+    weekday = db.Column(db.Integer, nullable=False)  # 0 = Monday ... 6 = Sunday
+    opens_at = db.Column(db.Time, nullable=False)
+    closes_at = db.Column(db.Time, nullable=False)
 
 class Menu(db.Model):
     __tablename__ = 'menu'
+    __table_args__ = (
+        db.Index('ix_menu_coiffeur_name', 'coiffeur_id', 'name'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     coiffeur_id = db.Column(db.Integer, db.ForeignKey('coiffeurs.user_id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
@@ -222,6 +924,9 @@ class Menu(db.Model):
 
 class Photo(db.Model):
     __tablename__ = 'photos'
+    __table_args__ = (
+        db.Index('ix_photos_coiffeur', 'coiffeur_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     coiffeur_id = db.Column(db.Integer, db.ForeignKey('coiffeurs.user_id'), nullable=False)
     image_path = db.Column(db.String(200), nullable=False)
@@ -229,6 +934,9 @@ class Photo(db.Model):
 
 class Comment(db.Model):
     __tablename__ = 'comments'
+    __table_args__ = (
+        db.Index('ix_comments_coiffeur_timestamp', 'coiffeur_id', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     coiffeur_id = db.Column(db.Integer, db.ForeignKey('coiffeurs.user_id'), nullable=False)
@@ -237,6 +945,10 @@ class Comment(db.Model):
 
 class Reservation(db.Model):
     __tablename__ = 'reservations'
+    __table_args__ = (
+        db.Index('ix_reservations_coiffeur_date_time', 'coiffeur_id', 'date', 'time'),
+        db.Index('ix_reservations_client', 'client_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     coiffeur_id = db.Column(db.Integer, db.ForeignKey('coiffeurs.user_id'), nullable=False)
@@ -248,13 +960,30 @@ class Reservation(db.Model):
     
     service_detail = db.relationship('Service', backref='reservations', foreign_keys=[service_id])
 
+class SlotClaim(db.Model):
+    """One SLOT_STEP_MINUTES cell of a stylist's day held by a reservation; the primary key makes booking atomic."""
+    __tablename__ = 'slot_claims'
+    coiffeur_id = db.Column(db.Integer, db.ForeignKey('coiffeurs.user_id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    slot = db.Column(db.Integer, primary_key=True)  # minutes since midnight, a multiple of SLOT_STEP_MINUTES
+    reservation_id = db.Column(db.Integer, db.ForeignKey('reservations.id', ondelete='CASCADE'), nullable=False, index=True)
+
 class Publication(db.Model):
     __tablename__ = 'publications'
+    __table_args__ = (
+        db.Index('ix_publications_author_created', 'author_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     text = db.Column(db.Text, nullable=False)
     images = db.Column(db.Text, nullable=True) 
+    # JSON list aligned with `images`, one {"thumb", "card", "full"} dict per image
+    image_variants = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Denormalized counters, maintained by the like/comment endpoints and
+    # repaired by `flask reconcile-counters`
+    likes_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comments_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     likes = db.relationship('PublicationLike', backref='publication', lazy='dynamic', cascade="all, delete-orphan")
     comments = db.relationship('PublicationComment', backref='publication', lazy='dynamic', cascade="all, delete-orphan")
@@ -265,13 +994,30 @@ class Publication(db.Model):
         except:
             return []
 
+    def variant_list(self, size):
+        """The `size` variant of every image, falling back to originals not processed yet."""
+        try:
+            variants = json.loads(self.image_variants) if self.image_variants else []
+        except ValueError:
+            variants = []
+        return [
+            variants[i].get(size, url) if i < len(variants) and variants[i] else url
+            for i, url in enumerate(self.image_list())
+        ]
+
 class PublicationLike(db.Model):
     __tablename__ = 'publication_likes'
+    __table_args__ = (
+        db.Index('ix_publication_likes_client', 'client_id', 'publication_id'),
+    )
     publication_id = db.Column(db.Integer, db.ForeignKey('publications.id'), primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
     
 class PublicationComment(db.Model):
     __tablename__ = 'publication_comments'
+    __table_args__ = (
+        db.Index('ix_publication_comments_pub_created', 'publication_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     publication_id = db.Column(db.Integer, db.ForeignKey('publications.id'), nullable=False)
     client_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -280,18 +1026,28 @@ class PublicationComment(db.Model):
 
 class Subscription(db.Model):
     __tablename__ = 'subscriptions'
+    __table_args__ = (
+        db.Index('ix_subscriptions_coiffeur', 'coiffeur_id'),
+    )
     client_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
     coiffeur_id = db.Column(db.Integer, db.ForeignKey('coiffeurs.user_id'), primary_key=True)
     subscribed_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class DeplacementRequest(db.Model):
     __tablename__ = 'deplacement_requests'
+    __table_args__ = (
+        db.Index('ix_deplacement_requests_status_target', 'status', 'target_coiffeur_id'),
+        db.Index('ix_deplacement_requests_client', 'client_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     target_coiffeur_id = db.Column(db.Integer, db.ForeignKey('coiffeurs.user_id'), nullable=True) 
     
     service_requested = db.Column(db.String(100), nullable=False)
     client_location = db.Column(db.String(200), nullable=False)
+    # Geocoded from client_location, or the client's shared position
+    latitude = db.Column(db.Float(precision=8), nullable=True)
+    longitude = db.Column(db.Float(precision=8), nullable=True)
     preferred_date = db.Column(db.Date, nullable=False)
     preferred_time = db.Column(db.Time, nullable=False)
     details = db.Column(db.Text, nullable=True)
@@ -299,9 +1055,25 @@ class DeplacementRequest(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     proposals = db.relationship('PriceProposal', backref='request', lazy='dynamic', cascade="all, delete-orphan")
+    matches = db.relationship('DeplacementMatch', backref='request', lazy='dynamic', cascade="all, delete-orphan")
+
+class DeplacementMatch(db.Model):
+    """Inbox entry: a déplacement request offered to one mobile stylist."""
+    __tablename__ = 'deplacement_inbox'
+    __table_args__ = (
+        db.Index('ix_deplacement_inbox_coiffeur_created', 'coiffeur_id', 'created_at'),
+    )
+    request_id = db.Column(db.Integer, db.ForeignKey('deplacement_requests.id'), primary_key=True)
+    coiffeur_id = db.Column(db.Integer, db.ForeignKey('coiffeurs.user_id'), primary_key=True)
+    distance_km = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
 class PriceProposal(db.Model):
     __tablename__ = 'price_proposals'
+    __table_args__ = (
+        db.Index('ix_price_proposals_client_status', 'client_id', 'status'),
+        db.Index('ix_price_proposals_request_coiffeur', 'request_id', 'coiffeur_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     request_id = db.Column(db.Integer, db.ForeignKey('deplacement_requests.id'), nullable=False)
     coiffeur_id = db.Column(db.Integer, db.ForeignKey('coiffeurs.user_id'), nullable=False) 
@@ -313,102 +1085,2128 @@ class PriceProposal(db.Model):
     
     coiffeur = db.relationship('Coiffeur', backref='received_proposals', foreign_keys=[coiffeur_id])
 
+class ImageJob(db.Model):
+    __tablename__ = 'image_jobs'
+    __table_args__ = (
+        db.Index('ix_image_jobs_status_due', 'status', 'next_attempt_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'avatar' (target: coiffeur) or 'publication'
+    target_id = db.Column(db.Integer, nullable=False)
+    source_urls = db.Column(db.Text, nullable=False)  # JSON list of original image URLs
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'processing', 'done' or 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_due', 'status', 'next_attempt_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(100), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'sending', 'sent' or 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+class LiveEvent(db.Model):
+    """Waiting count and position changes, tailed by every worker for /api/live."""
+    __tablename__ = 'live_events'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'waiting' or 'location'
+    stylist_id = db.Column(db.Integer, nullable=False)
+    # Position after the change, for viewport subscriptions (NULL if unknown)
+    latitude = db.Column(db.Float(precision=8), nullable=True)
+    longitude = db.Column(db.Float(precision=8), nullable=True)
+    payload = db.Column(db.Text, nullable=False)  # JSON sent as the event data
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
 # --- Helper Logic ---
 def get_current_user():
-    if 'user_id' in session:
-        return User.query.get(session['user_id'])
+    """The logged in User, loaded at most once per request."""
+    if 'user_id' not in session:
+        return None
+    user_id = session['user_id']
+    # Keyed by id so a login or logout later in the same request is honoured
+    if g.get('current_user_id') != user_id:
+        g.current_user = User.query.get(user_id)
+        g.current_user_id = user_id
+    return g.current_user
+
+def is_logged_in():
+    return 'user_id' in session
+
+def replica_read(view):
+    """Serves GET requests of `view` from the replica, unless the visitor wrote recently."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        wrote_at = session.get('wrote_at', 0)
+        g.db_read_replica = (
+            request.method in ('GET', 'HEAD')
+            and 'replica' in db.engines
+            and time.time() - wrote_at > app.config.get('READ_YOUR_WRITES_SECONDS', 10)
+        )
+        return view(*args, **kwargs)
+    return wrapper
+
+@contextmanager
+def primary_reads():
+    """Sends the reads of the block to the primary, e.g. to fill a shared cache."""
+    previous = g.get('db_read_replica', False)
+    g.db_read_replica = False
+    try:
+        yield
+    finally:
+        g.db_read_replica = previous
+
+# --- Keyset Pagination Cursors ---
+# A cursor is the sort key of the last row of a page, JSON encoded then made
+# URL safe. It is opaque to clients; they only pass it back.
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, size):
+    """Returns the list of `size` key values, None without cursor, ValueError if malformed."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Invalid cursor')
+    return values
+
+def get_viewer_state(coiffeur_id, pub_ids):
+    """
+    Returns (is_subscribed, liked_pub_ids) for the logged-in client viewing a
+    coiffeur profile. Other viewers get (False, empty set) without a query.
+    """
+    current_user = get_current_user()
+    if not current_user or current_user.type != 'client':
+        return False, set()
+
+    is_subscribed = Subscription.query.filter_by(client_id=current_user.id, coiffeur_id=coiffeur_id).first() is not None
+    liked_ids = set()
+    if pub_ids:
+        liked_ids = {row[0] for row in db.session.query(PublicationLike.publication_id).filter(
+            PublicationLike.client_id == current_user.id,
+            PublicationLike.publication_id.in_(pub_ids)
+        ).all()}
+    return is_subscribed, liked_ids
+
+# --- Publication Feed ---
+FEED_PAGE_SIZE = 10
+FEED_MAX_PAGE_SIZE = 50
+FEED_PREVIEW_COMMENTS = 3
+COMMENTS_PAGE_SIZE = 20
+COMMENTS_MAX_PAGE_SIZE = 100
+
+def parse_page_args(default_limit, max_limit, cursor_size):
+    """
+    Reads `limit` and `cursor` from the query string.
+    Raises ValueError when either is malformed.
+    """
+    limit = max(1, min(int(request.args.get('limit', default_limit)), max_limit))
+    return limit, decode_cursor(request.args.get('cursor'), cursor_size)
+
+def serialize_pub_comment(comment, user_name):
+    return {
+        'id': comment.id,
+        'text': comment.comment_text,
+        'user': user_name,
+        'created_at': comment.created_at
+    }
+
+def comments_cursor(comment):
+    return encode_cursor([comment['created_at'], comment['id']])
+
+def get_publication_page(author_id, after=None, limit=FEED_PAGE_SIZE):
+    """
+    Returns (publications, next_cursor): one page of an author's publications,
+    newest first, keyed on (created_at, id). Each publication carries its like
+    and comment counters and its first FEED_PREVIEW_COMMENTS comments.
+    Costs a fixed number of queries whatever the page size.
+    """
+    query = Publication.query.filter_by(author_id=author_id)
+    if after:
+        created_at, pub_id = datetime.fromisoformat(after[0]), int(after[1])
+        query = query.filter(or_(
+            Publication.created_at < created_at,
+            and_(Publication.created_at == created_at, Publication.id < pub_id)
+        ))
+    publications_raw = query.order_by(Publication.created_at.desc(), Publication.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(publications_raw) > limit:
+        publications_raw = publications_raw[:limit]
+        last = publications_raw[-1]
+        next_cursor = encode_cursor([last.created_at, last.id])
+
+    # Batched lookups: one query each, whatever the number of publications
+    pub_ids = [pub.id for pub in publications_raw]
+    comments_by_pub = {}
+    if pub_ids:
+        # First N comments of every publication in one query
+        ranked = db.session.query(
+            PublicationComment.id.label('comment_id'),
+            func.row_number().over(
+                partition_by=PublicationComment.publication_id,
+                order_by=(PublicationComment.created_at.asc(), PublicationComment.id.asc())
+            ).label('position')
+        ).filter(
+            PublicationComment.publication_id.in_(pub_ids)
+        ).subquery()
+        pub_comments = db.session.query(
+            PublicationComment, User.name
+        ).join(
+            ranked, ranked.c.comment_id == PublicationComment.id
+        ).join(
+            User, PublicationComment.client_id == User.id
+        ).filter(
+            ranked.c.position <= FEED_PREVIEW_COMMENTS
+        ).order_by(
+            PublicationComment.created_at.asc(), PublicationComment.id.asc()
+        ).all()
+        for c in pub_comments:
+            comments_by_pub.setdefault(c.PublicationComment.publication_id, []).append(
+                serialize_pub_comment(c.PublicationComment, c.name)
+            )
+
+    publications = []
+    for pub in publications_raw:
+        preview = comments_by_pub.get(pub.id, [])
+        total = pub.comments_count
+        publications.append({
+            'id': pub.id,
+            'author_id': pub.author_id,
+            'text': pub.text,
+            'images': pub.variant_list('card'),
+            'images_full': pub.variant_list('full'),
+            'created_at': pub.created_at,
+            'likes_count': pub.likes_count,
+            'comments_count': total,
+            'comments': preview,
+            'comments_next_cursor': comments_cursor(preview[-1]) if preview and total > len(preview) else None,
+            'liked_by_user': False,
+        })
+    return publications, next_cursor
+
+def get_coiffeur_data(coiffeur_id, with_viewer=True):
+    """
+    Fetches all necessary data for a coiffeur profile, including the first
+    page of its publication feed.
+    With with_viewer=False the viewer specific fields (is_subscribed,
+    liked_by_user) are left False so the result can be shared between viewers.
+    """
+    coiffeur = Coiffeur.query.options(joinedload(Coiffeur.user)).get(coiffeur_id)
+    
+    if coiffeur:
+        services = Service.query.filter_by(coiffeur_id=coiffeur_id).all()
+        menu_items = Menu.query.filter_by(coiffeur_id=coiffeur_id).order_by(Menu.name).all()
+        comments = Comment.query.filter_by(coiffeur_id=coiffeur_id).order_by(Comment.timestamp.desc()).all()
+        
+        publications, feed_next_cursor = get_publication_page(coiffeur_id)
+        is_subscribed, liked_ids = (
+            get_viewer_state(coiffeur_id, [pub['id'] for pub in publications]) if with_viewer else (False, set())
+        )
+        for pub in publications:
+            pub['liked_by_user'] = pub['id'] in liked_ids
+
+        return {
+            'user': coiffeur.user,
+            'coiffeur': coiffeur,
+            'services': services,
+            'menu_items': menu_items, 
+            'photos': Photo.query.filter_by(coiffeur_id=coiffeur_id).all(),
+            'comments': comments,
+            'publications': publications,
+            'feed_next_cursor': feed_next_cursor,
+            'is_subscribed': is_subscribed,
+            'subscriber_count': coiffeur.subscriber_count
+        }
     return None
 
-def is_logged_in():
-    return 'user_id' in session
+# --- Response Caching ---
+class LRUCache:
+    """
+    Thread-safe LRU cache with an entry limit and optional TTL (seconds).
+    Keeps hit/miss/eviction counters for monitoring.
+    """
+
+    def __init__(self, max_entries=1000, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+# Shared (viewer independent) part of /api/stylists/<id>, keyed by stylist id.
+# Commits touching a profile evict its entry in this worker; the TTL bounds how
+# long other workers can serve a profile written elsewhere.
+stylist_profile_cache = LRUCache(
+    max_entries=app.config.get('PROFILE_CACHE_MAX_ENTRIES', 500),
+    ttl=app.config.get('PROFILE_CACHE_TTL', 60)
+)
+
+# Identity of logged in users as returned by /api/me, keyed by user id. Commits
+# touching a user (or their coiffeur row) evict it; IDENTITY_CACHE_TTL = 0
+# disables the cache.
+identity_cache = LRUCache(
+    max_entries=app.config.get('IDENTITY_CACHE_MAX_ENTRIES', 2000),
+    ttl=app.config.get('IDENTITY_CACHE_TTL', 30)
+)
+
+def serialize_identity(user):
+    return {
+        'id': user.id,
+        'name': user.name,
+        'email': user.email,
+        'type': user.type,
+        'city': user.city,
+        'isConfirmed': user.is_confirmed,
+        'image': user.coiffeur.image_variant('thumb') if user.type == 'coiffeur' and user.coiffeur else None
+    }
+
+def get_current_identity():
+    """Serialized identity of the logged in user, from identity_cache when possible."""
+    if 'user_id' not in session:
+        return None
+    user_id = session['user_id']
+    use_cache = app.config.get('IDENTITY_CACHE_TTL', 30) > 0
+    identity = identity_cache.get(user_id) if use_cache else None
+    if identity is None:
+        user = get_current_user()
+        if user is None:
+            return None
+        identity = serialize_identity(user)
+        if use_cache:
+            identity_cache.set(user_id, identity)
+    return identity
+
+# --- Stylist Read Model ---
+# The public listing, map and nearby endpoints read from an in-process,
+# column-oriented snapshot of the active stylists instead of re-running the
+# User/Coiffeur join on every call. Each worker builds it once, then applies the
+# rows changed by committed sessions on the next read. A full rebuild happens
+# after STYLIST_READ_MODEL_MAX_AGE seconds so that writes made by other gunicorn
+# workers are eventually picked up too.
+def haversine_np(lat, lon, lats, lngs):
+    """Vectorized haversine: distance in km from one point to arrays of points."""
+    lat1 = np.radians(lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlon = np.radians(lngs) - np.radians(lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 6371 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def _stylist_rows(ids=None):
+    """Fetches the read model columns for active stylists (optionally only `ids`)."""
+    stmt = db.select(
+        User.id, User.name, User.city, Coiffeur.category, Coiffeur.profile_image,
+        Coiffeur.address, Coiffeur.rating, Coiffeur.people_waiting,
+        Coiffeur.current_capacity, Coiffeur.latitude, Coiffeur.longitude,
+        Coiffeur.profile_image_variants
+    ).join(Coiffeur, User.id == Coiffeur.user_id).where(Coiffeur.status == 'active')
+    if ids is not None:
+        stmt = stmt.where(User.id.in_(ids))
+    with db.engine.connect() as conn:
+        return conn.execute(stmt).all()
+
+def _stylist_columns(rows):
+    """Turns (id, name, city, ...) rows into the snapshot's column arrays."""
+    nan = float('nan')
+    columns = {
+        'id': np.array([r[0] for r in rows], dtype=np.int64),
+        'name': np.array([r[1] for r in rows], dtype=object),
+        'city': np.array([r[2] for r in rows], dtype=object),
+        'category': np.array([r[3] for r in rows], dtype=object),
+        # Listing cards show the thumbnail variant once it exists
+        'image': np.array([pick_image_variant(r[4], r[11], 'thumb') for r in rows], dtype=object),
+        'address': np.array([r[5] for r in rows], dtype=object),
+        'rating': np.array([nan if r[6] is None else r[6] for r in rows], dtype=np.float64),
+        'waiting': np.array([r[7] or 0 for r in rows], dtype=np.int64),
+        'capacity': np.array([r[8] or 0 for r in rows], dtype=np.int64),
+        'lat': np.array([nan if r[9] is None else r[9] for r in rows], dtype=np.float64),
+        'lng': np.array([nan if r[10] is None else r[10] for r in rows], dtype=np.float64),
+    }
+    return columns
+
+class StylistSnapshot:
+    """Immutable arrays of the active stylists, one entry per stylist, ordered by id."""
+
+    def __init__(self, version, columns, built_at=None, positions_version=0):
+        self.version = version
+        self.built_at = time.monotonic() if built_at is None else built_at
+        self.columns = columns
+        # location_buffer.version whose positions are applied to lat/lng
+        self.positions_version = positions_version
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def value(self, column, i):
+        """Returns a JSON friendly scalar (NaN becomes None)."""
+        v = self.columns[column][i]
+        if isinstance(v, np.floating):
+            return None if np.isnan(v) else float(v)
+        if isinstance(v, np.integer):
+            return int(v)
+        return v
+
+    def records(self, indices, fields):
+        """Builds one dict per index. `fields` maps output keys to column names."""
+        return [{key: self.value(column, i) for key, column in fields.items()} for i in indices]
+
+    def filter_mask(self, city=None, category=None):
+        mask = np.ones(len(self), dtype=bool)
+        if city:
+            mask &= self.columns['city'] == city
+        if category and category != 'all':
+            mask &= self.columns['category'] == category
+        return mask
+
+    def after_mask(self, sort_by, key, last_id):
+        """Rows that come after (key, last_id) in the listing order (keyset pagination)."""
+        ids = self.columns['id']
+        if sort_by == 'waiting':
+            waiting = self.columns['waiting']
+            return (waiting > key) | ((waiting == key) & (ids > last_id))
+        ratings = self.columns['rating']
+        unrated = np.isnan(ratings)
+        if key is None:
+            return unrated & (ids > last_id)
+        with np.errstate(invalid='ignore'):
+            return (ratings < key) | ((ratings == key) & (ids > last_id)) | unrated
+
+    def sorted_indices(self, mask, sort_by='rating'):
+        """Indices of `mask` ordered like the listing (rating desc or waiting asc, then id)."""
+        idx = np.flatnonzero(mask)
+        ids = self.columns['id'][idx]
+        if sort_by == 'waiting':
+            order = np.lexsort((ids, self.columns['waiting'][idx]))
+        else:
+            # NaN ratings sort last, like NULLs in a descending ORDER BY
+            ratings = np.nan_to_num(self.columns['rating'][idx], nan=-np.inf)
+            order = np.lexsort((ids, -ratings))
+        return idx[order]
+
+    def nearby(self, lat, lon, radius, limit):
+        """Returns (indices, distances) of stylists within `radius` km, closest first."""
+        lats = self.columns['lat']
+        lngs = self.columns['lng']
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius)
+        with np.errstate(invalid='ignore'):
+            candidates = np.flatnonzero(
+                (lats >= min_lat) & (lats <= max_lat) & (lngs >= min_lon) & (lngs <= max_lon)
+            )
+        dist = haversine_np(lat, lon, lats[candidates], lngs[candidates])
+        within = dist <= radius
+        candidates, dist = candidates[within], dist[within]
+        order = np.argsort(dist, kind='stable')[:limit]
+        return candidates[order], dist[order]
+
+class StylistReadModel:
+    """Owns the current StylistSnapshot and swaps in refreshed versions."""
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._snapshot = None
+        self._pending_ids = set()
+        self._lock = threading.Lock()
+        self._version = 0
+
+    def mark_changed(self, ids):
+        """Records stylist ids whose rows changed; applied on the next read."""
+        with self._lock:
+            self._pending_ids.update(ids)
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def snapshot(self):
+        snap = self._snapshot
+        if (snap is not None and not self._pending_ids and snap.positions_version == location_buffer.version
+                and time.monotonic() - snap.built_at < self.max_age):
+            return snap
+        with self._lock:
+            snap = self._snapshot
+            if snap is None or time.monotonic() - snap.built_at >= self.max_age:
+                self._pending_ids.clear()
+                snap = self._build()
+            elif self._pending_ids:
+                changed = self._pending_ids
+                self._pending_ids = set()
+                snap = self._refresh(snap, changed)
+            # Rows read from the database miss the fixes still buffered in memory
+            if snap.positions_version != location_buffer.version:
+                snap = self._move(snap)
+            self._snapshot = snap
+            return snap
+
+    def _build(self):
+        self._version += 1
+        return StylistSnapshot(self._version, _stylist_columns(_stylist_rows()))
+
+    def _refresh(self, snap, changed_ids):
+        """Replaces the rows of `changed_ids` without re-reading the other stylists."""
+        fresh = _stylist_columns(_stylist_rows(sorted(changed_ids)))
+        keep = ~np.isin(snap.columns['id'], np.fromiter(changed_ids, dtype=np.int64))
+        merged = {
+            name: np.concatenate([snap.columns[name][keep], fresh[name]])
+            for name in snap.columns
+        }
+        order = np.argsort(merged['id'], kind='stable')
+        self._version += 1
+        return StylistSnapshot(self._version, {name: col[order] for name, col in merged.items()})
+
+    def _move(self, snap):
+        """Applies the positions buffered by location_buffer to a copy of lat/lng."""
+        version, positions = location_buffer.positions()
+        columns = dict(snap.columns)
+        if positions:
+            ids = np.fromiter(positions, dtype=np.int64, count=len(positions))
+            coords = np.array(list(positions.values()), dtype=np.float64)
+            idx = np.minimum(np.searchsorted(columns['id'], ids), max(len(snap) - 1, 0))
+            found = columns['id'][idx] == ids if len(snap) else np.zeros(len(ids), dtype=bool)
+            columns['lat'] = columns['lat'].copy()
+            columns['lng'] = columns['lng'].copy()
+            columns['lat'][idx[found]] = coords[found, 0]
+            columns['lng'][idx[found]] = coords[found, 1]
+        self._version += 1
+        return StylistSnapshot(self._version, columns, built_at=snap.built_at, positions_version=version)
+
+stylist_read_model = StylistReadModel(max_age=app.config.get('STYLIST_READ_MODEL_MAX_AGE', 300))
+
+# Rows whose coiffeur_id column points at the profile they appear on
+PROFILE_CHILD_MODELS = (Menu, Service, Photo, Comment, Subscription)
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_stylist_changes(session, flush_context):
+    changed = session.info.setdefault('stylist_changes', set())
+    profiles = session.info.setdefault('profile_changes', set())
+    identities = session.info.setdefault('identity_changes', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Coiffeur):
+            changed.add(obj.user_id)
+            profiles.add(obj.user_id)
+            identities.add(obj.user_id)
+        elif isinstance(obj, User):
+            identities.add(obj.id)
+            if obj.type == 'coiffeur':
+                changed.add(obj.id)
+                profiles.add(obj.id)
+        elif isinstance(obj, Publication):
+            profiles.add(obj.author_id)
+        elif isinstance(obj, PROFILE_CHILD_MODELS):
+            profiles.add(obj.coiffeur_id)
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_stylist_changes(session):
+    changed = session.info.pop('stylist_changes', None)
+    if changed:
+        stylist_read_model.mark_changed(changed)
+    for stylist_id in session.info.pop('profile_changes', ()):
+        stylist_profile_cache.invalidate(stylist_id)
+    for user_id in session.info.pop('identity_changes', ()):
+        identity_cache.invalidate(user_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_stylist_changes(session):
+    session.info.pop('stylist_changes', None)
+    session.info.pop('profile_changes', None)
+    session.info.pop('identity_changes', None)
+    session.info.pop('wrote', None)
+
+# Coiffeur columns pushed to /api/live subscribers, by event kind
+LIVE_EVENT_FIELDS = {
+    'waiting': ('people_waiting', 'current_capacity'),
+    'location': ('latitude', 'longitude'),
+}
+
+@event.listens_for(db.session, 'after_flush')
+def _record_live_events(session, flush_context):
+    # Written on the flush's connection, so events commit or roll back with the change
+    rows = []
+    for obj in session.dirty:
+        if not isinstance(obj, Coiffeur) or obj.status != 'active':
+            continue
+        attrs = inspect(obj).attrs
+        for kind, fields in LIVE_EVENT_FIELDS.items():
+            if not any(attrs[field].history.has_changes() for field in fields):
+                continue
+            if kind == 'waiting':
+                payload = {'id': obj.user_id, 'waiting': obj.people_waiting or 0, 'capacity': obj.current_capacity or 0}
+            else:
+                payload = {'id': obj.user_id, 'lat': obj.latitude, 'lng': obj.longitude}
+            rows.append({
+                'kind': kind, 'stylist_id': obj.user_id,
+                'latitude': obj.latitude, 'longitude': obj.longitude,
+                'payload': json.dumps(payload), 'created_at': datetime.utcnow(),
+            })
+    if rows:
+        session.connection().execute(LiveEvent.__table__.insert(), rows)
+
+@event.listens_for(db.session, 'after_flush')
+def _note_write(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+@event.listens_for(db.session, 'after_commit')
+def _start_read_your_writes_window(db_session):
+    # Stored in the cookie so that every worker keeps this visitor on the primary
+    if db_session.info.pop('wrote', False) and has_request_context():
+        session['wrote_at'] = time.time()
+
+# --- Location Write-Behind ---
+# GPS fixes posted to /api/coiffeur/location are not written one by one. Each
+# worker keeps the latest fix per stylist in memory, and a background thread
+# writes them every LOCATION_FLUSH_INTERVAL seconds, one multi-row UPDATE per
+# LOCATION_FLUSH_BATCH stylists. A fix within LOCATION_MIN_MOVE_METERS of the
+# last accepted one is dropped, unless LOCATION_REFRESH_SECONDS have passed (so
+# location_updated_at still says when the stylist was last seen). Reads in the
+# worker overlay the buffered positions; other workers see them after the flush.
+LOCATION_FLUSH_BATCH = 500
+
+def write_locations(conn, fixes):
+    """One UPDATE for [(stylist_id, (lat, lng, fixed_at)), ...], plus their live events."""
+    table = Coiffeur.__table__
+    ids = [stylist_id for stylist_id, _ in fixes]
+    by_id = dict(fixes)
+
+    def per_row(values):
+        return db.case(values, value=table.c.user_id)
+
+    fixed_at = per_row({i: fix[2] for i, fix in by_id.items()})
+    conn.execute(table.update().where(
+        table.c.user_id.in_(ids),
+        # Another worker may already have written a more recent fix
+        or_(table.c.location_updated_at.is_(None), table.c.location_updated_at < fixed_at)
+    ).values(
+        latitude=per_row({i: fix[0] for i, fix in by_id.items()}),
+        longitude=per_row({i: fix[1] for i, fix in by_id.items()}),
+        geohash=per_row({i: geohash_encode(fix[0], fix[1]) for i, fix in by_id.items()}),
+        location_updated_at=fixed_at,
+    ))
+
+    # Bypasses the ORM, so _record_live_events does not see these changes
+    active = conn.execute(
+        db.select(table.c.user_id).where(table.c.user_id.in_(ids), table.c.status == 'active')
+    ).scalars().all()
+    if active:
+        conn.execute(LiveEvent.__table__.insert(), [{
+            'kind': 'location', 'stylist_id': i,
+            'latitude': by_id[i][0], 'longitude': by_id[i][1],
+            'payload': json.dumps({'id': i, 'lat': by_id[i][0], 'lng': by_id[i][1]}),
+            'created_at': by_id[i][2],
+        } for i in active])
+
+class LocationBuffer:
+    """Latest unwritten GPS fix per stylist, flushed in batches by a background thread."""
+
+    def __init__(self, flush_interval=5.0, min_move_meters=25, refresh_seconds=60):
+        self.flush_interval = flush_interval
+        self.min_move_meters = min_move_meters
+        self.refresh_seconds = refresh_seconds
+        self._pending = {}   # stylist_id -> (lat, lng, fixed_at)
+        self._flushing = {}  # the batch being written, still visible to reads
+        self._accepted = {}  # last accepted fix per stylist, for the distance check
+        # Bumped on every accepted fix; the stylist read model compares it
+        self.version = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, stylist_id, lat, lng):
+        """Buffers a fix. Returns False if it was dropped for barely moving."""
+        now = datetime.utcnow()
+        with self._lock:
+            last = self._accepted.get(stylist_id)
+            if (last is not None
+                    and haversine(last[0], last[1], lat, lng) * 1000 < self.min_move_meters
+                    and (now - last[2]).total_seconds() < self.refresh_seconds):
+                LOCATION_FIXES.labels('dropped').inc()
+                return False
+            self._pending[stylist_id] = self._accepted[stylist_id] = (lat, lng, now)
+            self.version += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='location-flush', daemon=True)
+                self._thread.start()
+        LOCATION_FIXES.labels('buffered').inc()
+        return True
+
+    def forget(self, stylist_id):
+        """Drops the buffered fix of a stylist whose position is written directly."""
+        with self._lock:
+            self._accepted.pop(stylist_id, None)
+            if self._pending.pop(stylist_id, None) is not None:
+                self.version += 1
+
+    def positions(self):
+        """(version, {stylist_id: (lat, lng)}) of the fixes not yet in the database."""
+        with self._lock:
+            fixes = dict(self._flushing)
+            fixes.update(self._pending)
+            return self.version, {stylist_id: fix[:2] for stylist_id, fix in fixes.items()}
+
+    def flush(self):
+        """Writes the buffered fixes. Returns the number of stylists written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._flushing = batch
+                # Past refresh_seconds any next fix is accepted anyway: forget
+                # stylists who stopped sending instead of keeping them forever
+                stale_before = datetime.utcnow() - timedelta(seconds=self.refresh_seconds)
+                self._accepted = {stylist_id: fix for stylist_id, fix in self._accepted.items()
+                                  if fix[2] >= stale_before}
+            if not batch:
+                return 0
+            fixes = sorted(batch.items())
+            try:
+                with db.engine.begin() as conn:
+                    for start in range(0, len(fixes), LOCATION_FLUSH_BATCH):
+                        write_locations(conn, fixes[start:start + LOCATION_FLUSH_BATCH])
+                    # Mobile stylists who moved are offered the requests around them now
+                    rematch_stylists(conn, [stylist_id for stylist_id, _ in fixes])
+            except Exception:
+                with self._lock:
+                    # Retried on the next flush, unless a newer fix arrived meanwhile
+                    for stylist_id, fix in batch.items():
+                        self._pending.setdefault(stylist_id, fix)
+                    self._flushing = {}
+                raise
+            with self._lock:
+                self._flushing = {}
+            LOCATION_FIXES.labels('written').inc(len(fixes))
+            return len(fixes)
+
+    def _run(self):
+        with app.app_context():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except Exception:
+                    app.logger.exception("Location flush failed")
+
+location_buffer = LocationBuffer(
+    flush_interval=app.config.get('LOCATION_FLUSH_INTERVAL', 5.0),
+    min_move_meters=app.config.get('LOCATION_MIN_MOVE_METERS', 25),
+    refresh_seconds=app.config.get('LOCATION_REFRESH_SECONDS', 60)
+)
+
+@atexit.register
+def _flush_locations_on_exit():
+    # Gunicorn workers exit normally on restarts and deploys
+    with app.app_context():
+        location_buffer.flush()
+
+def overlay_positions(items):
+    """Replaces 'lat'/'lng' of serialized stylists with their buffered positions."""
+    _, positions = location_buffer.positions()
+    if positions:
+        for item in items:
+            if item['id'] in positions:
+                item['lat'], item['lng'] = positions[item['id']]
+    return items
+
+# --- Schema Upgrades ---
+# db.create_all() only creates missing tables, it never alters existing ones.
+# Columns added to a model after its table was first deployed are listed here
+# and added with ALTER TABLE; indexes declared on the models (index=True or
+# __table_args__) are created if missing. Only `flask upgrade-db` runs this and
+# the backfills below, once per deploy before the workers start: importing the
+# app never alters or rewrites an existing database.
+SCHEMA_ADDITIONS = [
+    ('coiffeurs', 'geohash'),
+    ('coiffeurs', 'subscriber_count'),
+    ('publications', 'likes_count'),
+    ('publications', 'comments_count'),
+    ('coiffeurs', 'profile_image_variants'),
+    ('publications', 'image_variants'),
+    ('coiffeurs', 'service_radius_km'),
+    ('deplacement_requests', 'latitude'),
+    ('deplacement_requests', 'longitude'),
+    ('services', 'duration_minutes'),
+    ('coiffeurs', 'working_hours_set'),
+]
+
+def added_column_ddl(column, dialect):
+    """`name TYPE [DEFAULT literal]` for ALTER TABLE ADD COLUMN, rendered for `dialect`."""
+    ddl = f'{column.name} {column.type.compile(dialect=dialect)}'
+    default = dialect.ddl_compiler(dialect, None).get_column_default_string(column)
+    return f'{ddl} DEFAULT {default}' if default is not None else ddl
+
+def upgrade_schema():
+    """Applies SCHEMA_ADDITIONS and missing indexes. Returns the added (table, column) pairs."""
+    added = []
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table_name, column_name in SCHEMA_ADDITIONS:
+            existing = {c['name'] for c in inspector.get_columns(table_name)}
+            if column_name in existing:
+                continue
+            column = db.metadata.tables[table_name].c[column_name]
+            conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {added_column_ddl(column, db.engine.dialect)}'))
+            added.append((table_name, column_name))
+            print(f"Schema upgrade: added {table_name}.{column_name}")
+
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    return added
+
+def backfill_geohashes():
+    """Computes the geohash of coiffeurs located before the column existed."""
+    missing = Coiffeur.query.filter(
+        Coiffeur.latitude.is_not(None), Coiffeur.longitude.is_not(None), Coiffeur.geohash.is_(None)
+    ).all()
+    for coif in missing:
+        coif.geohash = geohash_encode(coif.latitude, coif.longitude)
+    if missing:
+        db.session.commit()
+
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Creates missing tables, columns and indexes, then backfills the new ones."""
+    db.create_all()
+    added = upgrade_schema()
+    print(f"Schema up to date ({len(added)} column(s) added).")
+    if any(column.endswith('_count') for _, column in added):
+        reconcile_counters()
+        print("Counters reconciled.")
+    backfill_geohashes()
+    print(f"{claim_existing_reservations()} slot claim(s) added for existing reservations.")
+    if search_dialect() is not None:
+        print(f"{rebuild_search_index()} stylist(s) indexed for search.")
+
+# --- Query Plan Checks ---
+# The query shapes behind the hot endpoints. `flask explain-hot-queries` runs
+# EXPLAIN QUERY PLAN (SQLite) on each and fails if a table is fully scanned,
+# so a dropped or mismatched index shows up before it reaches production.
+def hot_queries():
+    stylist_cards = db.select(User.id, User.name, Coiffeur.rating).join(Coiffeur, User.id == Coiffeur.user_id)
+    return {
+        'stylists by rating': stylist_cards.where(Coiffeur.status == 'active').order_by(
+            Coiffeur.rating.desc().nullslast(), Coiffeur.user_id.asc()).limit(25),
+        'stylists by waiting': stylist_cards.where(Coiffeur.status == 'active').order_by(
+            Coiffeur.people_waiting.asc(), Coiffeur.user_id.asc()).limit(25),
+        'stylists by category': stylist_cards.where(Coiffeur.status == 'active', Coiffeur.category == 'Homme'),
+        'stylists by city': stylist_cards.where(Coiffeur.status == 'active', User.city == 'Rabat'),
+        'nearby geohash cell': db.select(Coiffeur.user_id).where(
+            Coiffeur.geohash >= 'evdz', Coiffeur.geohash < 'evdz~'),
+        'publication feed page': db.select(Publication.id).where(Publication.author_id == 1).order_by(
+            Publication.created_at.desc(), Publication.id.desc()).limit(11),
+        'publication comments page': db.select(PublicationComment.id).where(
+            PublicationComment.publication_id == 1).order_by(
+            PublicationComment.created_at.asc(), PublicationComment.id.asc()).limit(21),
+        'viewer likes': db.select(PublicationLike.publication_id).where(
+            PublicationLike.client_id == 1, PublicationLike.publication_id.in_([1, 2, 3])),
+        'slot claim check': db.select(SlotClaim.slot).where(
+            SlotClaim.coiffeur_id == 1, SlotClaim.date == datetime(2024, 1, 1).date(), SlotClaim.slot.in_([600, 630])),
+        'coiffeur reservations': db.select(Reservation.id, User.name, Service.service_name).join(
+            User, Reservation.client_id == User.id).outerjoin(Service, Reservation.service_id == Service.id).where(
+            Reservation.coiffeur_id == 1, Reservation.date >= datetime(2024, 1, 1).date()).order_by(
+            Reservation.date, Reservation.time, Reservation.id).limit(RESERVATIONS_PAGE_SIZE + 1),
+        'client pending proposals': db.select(PriceProposal.id).where(
+            PriceProposal.client_id == 1, PriceProposal.status == 'Pending'),
+        'open deplacement requests': db.select(DeplacementRequest.id).where(
+            DeplacementRequest.status == 'Pending', DeplacementRequest.target_coiffeur_id.is_(None)),
+        'deplacement inbox': db.select(DeplacementMatch.request_id).where(
+            DeplacementMatch.coiffeur_id == 1).order_by(DeplacementMatch.created_at.desc()).limit(DEPLACEMENT_INBOX_LIMIT),
+        'stylist search': search_query(['coupe', 'bra']),
+        'menu items': db.select(Menu.id).where(Menu.coiffeur_id == 1).order_by(Menu.name),
+        'subscribers': db.select(func.count()).where(Subscription.coiffeur_id == 1),
+    }
+
+def explain_query(conn, stmt):
+    """Returns the SQLite query plan of `stmt` as a list of detail strings."""
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={'render_postcompile': True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    return [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params)]
+
+def full_scans(plan):
+    """Plan steps that read a whole table instead of searching an index."""
+    return [step for step in plan if step.startswith('SCAN ') and 'INDEX' not in step]
+
+@app.cli.command('explain-hot-queries')
+def explain_hot_queries_command():
+    """Fails (exit 1) if a hot query does a full table scan. SQLite only."""
+    if db.engine.dialect.name != 'sqlite':
+        raise SystemExit('explain-hot-queries runs against SQLite (set DATABASE_URL=sqlite:///...)')
+    failures = 0
+    with db.engine.connect() as conn:
+        for name, stmt in hot_queries().items():
+            plan = explain_query(conn, stmt)
+            scans = full_scans(plan)
+            failures += bool(scans)
+            print(f"{'FULL SCAN' if scans else 'ok':9}  {name}: {' | '.join(plan)}")
+    if failures:
+        raise SystemExit(1)
+
+# --- Background Job Queues ---
+# The email outbox and image jobs are tables polled by worker commands. Rows
+# carry status, attempts and next_attempt_at; a worker claims due rows with a
+# conditional UPDATE so concurrent workers never process the same row.
+QUEUE_RETRY_BASE_SECONDS = 30
+QUEUE_RETRY_MAX_SECONDS = 3600
+# A claimed row not finished within this window (worker crashed) becomes due again
+QUEUE_CLAIM_LEASE_SECONDS = 300
+
+def warn_unexported_metrics():
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        print("PROMETHEUS_MULTIPROC_DIR is not set: this worker's metrics will not reach /metrics")
+
+def claim_due_rows(model, batch_size, working_status):
+    """Claims up to batch_size due rows of `model`, moving them to working_status."""
+    now = datetime.utcnow()
+    due = db.session.query(model.id, model.status).filter(
+        model.status.in_(('pending', working_status)),
+        model.next_attempt_at <= now
+    ).order_by(model.next_attempt_at).limit(batch_size).all()
+
+    lease_until = now + timedelta(seconds=QUEUE_CLAIM_LEASE_SECONDS)
+    claimed = []
+    for row_id, status in due:
+        won = model.query.filter(
+            model.id == row_id,
+            model.status == status,
+            model.next_attempt_at <= now
+        ).update({'status': working_status, 'next_attempt_at': lease_until}, synchronize_session=False)
+        if won:
+            claimed.append(row_id)
+    db.session.commit()
+    return model.query.filter(model.id.in_(claimed)).all() if claimed else []
+
+def schedule_retry(row, error, max_attempts):
+    """Reschedules a failed row with exponential backoff, or marks it failed."""
+    row.attempts += 1
+    row.last_error = str(error)[:1000]
+    if row.attempts >= max_attempts:
+        row.status = 'failed'
+        BACKGROUND_JOBS.labels(row.__tablename__, 'failed').inc()
+        print(f"ERROR: {row.__tablename__} {row.id} FAILED PERMANENTLY ({error})")
+    else:
+        BACKGROUND_JOBS.labels(row.__tablename__, 'retried').inc()
+        delay = min(QUEUE_RETRY_BASE_SECONDS * 2 ** (row.attempts - 1), QUEUE_RETRY_MAX_SECONDS)
+        row.status = 'pending'
+        row.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+
+# --- Email Outbox Delivery ---
+EMAIL_BATCH_SIZE = 50
+EMAIL_MAX_ATTEMPTS = 6
+
+def deliver_outbox(batch_size=EMAIL_BATCH_SIZE):
+    """
+    Sends one batch of due emails over a single SMTP connection.
+    Returns (sent, retried) counts.
+    """
+    emails = claim_due_rows(EmailOutbox, batch_size, 'sending')
+    if not emails:
+        return 0, 0
+
+    sent = 0
+    retried = 0
+    try:
+        with mail.connect() as conn:
+            for email in emails:
+                msg = Message(email.subject, recipients=[email.recipient], sender=app.config['MAIL_DEFAULT_SENDER'])
+                msg.body = email.body
+                try:
+                    conn.send(msg)
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                    # Rejected message (bad recipient...): the connection is still usable
+                    EMAIL_SEND_ERRORS.labels('rejected').inc()
+                    schedule_retry(email, e, EMAIL_MAX_ATTEMPTS)
+                    retried += 1
+                    continue
+                email.status = 'sent'
+                email.sent_at = datetime.utcnow()
+                email.attempts += 1
+                sent += 1
+                EMAILS_SENT.inc()
+                BACKGROUND_JOBS.labels(EmailOutbox.__tablename__, 'done').inc()
+    except Exception as e:
+        # Connection level failure: everything not sent yet is retried later
+        EMAIL_SEND_ERRORS.labels('connection').inc()
+        for email in emails:
+            if email.status == 'sending':
+                schedule_retry(email, e, EMAIL_MAX_ATTEMPTS)
+                retried += 1
+    db.session.commit()
+    return sent, retried
+
+@app.cli.command('deliver-emails')
+@click.option('--once', is_flag=True, help='Deliver one batch and exit.')
+@click.option('--interval', default=5.0, show_default=True, help='Seconds between polls when idle.')
+@click.option('--batch-size', default=EMAIL_BATCH_SIZE, show_default=True)
+def deliver_emails_command(once, interval, batch_size):
+    """Drains the email outbox (run as a separate worker process)."""
+    warn_unexported_metrics()
+    while True:
+        sent, retried = deliver_outbox(batch_size)
+        if sent or retried:
+            print(f"Outbox: {sent} sent, {retried} scheduled for retry")
+        if once:
+            break
+        if sent + retried < batch_size:
+            time.sleep(interval)
+
+def process_image_jobs(batch_size=IMAGE_JOB_BATCH_SIZE):
+    """Processes one batch of image jobs. Returns (done, retried) counts."""
+    done = 0
+    retried = 0
+    for job in claim_due_rows(ImageJob, batch_size, 'processing'):
+        try:
+            process_image_job(job)
+            done += 1
+            BACKGROUND_JOBS.labels(ImageJob.__tablename__, 'done').inc()
+        except Exception as e:
+            schedule_retry(job, e, IMAGE_JOB_MAX_ATTEMPTS)
+            retried += 1
+        db.session.commit()
+    return done, retried
+
+@app.cli.command('process-images')
+@click.option('--once', is_flag=True, help='Process one batch and exit.')
+@click.option('--interval', default=5.0, show_default=True, help='Seconds between polls when idle.')
+@click.option('--batch-size', default=IMAGE_JOB_BATCH_SIZE, show_default=True)
+def process_images_command(once, interval, batch_size):
+    """Generates thumb/card/full WebP variants of uploaded images."""
+    warn_unexported_metrics()
+    while True:
+        done, retried = process_image_jobs(batch_size)
+        if done or retried:
+            print(f"Images: {done} job(s) done, {retried} scheduled for retry")
+        if once:
+            break
+        if done + retried < batch_size:
+            time.sleep(interval)
+
+# --- Counter Reconciliation ---
+def counter_repairs():
+    """
+    (table label, model, counter column, true count subquery) for every
+    denormalized counter. The subqueries are correlated on the owning row.
+    """
+    return [
+        ('publications.likes_count', Publication, Publication.likes_count,
+         db.select(func.count()).where(PublicationLike.publication_id == Publication.id).scalar_subquery()),
+        ('publications.comments_count', Publication, Publication.comments_count,
+         db.select(func.count()).where(PublicationComment.publication_id == Publication.id).scalar_subquery()),
+        ('coiffeurs.subscriber_count', Coiffeur, Coiffeur.subscriber_count,
+         db.select(func.count()).where(Subscription.coiffeur_id == Coiffeur.user_id).scalar_subquery()),
+    ]
+
+def reconcile_counters():
+    """
+    Recomputes every denormalized counter in bulk and rewrites only the rows
+    that drifted. Returns {counter: repaired row count}.
+    """
+    repaired = {}
+    for label, model, column, true_count in counter_repairs():
+        result = db.session.execute(
+            db.update(model).where(column != true_count).values({column: true_count}),
+            execution_options={'synchronize_session': False}
+        )
+        repaired[label] = result.rowcount
+    db.session.commit()
+    stylist_profile_cache.clear()
+    return repaired
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Repairs drift in like, comment and subscriber counters (run from cron)."""
+    for label, count in reconcile_counters().items():
+        print(f"{label}: {count} row(s) repaired")
+
+# --- Déplacement Matching ---
+# A new déplacement request is offered to the active mobile stylists whose
+# service radius covers the client, found through the geohash index like
+# /api/coiffeurs/nearby. Each pairing is stored in deplacement_inbox, which the
+# stylist dashboard reads instead of scanning every pending request. A stylist
+# whose radius, category, status or position changes is matched again against
+# the pending requests, in the transaction writing the change (ORM flush or
+# location buffer flush). `flask match-deplacements` rebuilds every pending
+# request's inbox (after imports, or to repair them).
+DEPLACEMENT_CATEGORY = 'Déplacé'
+DEPLACEMENT_MAX_RADIUS_KM = 50
+DEPLACEMENT_INBOX_LIMIT = 50
+DEPLACEMENT_MATCH_CHUNK = 1000
+
+def mobile_stylists_near(lat, lng):
+    """(stylist_id, distance_km) of the active mobile stylists whose radius covers (lat, lng)."""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lng, DEPLACEMENT_MAX_RADIUS_KM)
+    cells = geohash_cells_for_box(min_lat, max_lat, min_lon, max_lon)
+    query = db.session.query(
+        Coiffeur.user_id, Coiffeur.latitude, Coiffeur.longitude, Coiffeur.service_radius_km
+    ).filter(
+        Coiffeur.status == 'active',
+        Coiffeur.category == DEPLACEMENT_CATEGORY,
+        Coiffeur.latitude.between(min_lat, max_lat),
+        Coiffeur.longitude.between(min_lon, max_lon)
+    )
+    if cells:
+        query = query.filter(or_(*[
+            and_(Coiffeur.geohash >= cell, Coiffeur.geohash < cell + '~') for cell in cells
+        ]))
+    # Mobile stylists are the ones whose latest fix may still be buffered
+    _, positions = location_buffer.positions()
+    matches = []
+    for stylist_id, stylist_lat, stylist_lng, radius in query.all():
+        stylist_lat, stylist_lng = positions.get(stylist_id, (stylist_lat, stylist_lng))
+        dist = haversine(lat, lng, stylist_lat, stylist_lng)
+        if dist <= min(radius or 0, DEPLACEMENT_MAX_RADIUS_KM):
+            matches.append((stylist_id, round(dist, 2)))
+    return matches
+
+def match_deplacement_request(req):
+    """Adds `req` to the inbox of the stylists it is offered to. Returns their number."""
+    if req.target_coiffeur_id:
+        target = db.session.get(Coiffeur, req.target_coiffeur_id)
+        dist = None
+        if None not in (req.latitude, req.longitude, target.latitude, target.longitude):
+            dist = round(haversine(req.latitude, req.longitude, target.latitude, target.longitude), 2)
+        matches = [(target.user_id, dist)]
+    elif req.latitude is None or req.longitude is None:
+        return 0
+    else:
+        matches = mobile_stylists_near(req.latitude, req.longitude)
+    db.session.add_all([
+        DeplacementMatch(request_id=req.id, coiffeur_id=stylist_id, distance_km=dist)
+        for stylist_id, dist in matches
+    ])
+    return len(matches)
+
+# Coiffeur columns deciding which open requests a stylist is offered
+DEPLACEMENT_MATCH_FIELDS = ('service_radius_km', 'category', 'status', 'latitude', 'longitude')
+
+def rematch_stylists(conn, stylist_ids):
+    """
+    Replaces the open (untargeted) pending requests in the inboxes of
+    `stylist_ids` by the ones their radius now covers, on `conn`. Returns the
+    number of entries written.
+    """
+    if not stylist_ids:
+        return 0
+    ids = sorted(stylist_ids)
+    inbox = DeplacementMatch.__table__
+    open_requests = db.select(DeplacementRequest.id).where(
+        DeplacementRequest.status == 'Pending', DeplacementRequest.target_coiffeur_id.is_(None))
+    conn.execute(inbox.delete().where(inbox.c.coiffeur_id.in_(ids), inbox.c.request_id.in_(open_requests)))
+
+    stylists = conn.execute(db.select(
+        Coiffeur.user_id, Coiffeur.latitude, Coiffeur.longitude, Coiffeur.service_radius_km
+    ).where(
+        Coiffeur.user_id.in_(ids), Coiffeur.status == 'active', Coiffeur.category == DEPLACEMENT_CATEGORY,
+        Coiffeur.latitude.is_not(None), Coiffeur.longitude.is_not(None)
+    )).all()
+    if not stylists:
+        return 0
+    _, buffered = location_buffer.positions()
+    positions = [buffered.get(row[0], (row[1], row[2])) for row in stylists]
+    stylist_lat = np.array([p[0] for p in positions], dtype=np.float64)
+    stylist_lng = np.array([p[1] for p in positions], dtype=np.float64)
+    radius = np.minimum(np.array([row[3] or 0 for row in stylists], dtype=np.float64), DEPLACEMENT_MAX_RADIUS_KM)
+
+    # Requests inside the bounding boxes of all the stylists, then exact distances
+    boxes = [bounding_box(lat, lng, DEPLACEMENT_MAX_RADIUS_KM) for lat, lng in positions]
+    requests = conn.execute(db.select(
+        DeplacementRequest.id, DeplacementRequest.latitude, DeplacementRequest.longitude, DeplacementRequest.created_at
+    ).where(
+        DeplacementRequest.status == 'Pending', DeplacementRequest.target_coiffeur_id.is_(None),
+        DeplacementRequest.latitude.between(min(b[0] for b in boxes), max(b[1] for b in boxes)),
+        DeplacementRequest.longitude.between(min(b[2] for b in boxes), max(b[3] for b in boxes))
+    )).all()
+    entries = []
+    for start in range(0, len(requests), DEPLACEMENT_MATCH_CHUNK):
+        chunk = requests[start:start + DEPLACEMENT_MATCH_CHUNK]
+        req_lat = np.array([r[1] for r in chunk], dtype=np.float64)[:, None]
+        req_lng = np.array([r[2] for r in chunk], dtype=np.float64)[:, None]
+        dist = haversine_np(req_lat, req_lng, stylist_lat[None, :], stylist_lng[None, :])
+        for i, j in zip(*np.nonzero(dist <= radius[None, :])):
+            entries.append({
+                'request_id': chunk[i][0], 'coiffeur_id': stylists[j][0],
+                'distance_km': round(float(dist[i, j]), 2), 'created_at': chunk[i][3],
+            })
+    for start in range(0, len(entries), DEPLACEMENT_MATCH_CHUNK):
+        conn.execute(inbox.insert(), entries[start:start + DEPLACEMENT_MATCH_CHUNK])
+    return len(entries)
+
+@event.listens_for(db.session, 'after_flush')
+def _rematch_changed_stylists(session, flush_context):
+    # Same transaction as the change, like _update_search_index
+    ids = set()
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Coiffeur):
+            continue
+        if obj in session.dirty:
+            attrs = inspect(obj).attrs
+            if not any(attrs[field].history.has_changes() for field in DEPLACEMENT_MATCH_FIELDS):
+                continue
+        ids.add(obj.user_id)
+    if ids:
+        rematch_stylists(session.connection(), ids)
+
+def geocode_pending_requests():
+    """Geocodes pending requests stored without coordinates. Returns how many were located."""
+    located = 0
+    for req in DeplacementRequest.query.filter(
+        DeplacementRequest.status == 'Pending', DeplacementRequest.latitude.is_(None)
+    ):
+        position = geocode_place(req.client_location)
+        if position:
+            req.latitude, req.longitude = position
+            located += 1
+    db.session.commit()
+    return located
+
+def rebuild_deplacement_inbox():
+    """
+    Recomputes the inbox of every pending request in one transaction, with the
+    distances computed as request x stylist matrices. Returns the number of entries.
+    """
+    stylists = db.session.query(
+        Coiffeur.user_id, Coiffeur.latitude, Coiffeur.longitude, Coiffeur.service_radius_km
+    ).filter(
+        Coiffeur.status == 'active', Coiffeur.category == DEPLACEMENT_CATEGORY,
+        Coiffeur.latitude.is_not(None), Coiffeur.longitude.is_not(None)
+    ).all()
+    requests = db.session.query(
+        DeplacementRequest.id, DeplacementRequest.target_coiffeur_id,
+        DeplacementRequest.latitude, DeplacementRequest.longitude, DeplacementRequest.created_at
+    ).filter(DeplacementRequest.status == 'Pending').all()
+    # Ends the read transaction before writing on another connection
+    db.session.commit()
+
+    positions = {row[0]: (row[1], row[2]) for row in stylists}
+    positions.update(location_buffer.positions()[1])
+    stylist_ids = np.array([row[0] for row in stylists], dtype=np.int64)
+    stylist_lat = np.array([positions[row[0]][0] for row in stylists], dtype=np.float64)
+    stylist_lng = np.array([positions[row[0]][1] for row in stylists], dtype=np.float64)
+    radius = np.minimum(np.array([row[3] or 0 for row in stylists], dtype=np.float64), DEPLACEMENT_MAX_RADIUS_KM)
+
+    entries = []
+    for req_id, target, lat, lng, created_at in requests:
+        if target:
+            dist = None
+            if lat is not None and lng is not None and target in positions:
+                dist = round(haversine(lat, lng, *positions[target]), 2)
+            entries.append({'request_id': req_id, 'coiffeur_id': target, 'distance_km': dist, 'created_at': created_at})
+    open_requests = [r for r in requests if not r[1] and r[2] is not None and r[3] is not None]
+    for start in range(0, len(open_requests) if len(stylist_ids) else 0, DEPLACEMENT_MATCH_CHUNK):
+        chunk = open_requests[start:start + DEPLACEMENT_MATCH_CHUNK]
+        req_lat = np.array([r[2] for r in chunk], dtype=np.float64)[:, None]
+        req_lng = np.array([r[3] for r in chunk], dtype=np.float64)[:, None]
+        dist = haversine_np(req_lat, req_lng, stylist_lat[None, :], stylist_lng[None, :])
+        for i, j in zip(*np.nonzero(dist <= radius[None, :])):
+            entries.append({
+                'request_id': chunk[i][0], 'coiffeur_id': int(stylist_ids[j]),
+                'distance_km': round(float(dist[i, j]), 2), 'created_at': chunk[i][4],
+            })
+
+    inbox = DeplacementMatch.__table__
+    request_ids = [r[0] for r in requests]
+    with db.engine.begin() as conn:
+        # Only the requests read above: the inboxes of requests created since
+        # (matched by match_deplacement_request) are left alone
+        for start in range(0, len(request_ids), DEPLACEMENT_MATCH_CHUNK):
+            conn.execute(inbox.delete().where(inbox.c.request_id.in_(request_ids[start:start + DEPLACEMENT_MATCH_CHUNK])))
+        for start in range(0, len(entries), DEPLACEMENT_MATCH_CHUNK):
+            conn.execute(inbox.insert(), entries[start:start + DEPLACEMENT_MATCH_CHUNK])
+        # Requests answered or cancelled meanwhile leave every inbox
+        conn.execute(inbox.delete().where(inbox.c.request_id.in_(
+            db.select(DeplacementRequest.id).where(DeplacementRequest.status != 'Pending'))))
+    return len(entries)
+
+@app.cli.command('match-deplacements')
+def match_deplacements_command():
+    """Geocodes pending déplacement requests and rebuilds every stylist inbox."""
+    print(f"{geocode_pending_requests()} request(s) geocoded")
+    print(f"{rebuild_deplacement_inbox()} inbox entries")
+
+# --- Availability ---
+# Bookable slots are the stylist's working hours minus the time taken by
+# pending and confirmed reservations (each lasting its service's duration).
+# Per day, free time is kept as sorted disjoint intervals, so checking a slot is
+# a binary search whatever the number of bookings. Times are minutes since
+# midnight, salon local time (SALON_TIMEZONE), like the date/time columns of
+# reservations, whatever the server's own timezone.
+SLOT_STEP_MINUTES = 30
+SLOT_DEFAULT_DURATION = 30  # reservations without a service
+AVAILABILITY_DEFAULT_DAYS = 7
+AVAILABILITY_MAX_DAYS = 31
+# Reservations in these states hold their slot
+RESERVATION_BLOCKING_STATUSES = ('Pending', 'Confirmed')
+# Used for stylists who have not set their hours: Monday to Saturday, 09:00-19:00
+DEFAULT_WORKING_HOURS = {weekday: [(9 * 60, 19 * 60)] for weekday in range(6)}
+
+def salon_now():
+    """Current salon wall-clock time, naive like the reservation date/time columns."""
+    return datetime.now(ZoneInfo(app.config.get('SALON_TIMEZONE', 'Africa/Casablanca'))).replace(tzinfo=None)
+
+class IntervalSet:
+    """Sorted, disjoint, half-open [start, end) intervals with bisect lookups."""
+
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.ends = []
+        for start, end in intervals:
+            self.add(start, end)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def add(self, start, end):
+        """Adds [start, end), merging it with the intervals it overlaps or touches."""
+        if start >= end:
+            return
+        lo = bisect.bisect_left(self.ends, start)
+        hi = bisect.bisect_right(self.starts, end)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+
+    def remove(self, start, end):
+        """Removes [start, end), splitting the intervals it falls into."""
+        if start >= end:
+            return
+        lo = bisect.bisect_right(self.ends, start)
+        hi = bisect.bisect_left(self.starts, end)
+        if lo >= hi:
+            return
+        pieces = []
+        if self.starts[lo] < start:
+            pieces.append((self.starts[lo], start))
+        if self.ends[hi - 1] > end:
+            pieces.append((end, self.ends[hi - 1]))
+        self.starts[lo:hi] = [p[0] for p in pieces]
+        self.ends[lo:hi] = [p[1] for p in pieces]
+
+    def covers(self, start, end):
+        """True if [start, end) lies inside a single interval."""
+        i = bisect.bisect_right(self.starts, start) - 1
+        return i >= 0 and self.ends[i] >= end
+
+def minutes_of(t):
+    return t.hour * 60 + t.minute
+
+def working_hours_for(coiffeur_id):
+    """
+    {weekday: [(opens, closes), ...]} in minutes. DEFAULT_WORKING_HOURS if the
+    stylist never set their hours, {} (always closed) if they saved none.
+    """
+    hours = {}
+    for row in WorkingHours.query.filter_by(coiffeur_id=coiffeur_id):
+        hours.setdefault(row.weekday, []).append((minutes_of(row.opens_at), minutes_of(row.closes_at)))
+    if hours:
+        return hours
+    hours_set = db.session.query(Coiffeur.working_hours_set).filter(Coiffeur.user_id == coiffeur_id).scalar()
+    return {} if hours_set else DEFAULT_WORKING_HOURS
+
+def busy_intervals(coiffeur_id, first_day, last_day):
+    """{date: IntervalSet} of the time held by reservations between the two days."""
+    rows = db.session.query(Reservation.date, Reservation.time, Service.duration_minutes).outerjoin(
+        Service, Reservation.service_id == Service.id
+    ).filter(
+        Reservation.coiffeur_id == coiffeur_id,
+        Reservation.date.between(first_day, last_day),
+        Reservation.status.in_(RESERVATION_BLOCKING_STATUSES)
+    ).all()
+    busy = {}
+    for day, start_time, duration in rows:
+        start = minutes_of(start_time)
+        busy.setdefault(day, IntervalSet()).add(start, start + (duration or SLOT_DEFAULT_DURATION))
+    return busy
+
+def compute_availability(coiffeur_id, first_day, days, duration, now=None):
+    """
+    Returns [(date, [slot start minutes, ...]), ...] for `days` days: every
+    SLOT_STEP_MINUTES step of the working hours where `duration` minutes are free.
+    """
+    now = now or salon_now()
+    last_day = first_day + timedelta(days=days - 1)
+    hours = working_hours_for(coiffeur_id)
+    busy = busy_intervals(coiffeur_id, first_day, last_day)
+    result = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        opening = IntervalSet(hours.get(day.weekday(), ()))
+        free = IntervalSet(opening)
+        for start, end in busy.get(day, ()):
+            free.remove(start, end)
+        # Slots already started today are not offered
+        earliest = minutes_of(now) if day == now.date() else 0
+        slots = []
+        for opens, closes in opening:
+            for start in range(opens, closes - duration + 1, SLOT_STEP_MINUTES):
+                if start >= earliest and free.covers(start, start + duration):
+                    slots.append(start)
+        result.append((day, slots))
+    return result
+
+# --- Booking ---
+# A reservation claims every SLOT_STEP_MINUTES cell it overlaps in slot_claims,
+# in the same transaction as its insert. Two bookings that overlap (same start,
+# or a long service running into the next one) collide on a primary key, so
+# exactly one commits and the others get a 409. Bookings of other stylists or
+# other times of the day never wait on each other.
+class SlotUnavailable(Exception):
+    pass
+
+def slot_cells(start, duration):
+    """Start minutes of the grid cells overlapped by [start, start + duration)."""
+    return range(start - start % SLOT_STEP_MINUTES, start + duration, SLOT_STEP_MINUTES)
+
+def book_reservation(client_id, coiffeur_id, day, start_time, service_id=None, notes=None, now=None):
+    """
+    Inserts a Pending reservation and its slot claims and commits. Raises
+    SlotUnavailable if any of its cells is already held, ValueError on bad input
+    or on a slot compute_availability would not offer (closed, off the grid, past).
+    """
+    duration = SLOT_DEFAULT_DURATION
+    if service_id is not None:
+        service = Service.query.filter_by(id=service_id, coiffeur_id=coiffeur_id).first()
+        if service is None:
+            raise ValueError('Unknown service for this stylist')
+        duration = service.duration_minutes or SLOT_DEFAULT_DURATION
+    start = minutes_of(start_time)
+    cells = list(slot_cells(start, duration))
+    if start + duration > 24 * 60:
+        raise ValueError('Reservation must end the same day')
+    now = now or salon_now()
+    if day < now.date() or (day == now.date() and start < minutes_of(now)):
+        raise ValueError('This slot is in the past')
+    if not any(opens <= start and start + duration <= closes and (start - opens) % SLOT_STEP_MINUTES == 0
+               for opens, closes in working_hours_for(coiffeur_id).get(day.weekday(), ())):
+        raise ValueError('The salon is not open for this slot')
+
+    # Cheap indexed read first: under contention most requests for a taken slot
+    # leave here without opening a write transaction
+    taken = db.session.query(SlotClaim.slot).filter(
+        SlotClaim.coiffeur_id == coiffeur_id, SlotClaim.date == day, SlotClaim.slot.in_(cells)
+    ).first()
+    if taken is not None:
+        raise SlotUnavailable()
+
+    reservation = Reservation(client_id=client_id, coiffeur_id=coiffeur_id, service_id=service_id,
+                              date=day, time=start_time, notes=notes, status='Pending')
+    db.session.add(reservation)
+    try:
+        db.session.flush()
+        db.session.execute(SlotClaim.__table__.insert(), [
+            {'coiffeur_id': coiffeur_id, 'date': day, 'slot': cell, 'reservation_id': reservation.id} for cell in cells
+        ])
+        db.session.commit()
+    except IntegrityError:
+        # Claimed by a concurrent booking between the check and the insert
+        db.session.rollback()
+        raise SlotUnavailable()
+    return reservation
+
+def claim_existing_reservations():
+    """
+    Creates the slot claims of blocking reservations made before slot_claims
+    existed. Of overlapping reservations, the oldest keeps the slot. Returns the
+    number of claims added. Runs on its own connection, outside the session.
+    """
+    with db.engine.begin() as conn:
+        claimed = set(conn.execute(db.select(SlotClaim.coiffeur_id, SlotClaim.date, SlotClaim.slot)).tuples())
+        has_claims = set(conn.execute(db.select(SlotClaim.reservation_id).distinct()).scalars())
+        rows = conn.execute(db.select(
+            Reservation.id, Reservation.coiffeur_id, Reservation.date, Reservation.time, Service.duration_minutes
+        ).outerjoin(Service, Reservation.service_id == Service.id).where(
+            Reservation.status.in_(RESERVATION_BLOCKING_STATUSES)
+        ).order_by(Reservation.id)).all()
+        claims = []
+        for reservation_id, coiffeur_id, day, start_time, duration in rows:
+            if reservation_id in has_claims:
+                continue
+            keys = [(coiffeur_id, day, cell) for cell in slot_cells(minutes_of(start_time), duration or SLOT_DEFAULT_DURATION)]
+            if any(key in claimed for key in keys):
+                continue
+            claimed.update(keys)
+            claims.extend({'coiffeur_id': c, 'date': d, 'slot': cell, 'reservation_id': reservation_id} for c, d, cell in keys)
+        for start in range(0, len(claims), SYNTHETIC_CHUNK_SIZE):
+            conn.execute(SlotClaim.__table__.insert(), claims[start:start + SYNTHETIC_CHUNK_SIZE])
+    return len(claims)
+
+# --- Full-Text Search ---
+# /api/search matches words against an index of each active stylist's name,
+# services, menu and description: an FTS5 table on SQLite, a weighted tsvector
+# with a GIN index on PostgreSQL. Text is folded with normalize_place() on both
+# sides, so "Soin keratine" finds "Soin kératine". The rows of the stylists a
+# flush touched are rebuilt in that flush's transaction; bulk loads call
+# rebuild_search_index(). Other databases fall back to unranked LIKE matching.
+SEARCH_TABLE = 'stylist_search'
+SEARCH_MAX_TERMS = 8
+SEARCH_DEFAULT_LIMIT = 24
+SEARCH_MAX_LIMIT = 100
+# Best matches ranked by text, then re-ranked by distance and paginated in Python
+SEARCH_MAX_CANDIDATES = 500
+# A stylist this far away scores half of an equal match next door
+SEARCH_DISTANCE_SCALE_KM = 5.0
+SEARCH_INDEX_CHUNK = 500
+# Column weights: name, services, menus, description (bm25 / tsvector A-D)
+SEARCH_WEIGHTS = (10.0, 4.0, 2.0, 1.0)
+# Searchable attributes per model, and the stylist each row belongs to
+SEARCH_FIELDS = {
+    Coiffeur: (('description', 'status'), lambda obj: obj.user_id),
+    User: (('name',), lambda obj: obj.id if obj.type == 'coiffeur' else None),
+    Service: (('service_name', 'coiffeur_id'), lambda obj: obj.coiffeur_id),
+    Menu: (('name', 'description', 'coiffeur_id'), lambda obj: obj.coiffeur_id),
+}
+
+def search_dialect(bind=None):
+    """'sqlite', 'postgresql', or None when the database has no full-text index here."""
+    name = (bind or db.engine).dialect.name
+    return name if name in ('sqlite', 'postgresql') else None
+
+# Per database URL: whether the index exists. Checked once per process; until
+# `flask upgrade-db` creates it, writes skip it and /api/search uses LIKE.
+_search_index_ready = {}
+
+def search_index_ready(bind=None):
+    bind = bind or db.engine
+    key = str(bind.engine.url)
+    if key not in _search_index_ready:
+        _search_index_ready[key] = search_dialect(bind) is not None and inspect(bind).has_table(SEARCH_TABLE)
+    return _search_index_ready[key]
+
+def create_search_index(conn):
+    """Creates the index if missing. Returns True if it was created (and needs a rebuild)."""
+    dialect = search_dialect(conn)
+    if dialect is None or inspect(conn).has_table(SEARCH_TABLE):
+        return False
+    if dialect == 'sqlite':
+        # rowid is the stylist id; prefix indexes keep short prefix queries cheap
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(name, services, menus, description, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        ))
+    else:
+        conn.execute(text(
+            f"CREATE TABLE {SEARCH_TABLE} (coiffeur_id INTEGER PRIMARY KEY "
+            "REFERENCES coiffeurs (user_id) ON DELETE CASCADE, document TSVECTOR NOT NULL)"
+        ))
+        conn.execute(text(f"CREATE INDEX ix_{SEARCH_TABLE}_document ON {SEARCH_TABLE} USING GIN (document)"))
+    return True
+
+def search_documents(conn, coiffeur_ids):
+    """{id: (name, services, menus, description)} of the active stylists among `coiffeur_ids`, normalized."""
+    docs = {}
+    for uid, name, description in conn.execute(
+        db.select(User.id, User.name, Coiffeur.description).join(Coiffeur, User.id == Coiffeur.user_id).where(
+            User.id.in_(coiffeur_ids), Coiffeur.status == 'active')
+    ):
+        docs[uid] = [name or '', [], [], description or '']
+    for coiffeur_id, service_name in conn.execute(
+        db.select(Service.coiffeur_id, Service.service_name).where(Service.coiffeur_id.in_(list(docs)))
+    ):
+        docs[coiffeur_id][1].append(service_name or '')
+    for coiffeur_id, name, description in conn.execute(
+        db.select(Menu.coiffeur_id, Menu.name, Menu.description).where(Menu.coiffeur_id.in_(list(docs)))
+    ):
+        docs[coiffeur_id][2].append(f"{name or ''} {description or ''}")
+    return {uid: (normalize_place(name), normalize_place(' '.join(services)), normalize_place(' '.join(menus)),
+                  normalize_place(description))
+            for uid, (name, services, menus, description) in docs.items()}
+
+def index_stylists(conn, coiffeur_ids):
+    """Rewrites the index rows of `coiffeur_ids` (dropping inactive or deleted stylists)."""
+    dialect = search_dialect(conn)
+    if dialect is None or not coiffeur_ids:
+        return
+    key = 'rowid' if dialect == 'sqlite' else 'coiffeur_id'
+    ids = sorted(coiffeur_ids)
+    for start in range(0, len(ids), SEARCH_INDEX_CHUNK):
+        chunk = ids[start:start + SEARCH_INDEX_CHUNK]
+        conn.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE {key} IN ({','.join(str(int(i)) for i in chunk)})"))
+        rows = [{'id': uid, 'name': doc[0], 'services': doc[1], 'menus': doc[2], 'description': doc[3]}
+                for uid, doc in search_documents(conn, chunk).items()]
+        if not rows:
+            continue
+        if dialect == 'sqlite':
+            conn.execute(text(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, name, services, menus, description) "
+                "VALUES (:id, :name, :services, :menus, :description)"
+            ), rows)
+        else:
+            conn.execute(text(
+                f"INSERT INTO {SEARCH_TABLE} (coiffeur_id, document) VALUES (:id, "
+                "setweight(to_tsvector('simple', :name), 'A') || setweight(to_tsvector('simple', :services), 'B') || "
+                "setweight(to_tsvector('simple', :menus), 'C') || setweight(to_tsvector('simple', :description), 'D'))"
+            ), rows)
+
+def rebuild_search_index():
+    """Recreates the index rows of every active stylist. Returns the number indexed."""
+    if search_dialect() is None:
+        return 0
+    with db.engine.begin() as conn:
+        create_search_index(conn)
+        conn.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+        ids = [row[0] for row in conn.execute(db.select(Coiffeur.user_id).where(Coiffeur.status == 'active'))]
+        index_stylists(conn, ids)
+    _search_index_ready[str(db.engine.url)] = True
+    return len(ids)
+
+@event.listens_for(db.session, 'after_flush')
+def _update_search_index(session, flush_context):
+    # Same transaction as the change, like _record_live_events
+    ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        spec = SEARCH_FIELDS.get(type(obj))
+        if spec is None:
+            continue
+        fields, owner = spec
+        if obj in session.dirty:
+            attrs = inspect(obj).attrs
+            if not any(attrs[field].history.has_changes() for field in fields):
+                continue
+        uid = owner(obj)
+        if uid is not None:
+            ids.add(uid)
+    if ids and search_index_ready(session.connection()):
+        index_stylists(session.connection(), ids)
+
+def search_terms(q):
+    """Normalized words of a query, each later matched as a prefix."""
+    return normalize_place(q).split()[:SEARCH_MAX_TERMS]
+
+def search_query(terms, city=None, category=None):
+    """
+    Selects up to SEARCH_MAX_CANDIDATES matching active stylists, best text
+    match first: the card columns plus `score` (higher is better).
+    """
+    dialect = search_dialect() if search_index_ready() else None
+    if dialect == 'sqlite':
+        # Every term must match, as a prefix ("col" finds "coloration")
+        fts = sql_table(SEARCH_TABLE, sql_column('rowid'))
+        stylist_id = fts.c.rowid
+        score = -func.bm25(literal_column(SEARCH_TABLE), *SEARCH_WEIGHTS)
+        match = literal_column(SEARCH_TABLE).op('MATCH')(' '.join(f'"{term}"*' for term in terms))
+    elif dialect == 'postgresql':
+        fts = sql_table(SEARCH_TABLE, sql_column('coiffeur_id'), sql_column('document'))
+        stylist_id = fts.c.coiffeur_id
+        tsquery = func.to_tsquery('simple', ' & '.join(f'{term}:*' for term in terms))
+        weights = literal_column("'{%s}'::float4[]" % ','.join(str(w / SEARCH_WEIGHTS[0]) for w in reversed(SEARCH_WEIGHTS)))
+        score = func.ts_rank(weights, fts.c.document, tsquery)
+        match = fts.c.document.op('@@')(tsquery)
+    else:
+        fts, stylist_id = None, None
+        score = func.coalesce(Coiffeur.rating, 0)
+        match = and_(*[or_(User.name.ilike(f'%{term}%'), Coiffeur.description.ilike(f'%{term}%')) for term in terms])
+
+    stmt = db.select(
+        User.id, User.name, User.city, Coiffeur.category, Coiffeur.rating,
+        Coiffeur.profile_image, Coiffeur.profile_image_variants, Coiffeur.current_capacity,
+        Coiffeur.people_waiting, Coiffeur.latitude, Coiffeur.longitude, score.label('score')
+    )
+    if fts is not None:
+        stmt = stmt.select_from(fts).join(Coiffeur, Coiffeur.user_id == stylist_id)
+    else:
+        stmt = stmt.select_from(Coiffeur)
+    stmt = stmt.join(User, User.id == Coiffeur.user_id).where(match, Coiffeur.status == 'active')
+    if city:
+        stmt = stmt.where(User.city == city)
+    if category and category != 'all':
+        stmt = stmt.where(Coiffeur.category == category)
+    return stmt.order_by(score.desc(), User.id).limit(SEARCH_MAX_CANDIDATES)
+
+def search_stylists(q, lat=None, lng=None, city=None, category=None, after=None, limit=SEARCH_DEFAULT_LIMIT):
+    """
+    Returns (stylists, next_cursor): one page of stylist cards ordered by score,
+    then id. With lat/lng, scores are divided by 1 + distance / SEARCH_DISTANCE_SCALE_KM.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return [], None
+    rows = db.session.execute(search_query(terms, city, category)).all()
+    if not rows:
+        return [], None
+    scores = np.array([float(row.score or 0) for row in rows])
+    distances = None
+    if lat is not None and lng is not None:
+        lats = np.array([row.latitude if row.latitude is not None else np.nan for row in rows], dtype=np.float64)
+        lngs = np.array([row.longitude if row.longitude is not None else np.nan for row in rows], dtype=np.float64)
+        distances = haversine_np(lat, lng, lats, lngs)
+        # Stylists without a position get no boost rather than being dropped
+        scores = np.where(np.isnan(distances), scores / 2, scores / (1 + np.nan_to_num(distances) / SEARCH_DISTANCE_SCALE_KM))
+    ids = np.array([row.id for row in rows], dtype=np.int64)
+    order = np.lexsort((ids, -scores))
+    if after:
+        keep = (scores[order] < after[0]) | ((scores[order] == after[0]) & (ids[order] > after[1]))
+        order = order[keep]
+    page = order[:limit + 1]
+
+    stylists = []
+    for i in page[:limit]:
+        row = rows[i]
+        stylists.append({
+            'id': row.id,
+            'name': row.name,
+            'category': row.category,
+            'city': row.city,
+            'rating': row.rating,
+            'image': pick_image_variant(row.profile_image, row.profile_image_variants, 'thumb'),
+            'capacity': row.current_capacity,
+            'waiting': row.people_waiting,
+            'lat': row.latitude,
+            'lng': row.longitude,
+            'score': float(scores[i]),
+            'distance_km': None if distances is None or np.isnan(distances[i]) else round(float(distances[i]), 2),
+        })
+    next_cursor = None
+    if len(page) > limit:
+        next_cursor = encode_cursor([stylists[-1]['score'], stylists[-1]['id']])
+    return overlay_positions(stylists), next_cursor
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Reindexes every active stylist for /api/search."""
+    if search_dialect() is None:
+        print(f"No full-text index on {db.engine.dialect.name}; /api/search uses LIKE matching.")
+        return
+    print(f"{rebuild_search_index()} stylist(s) indexed")
+
+# --- Synthetic Data ---
+# Bulk generator for load testing (`flask generate-data`) and the demo data of
+# new databases. Rows are built with NumPy from a fixed seed (same seed and
+# volumes, same data) and written with chunked Core INSERTs using explicit ids,
+# so no ORM objects are created or flushed.
+SYNTHETIC_CITIES = [
+    # name, latitude, longitude, share of the users
+    ('Casablanca', 33.5731, -7.5898, 0.30),
+    ('Rabat', 34.0209, -6.8416, 0.14),
+    ('Marrakech', 31.6295, -7.9811, 0.13),
+    ('Fès', 34.0181, -5.0078, 0.10),
+    ('Tanger', 35.7595, -5.8340, 0.10),
+    ('Agadir', 30.4278, -9.5981, 0.07),
+    ('Meknès', 33.8935, -5.5473, 0.06),
+    ('Oujda', 34.6814, -1.9086, 0.04),
+    ('Kénitra', 34.2610, -6.5802, 0.03),
+    ('Tétouan', 35.5889, -5.3626, 0.03),
+]
+SYNTHETIC_DISTRICTS = ['Centre', 'Maârif', 'Agdal', 'Hay Riad', 'Gueliz', 'Médina', 'Bourgogne', 'Hay Salam']
+SYNTHETIC_CATEGORIES = (['Homme', 'Femme', 'Enfant', 'Déplacé'], [0.4, 0.4, 0.1, 0.1])
+SYNTHETIC_SERVICES = [
+    # name, price, duration in minutes
+    ('Coupe homme', 50, 30), ('Coupe femme', 120, 45), ('Brushing', 80, 30), ('Coloration', 250, 90),
+    ('Barbe', 30, 15), ('Lissage', 400, 120), ('Coupe enfant', 40, 30), ('Soin kératine', 350, 90),
+]
+SYNTHETIC_CITY_SPREAD_DEG = 0.04  # about 4 km around the city centre
+SYNTHETIC_CHUNK_SIZE = 10000
+# Default volumes of `flask generate-data` (and of benchmark.py at --scale 1)
+SYNTHETIC_VOLUMES = {
+    'coiffeurs': 10000,
+    'clients': 50000,
+    'publications': 100000,
+    'likes': 1000000,
+    'publication_comments': 300000,
+    'subscriptions': 200000,
+    'reviews': 50000,
+    'reservations': 200000,
+    'deplacement_requests': 20000,
+}
+# Loaded into an empty database on startup when SEED_DEMO_DATA is set
+DEMO_VOLUMES = {name: max(count // 250, 20) for name, count in SYNTHETIC_VOLUMES.items()}
+
+def _insert_chunks(table, rows, chunk_size=SYNTHETIC_CHUNK_SIZE):
+    """Inserts an iterable of row dicts, one transaction per chunk. Returns the row count."""
+    total = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            with db.engine.begin() as conn:
+                conn.execute(table.insert(), chunk)
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        with db.engine.begin() as conn:
+            conn.execute(table.insert(), chunk)
+        total += len(chunk)
+    return total
+
+def _next_id(column):
+    return (db.session.query(func.max(column)).scalar() or 0) + 1
+
+def _sync_id_sequences(*models):
+    """
+    Moves the PostgreSQL id sequences of `models` past the ids inserted
+    explicitly, so that later ORM inserts do not collide with them.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return
+    with db.engine.begin() as conn:
+        for model in models:
+            table = model.__tablename__
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) "
+                f"FROM {table}"
+            ))
+
+def _skewed_weights(rng, size):
+    """Pareto popularity: a long tail of quiet rows and a few very busy ones."""
+    weights = rng.pareto(1.2, size) + 1
+    return weights / weights.sum()
+
+def _unique_pairs(rng, left_size, right_size, count, left_p=None):
+    """Up to `count` distinct (left, right) index pairs, as two sorted arrays."""
+    left = rng.choice(left_size, size=count, p=left_p)
+    right = rng.integers(0, right_size, count)
+    keys = np.unique(left.astype(np.int64) * right_size + right)
+    return keys // right_size, keys % right_size
+
+def generate_dataset(volumes=None, seed=42, chunk_size=SYNTHETIC_CHUNK_SIZE, log=print):
+    """
+    Appends a synthetic dataset covering every model and returns the inserted
+    row counts per table. `volumes` overrides entries of SYNTHETIC_VOLUMES.
+    """
+    v = dict(SYNTHETIC_VOLUMES, **(volumes or {}))
+    rng = np.random.default_rng(seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    today = now.date()
+    counts = {}
+
+    def insert(model, rows):
+        started = time.perf_counter()
+        counts[model.__tablename__] = _insert_chunks(model.__table__, rows, chunk_size)
+        log(f"{model.__tablename__}: {counts[model.__tablename__]} rows in {time.perf_counter() - started:.1f}s")
+
+    def slot_time(slot):
+        # 30 minute slots from 09:00 to 19:30
+        minutes = 9 * 60 + 30 * int(slot)
+        return datetime.min.replace(hour=minutes // 60, minute=minutes % 60).time()
+
+    n_coiffeurs, n_clients = v['coiffeurs'], v['clients']
+    first_user = _next_id(User.id)
+    client_ids = np.arange(first_user, first_user + n_clients)
+    coiffeur_ids = np.arange(first_user + n_clients, first_user + n_clients + n_coiffeurs)
+
+    city_names, city_lats, city_lngs, city_shares = zip(*SYNTHETIC_CITIES)
+    city_p = np.array(city_shares) / sum(city_shares)
+    client_city = rng.choice(len(city_names), size=n_clients, p=city_p)
+    coiffeur_city = rng.choice(len(city_names), size=n_coiffeurs, p=city_p)
+    lat = np.array(city_lats)[coiffeur_city] + rng.normal(0, SYNTHETIC_CITY_SPREAD_DEG, n_coiffeurs)
+    lng = np.array(city_lngs)[coiffeur_city] + rng.normal(0, SYNTHETIC_CITY_SPREAD_DEG, n_coiffeurs)
+    popularity = _skewed_weights(rng, n_coiffeurs)
+
+    def user_rows():
+        for i, uid in enumerate(client_ids):
+            yield {
+                'id': int(uid), 'name': f"Client {uid}", 'email': f"client{uid}@example.com",
+                'password': 'password', 'type': 'client', 'city': city_names[client_city[i]],
+                'phone': f"06{uid % 100000000:08d}", 'is_confirmed': True,
+            }
+        for i, uid in enumerate(coiffeur_ids):
+            yield {
+                'id': int(uid), 'name': f"Salon {uid}", 'email': f"salon{uid}@example.com",
+                'password': 'password', 'type': 'coiffeur', 'city': city_names[coiffeur_city[i]],
+                'phone': f"07{uid % 100000000:08d}", 'is_confirmed': True,
+            }
+    insert(User, user_rows())
+
+    # Follows are drawn first so that subscriber_count is written with the stylist
+    sub_coiffeur, sub_client = _unique_pairs(rng, n_coiffeurs, n_clients, v['subscriptions'], popularity)
+    subscribers = np.bincount(sub_coiffeur, minlength=n_coiffeurs)
+    category = rng.choice(SYNTHETIC_CATEGORIES[0], size=n_coiffeurs, p=SYNTHETIC_CATEGORIES[1])
+    active = rng.random(n_coiffeurs) < 0.95
+    rating = np.round(rng.uniform(3.0, 5.0, n_coiffeurs), 1)
+    waiting = rng.poisson(2.0, n_coiffeurs)
+    capacity = rng.integers(1, 6, n_coiffeurs)
+    street = rng.integers(1, 200, n_coiffeurs)
+    district = rng.integers(0, len(SYNTHETIC_DISTRICTS), n_coiffeurs)
+
+    def coiffeur_rows():
+        for i, uid in enumerate(coiffeur_ids):
+            city = city_names[coiffeur_city[i]]
+            yield {
+                'user_id': int(uid), 'category': str(category[i]),
+                'description': f"Salon {uid}, {SYNTHETIC_DISTRICTS[district[i]]} ({city})",
+                'address': f"{street[i]} Rue {uid % 500}, {SYNTHETIC_DISTRICTS[district[i]]}, {city}",
+                'people_waiting': int(waiting[i]), 'current_capacity': int(capacity[i]),
+                'rating': float(rating[i]), 'subscriber_count': int(subscribers[i]),
+                'latitude': float(lat[i]), 'longitude': float(lng[i]),
+                'geohash': geohash_encode(float(lat[i]), float(lng[i])), 'location_updated_at': now,
+                'status': 'active' if active[i] else 'pending email confirmation',
+            }
+    insert(Coiffeur, coiffeur_rows())
+
+    # Services get explicit, contiguous ids per stylist so reservations can point at them
+    services_per = rng.integers(2, 6, n_coiffeurs)
+    service_start = _next_id(Service.id) + np.concatenate(([0], np.cumsum(services_per)[:-1]))
+    service_kind = rng.integers(0, len(SYNTHETIC_SERVICES), int(services_per.sum()))
+    price_factor = rng.uniform(0.8, 1.5, int(services_per.sum()))
+
+    def service_rows():
+        k = 0
+        for i, uid in enumerate(coiffeur_ids):
+            for j in range(services_per[i]):
+                name, price, duration = SYNTHETIC_SERVICES[service_kind[k]]
+                yield {'id': int(service_start[i] + j), 'coiffeur_id': int(uid), 'service_name': name,
+                       'price': round(price * price_factor[k]), 'duration_minutes': duration}
+                k += 1
+    insert(Service, service_rows())
+
+    menu_per = rng.integers(1, 4, n_coiffeurs)
+    menu_kind = rng.integers(0, len(SYNTHETIC_SERVICES), int(menu_per.sum()))
+
+    def menu_rows():
+        k = 0
+        for i, uid in enumerate(coiffeur_ids):
+            for _ in range(menu_per[i]):
+                name, price, _ = SYNTHETIC_SERVICES[menu_kind[k]]
+                yield {'coiffeur_id': int(uid), 'name': f"Forfait {name.lower()}", 'price': price * 2,
+                       'description': f"{name} + brushing", 'created_at': now}
+                k += 1
+    insert(Menu, menu_rows())
+
+    photos_per = rng.integers(0, 6, n_coiffeurs)
+    photo_likes = rng.poisson(15, int(photos_per.sum()))
+
+    def photo_rows():
+        k = 0
+        for i, uid in enumerate(coiffeur_ids):
+            for _ in range(photos_per[i]):
+                yield {'coiffeur_id': int(uid), 'image_path': '/static/uploads/default_coiffeur.png',
+                       'likes': int(photo_likes[k])}
+                k += 1
+    insert(Photo, photo_rows())
+
+    review_coiffeur = rng.choice(n_coiffeurs, size=v['reviews'], p=popularity)
+    review_client = rng.choice(client_ids, size=v['reviews'])
+    review_age = rng.integers(0, 365 * 24 * 3600, v['reviews'])
+
+    def review_rows():
+        for i in range(v['reviews']):
+            yield {'client_id': int(review_client[i]), 'coiffeur_id': int(coiffeur_ids[review_coiffeur[i]]),
+                   'comment': 'Très bon service, je recommande.',
+                   'timestamp': now - timedelta(seconds=int(review_age[i]))}
+    insert(Comment, review_rows())
+
+    n_pubs = v['publications']
+    first_pub = _next_id(Publication.id)
+    pub_author = rng.choice(coiffeur_ids, size=n_pubs, p=popularity)
+    pub_age = rng.integers(0, 365 * 24 * 3600, n_pubs)
+    pub_popularity = _skewed_weights(rng, n_pubs)
+    like_pub, like_client = _unique_pairs(rng, n_pubs, n_clients, v['likes'], pub_popularity)
+    comment_pub = rng.choice(n_pubs, size=v['publication_comments'], p=pub_popularity)
+    comment_client = rng.choice(client_ids, size=v['publication_comments'])
+    comment_delay = rng.integers(60, 7 * 24 * 3600, v['publication_comments'])
+    likes_per_pub = np.bincount(like_pub, minlength=n_pubs)
+    comments_per_pub = np.bincount(comment_pub, minlength=n_pubs)
+
+    def publication_rows():
+        for i in range(n_pubs):
+            yield {
+                'id': first_pub + i, 'author_id': int(pub_author[i]),
+                'text': f"Nouvelle coupe #{first_pub + i}", 'images': '[]',
+                'created_at': now - timedelta(seconds=int(pub_age[i])),
+                'likes_count': int(likes_per_pub[i]), 'comments_count': int(comments_per_pub[i]),
+            }
+    insert(Publication, publication_rows())
+
+    def like_rows():
+        for pub, client in zip(like_pub, like_client):
+            yield {'publication_id': first_pub + int(pub), 'client_id': int(client_ids[client])}
+    insert(PublicationLike, like_rows())
+
+    def publication_comment_rows():
+        for i in range(v['publication_comments']):
+            pub = int(comment_pub[i])
+            yield {
+                'publication_id': first_pub + pub, 'client_id': int(comment_client[i]),
+                'comment_text': 'Magnifique !',
+                'created_at': now - timedelta(seconds=max(int(pub_age[pub]) - int(comment_delay[i]), 0)),
+            }
+    insert(PublicationComment, publication_comment_rows())
+
+    def subscription_rows():
+        for coiffeur, client in zip(sub_coiffeur, sub_client):
+            yield {'client_id': int(client_ids[client]), 'coiffeur_id': int(coiffeur_ids[coiffeur]), 'subscribed_at': now}
+    insert(Subscription, subscription_rows())
+
+    n_res = v['reservations']
+    res_client = rng.choice(client_ids, size=n_res)
+    res_coiffeur = rng.choice(n_coiffeurs, size=n_res, p=popularity)
+    res_service = service_start[res_coiffeur] + (rng.random(n_res) * services_per[res_coiffeur]).astype(np.int64)
+    res_day = rng.integers(-60, 30, n_res)
+    res_slot = rng.integers(0, 22, n_res)
+    res_confirmed = rng.random(n_res) < 0.7
+    service_duration = np.array([duration for _, _, duration in SYNTHETIC_SERVICES])[service_kind]
+    res_duration = service_duration[res_service - service_start[0]]
 
-def get_coiffeur_data(coiffeur_id):
-    """Fetches all necessary data for a coiffeur profile."""
-    coiffeur = Coiffeur.query.options(joinedload(Coiffeur.user)).get(coiffeur_id)
-    
-    if coiffeur:
-        services = Service.query.filter_by(coiffeur_id=coiffeur_id).all()
-        menu_items = Menu.query.filter_by(coiffeur_id=coiffeur_id).order_by(Menu.name).all()
-        comments = Comment.query.filter_by(coiffeur_id=coiffeur_id).order_by(Comment.timestamp.desc()).all()
-        
-        current_user = get_current_user()
-        is_subscribed = False
-        if current_user and current_user.type == 'client':
-             is_subscribed = Subscription.query.filter_by(client_id=current_user.id, coiffeur_id=coiffeur_id).first() is not None
+    # Draws that overlap an earlier reservation of the same stylist are dropped,
+    # as the booking endpoints would have refused them
+    first_res = _next_id(Reservation.id)
+    reservations, claims, claimed = [], [], set()
+    for i in range(n_res):
+        coiffeur_id, day = int(coiffeur_ids[res_coiffeur[i]]), today + timedelta(days=int(res_day[i]))
+        keys = [(coiffeur_id, day, cell) for cell in slot_cells(9 * 60 + 30 * int(res_slot[i]), int(res_duration[i]))]
+        if any(key in claimed for key in keys):
+            continue
+        claimed.update(keys)
+        reservation_id = first_res + len(reservations)
+        reservations.append({
+            'id': reservation_id, 'client_id': int(res_client[i]), 'coiffeur_id': coiffeur_id,
+            'service_id': int(res_service[i]), 'date': day,
+            'time': slot_time(res_slot[i]), 'status': 'Confirmed' if res_confirmed[i] else 'Pending',
+        })
+        claims.extend({'coiffeur_id': c, 'date': d, 'slot': cell, 'reservation_id': reservation_id} for c, d, cell in keys)
+    insert(Reservation, reservations)
+    insert(SlotClaim, claims)
 
-        publications_raw = Publication.query.filter_by(author_id=coiffeur_id).order_by(Publication.created_at.desc()).all()
-        
-        publications = []
-        client_id = current_user.id if current_user and current_user.type == 'client' else None
-
-        for pub in publications_raw:
-            pub_data = {
-                'id': pub.id,
-                'author_id': pub.author_id,
-                'text': pub.text,
-                'images': pub.image_list(),
-                'created_at': pub.created_at,
-                'likes_count': pub.likes.count(),
-                'comments_count': pub.comments.count(),
-                'liked_by_user': False,
+    # Home visit requests, answered by the mobile ('Déplacé') stylists
+    n_req = v['deplacement_requests']
+    mobile = np.flatnonzero(category == 'Déplacé')
+    first_req = _next_id(DeplacementRequest.id)
+    req_client = rng.integers(0, n_clients, n_req)
+    req_service = rng.integers(0, len(SYNTHETIC_SERVICES), n_req)
+    req_day = rng.integers(1, 30, n_req)
+    req_slot = rng.integers(0, 22, n_req)
+    req_district = rng.integers(0, len(SYNTHETIC_DISTRICTS), n_req)
+    req_target = rng.random(n_req) < 0.2
+    proposals_per = rng.integers(0, 4, n_req) if len(mobile) else np.zeros(n_req, dtype=np.int64)
+    proposal_coiffeur = rng.choice(mobile, size=int(proposals_per.sum())) if len(mobile) else []
+    proposal_factor = rng.uniform(1.0, 2.0, int(proposals_per.sum()))
+
+    def request_rows():
+        for i in range(n_req):
+            location = f"{SYNTHETIC_DISTRICTS[req_district[i]]}, {city_names[client_city[req_client[i]]]}"
+            position = geocode_place(location)
+            yield {
+                'id': first_req + i, 'client_id': int(client_ids[req_client[i]]),
+                'target_coiffeur_id': int(coiffeur_ids[mobile[i % len(mobile)]]) if req_target[i] and len(mobile) else None,
+                'service_requested': SYNTHETIC_SERVICES[req_service[i]][0],
+                'client_location': location,
+                'latitude': position[0] if position else None, 'longitude': position[1] if position else None,
+                'preferred_date': today + timedelta(days=int(req_day[i])),
+                'preferred_time': slot_time(req_slot[i]),
+                'status': 'Pending', 'created_at': now,
             }
-            # Fetch comments for publication
-            pub_comments = db.session.query(
-                PublicationComment, User.name
-            ).join(
-                User, PublicationComment.client_id == User.id
-            ).filter(
-                PublicationComment.publication_id == pub.id
-            ).order_by(
-                PublicationComment.created_at.asc()
-            ).all()
-
-            pub_data['comments'] = [{
-                'id': c.PublicationComment.id,
-                'text': c.PublicationComment.comment_text,
-                'user': c.name,
-                'created_at': c.PublicationComment.created_at
-            } for c in pub_comments]
-
-            if client_id:
-                pub_data['liked_by_user'] = PublicationLike.query.filter_by(publication_id=pub.id, client_id=client_id).first() is not None
-            
-            publications.append(pub_data)
+    insert(DeplacementRequest, request_rows())
 
-        subscriber_count = Subscription.query.filter_by(coiffeur_id=coiffeur_id).count()
+    def proposal_rows():
+        k = 0
+        for i in range(n_req):
+            for _ in range(proposals_per[i]):
+                yield {
+                    'request_id': first_req + i, 'coiffeur_id': int(coiffeur_ids[proposal_coiffeur[k]]),
+                    'client_id': int(client_ids[req_client[i]]),
+                    'proposed_price': round(SYNTHETIC_SERVICES[req_service[i]][1] * proposal_factor[k]),
+                    'status': 'Pending', 'created_at': now,
+                }
+                k += 1
+    insert(PriceProposal, proposal_rows())
 
-        return {
-            'user': coiffeur.user,
-            'coiffeur': coiffeur,
-            'services': services,
-            'menu_items': menu_items, 
-            'photos': Photo.query.filter_by(coiffeur_id=coiffeur_id).all(),
-            'comments': comments,
-            'publications': publications,
-            'is_subscribed': is_subscribed,
-            'subscriber_count': subscriber_count 
-        }
-    return None
+    # Rows above carry ids from _next_id(), which PostgreSQL sequences do not see
+    _sync_id_sequences(User, Service, Publication, Reservation, DeplacementRequest)
 
-def seed_db():
-    try:
-        if User.query.count() > 0:
-            print("Database already contains data. Skipping seeding.")
-            return
-    except Exception as e:
-        pass 
+    started = time.perf_counter()
+    counts[DeplacementMatch.__tablename__] = rebuild_deplacement_inbox()
+    log(f"{DeplacementMatch.__tablename__}: {counts[DeplacementMatch.__tablename__]} rows in {time.perf_counter() - started:.1f}s")
 
-    # Seeding logic preserved for dev
-    client1 = User(name='Sarah Connor', email='sarah@client.com', password='password', type='client', city='Paris', phone='0612345678', is_confirmed=True) 
-    client2 = User(name='John Smith', email='john@client.com', password='password', type='client', city='Lyon', phone='0698765432', is_confirmed=True)
-    db.session.add_all([client1, client2])
-    db.session.commit()
-    # ... (abbreviated for brevity, normally you'd keep full seed logic)
-    print("Database seeded.")
+    # Core inserts bypass the session listener that maintains the search index
+    started = time.perf_counter()
+    counts[SEARCH_TABLE] = rebuild_search_index()
+    log(f"{SEARCH_TABLE}: {counts[SEARCH_TABLE]} rows in {time.perf_counter() - started:.1f}s")
+
+    stylist_read_model.invalidate()
+    stylist_profile_cache.clear()
+    identity_cache.clear()
+    return counts
+
+@app.cli.command('generate-data')
+@click.option('--scale', default=1.0, show_default=True, help='Multiplies every volume.')
+@click.option('--seed', default=42, show_default=True, help='Same seed and volumes give the same data.')
+@click.option('--chunk-size', default=SYNTHETIC_CHUNK_SIZE, show_default=True, help='Rows per INSERT transaction.')
+@click.option('--coiffeurs', type=int)
+@click.option('--clients', type=int)
+@click.option('--publications', type=int)
+@click.option('--likes', type=int)
+@click.option('--publication-comments', type=int)
+@click.option('--subscriptions', type=int)
+@click.option('--reviews', type=int)
+@click.option('--reservations', type=int)
+@click.option('--deplacement-requests', type=int)
+def generate_data_command(scale, seed, chunk_size, **overrides):
+    """Bulk-inserts a synthetic dataset around Moroccan cities (appends to existing data)."""
+    volumes = {name: int(count * scale) for name, count in SYNTHETIC_VOLUMES.items()}
+    volumes.update({name: count for name, count in overrides.items() if count is not None})
+    started = time.perf_counter()
+    counts = generate_dataset(volumes, seed=seed, chunk_size=chunk_size)
+    print(f"Generated {sum(counts.values())} rows in {time.perf_counter() - started:.0f}s")
+
+def seed_db():
+    """Loads the small demo dataset into an empty database."""
+    if db.session.query(User.id).limit(1).first() is not None:
+        return
+    generate_dataset(DEMO_VOLUMES, log=lambda message: None)
+    print("Database seeded with demo data.")
 
 with app.app_context():
+    # Every worker imports this: it only creates the tables of a new database.
+    # Existing ones are migrated and backfilled by `flask upgrade-db`.
+    new_database = not inspect(db.engine).has_table(User.__tablename__)
     db.create_all() 
-    seed_db()
+    if new_database:
+        with db.engine.begin() as conn:
+            create_search_index(conn)
+    if app.config.get('SEED_DEMO_DATA'):
+        seed_db()
 
 
 # ==========================================
@@ -485,9 +3283,8 @@ def api_signup_client():
         confirmation_token=code
     )
     db.session.add(new_user)
-    db.session.commit()
-    
     send_confirmation_email(new_user, code)
+    db.session.commit()
     
     session['user_id'] = new_user.id
     session['user_type'] = new_user.type
@@ -544,9 +3341,9 @@ def api_signup_coiffeur():
             trial_end_date=trial_start + timedelta(days=30)
         )
         db.session.add(new_coiffeur)
+        send_confirmation_email(new_user, code)
         db.session.commit()
         
-        send_confirmation_email(new_user, code)
         session['user_id'] = new_user.id
         session['user_type'] = new_user.type
         return jsonify({'message': 'Account created', 'userId': new_user.id}), 201
@@ -586,8 +3383,8 @@ def api_forgot_password():
     if user:
         code = generate_confirmation_token()
         user.confirmation_token = code
-        db.session.commit()
         send_reset_email(user, code)
+        db.session.commit()
         return jsonify({'message': 'Reset code sent'}), 200
     return jsonify({'message': 'If account exists, code sent'}), 200
 
@@ -612,17 +3409,9 @@ def api_reset_password():
 
 @app.route('/api/me', methods=['GET'])
 def api_me():
-    user = get_current_user()
-    if user:
-        return jsonify({
-            'id': user.id,
-            'name': user.name,
-            'email': user.email,
-            'type': user.type,
-            'city': user.city,
-            'isConfirmed': user.is_confirmed,
-            'image': user.coiffeur.profile_image if user.type == 'coiffeur' and user.coiffeur else None
-        })
+    identity = get_current_identity()
+    if identity:
+        return jsonify(identity)
     return jsonify(None), 401
 
 @app.route('/api/dashboard', methods=['GET'])
@@ -658,30 +3447,80 @@ def api_dashboard_data():
                 'capacity': data['coiffeur'].current_capacity,
                 'waiting': data['coiffeur'].people_waiting
             }
-            if data['coiffeur'].category == 'Déplacé':
-                requests = DeplacementRequest.query.filter(
+            if data['coiffeur'].category == DEPLACEMENT_CATEGORY:
+                # Precomputed inbox: only the requests this stylist was matched with
+                inbox = db.session.query(DeplacementRequest, DeplacementMatch.distance_km).join(
+                    DeplacementMatch, DeplacementMatch.request_id == DeplacementRequest.id
+                ).filter(
+                    DeplacementMatch.coiffeur_id == user.id,
                     DeplacementRequest.status == 'Pending',
-                    DeplacementRequest.target_coiffeur_id.is_(None),
                     ~DeplacementRequest.proposals.any(PriceProposal.coiffeur_id == user.id)
-                ).all()
+                ).order_by(DeplacementMatch.created_at.desc()).limit(DEPLACEMENT_INBOX_LIMIT).all()
                 response['deplacement_requests'] = [{
                     'id': r.id,
                     'service': r.service_requested,
                     'location': r.client_location,
+                    'distance_km': distance,
                     'date': str(r.preferred_date),
                     'time': str(r.preferred_time)
-                } for r in requests]
+                } for r, distance in inbox]
 
     return jsonify(response)
 
+# Output key -> read model column for the listing payload
+STYLIST_CARD_FIELDS = {
+    'id': 'id', 'name': 'name', 'category': 'category', 'city': 'city',
+    'rating': 'rating', 'image': 'image', 'capacity': 'capacity',
+    'waiting': 'waiting', 'lat': 'lat', 'lng': 'lng'
+}
+STYLISTS_DEFAULT_LIMIT = 24
+STYLISTS_MAX_LIMIT = 100
+
 @app.route('/api/stylists', methods=['GET'])
+@replica_read
 def api_get_stylists():
+    """
+    Lists active stylists, one page at a time. Pages are keyed on the sort
+    order (rating desc or waiting asc, then id): pass the returned
+    `next_cursor` back as `cursor` to get the following page.
+    """
     # Support search params
     city = request.args.get('city')
     category = request.args.get('category')
-    sort_by = request.args.get('sort_by', 'rating')
-    
-    query = db.session.query(User, Coiffeur).join(Coiffeur, User.id == Coiffeur.user_id).filter(Coiffeur.status == 'active')
+    sort_by = 'waiting' if request.args.get('sort_by') == 'waiting' else 'rating'
+    try:
+        limit, after = parse_page_args(STYLISTS_DEFAULT_LIMIT, STYLISTS_MAX_LIMIT, 2)
+        # Unrated stylists page with a null rating key
+        if after and not (isinstance(after[1], int) and (isinstance(after[0], (int, float))
+                                                          or (after[0] is None and sort_by == 'rating'))):
+            raise ValueError('Invalid cursor')
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+
+    if app.config.get('STYLIST_READ_MODEL'):
+        snap = stylist_read_model.snapshot()
+        mask = snap.filter_mask(city, category)
+        if after:
+            mask &= snap.after_mask(sort_by, *after)
+        indices = snap.sorted_indices(mask, sort_by)[:limit + 1]
+        stylists = snap.records(indices, STYLIST_CARD_FIELDS)
+    else:
+        stylists = query_stylist_cards(city, category, sort_by, after, limit + 1)
+
+    next_cursor = None
+    if len(stylists) > limit:
+        stylists = stylists[:limit]
+        last = stylists[-1]
+        next_cursor = encode_cursor([last[sort_by], last['id']])
+    return jsonify({'stylists': stylists, 'next_cursor': next_cursor})
+
+def query_stylist_cards(city, category, sort_by, after, limit):
+    """Database path of /api/stylists: selects only the card columns."""
+    query = db.session.query(
+        User.id, User.name, User.city, Coiffeur.category, Coiffeur.rating,
+        Coiffeur.profile_image, Coiffeur.profile_image_variants, Coiffeur.current_capacity,
+        Coiffeur.people_waiting, Coiffeur.latitude, Coiffeur.longitude
+    ).join(Coiffeur, User.id == Coiffeur.user_id).filter(Coiffeur.status == 'active')
     
     if city:
         query = query.filter(User.city == city)
@@ -689,75 +3528,96 @@ def api_get_stylists():
         query = query.filter(Coiffeur.category == category)
     
     if sort_by == 'waiting':
-        query = query.order_by(Coiffeur.people_waiting.asc())
+        if after:
+            query = query.filter(or_(
+                Coiffeur.people_waiting > after[0],
+                and_(Coiffeur.people_waiting == after[0], Coiffeur.user_id > after[1])
+            ))
+        query = query.order_by(Coiffeur.people_waiting.asc(), Coiffeur.user_id.asc())
     else:
-        query = query.order_by(Coiffeur.rating.desc())
+        # Unrated (NULL) stylists come last on every database
+        if after and after[0] is None:
+            query = query.filter(Coiffeur.rating.is_(None), Coiffeur.user_id > after[1])
+        elif after:
+            query = query.filter(or_(
+                Coiffeur.rating < after[0],
+                and_(Coiffeur.rating == after[0], Coiffeur.user_id > after[1]),
+                Coiffeur.rating.is_(None)
+            ))
+        query = query.order_by(Coiffeur.rating.desc().nullslast(), Coiffeur.user_id.asc())
         
-    results = query.all()
-    
-    stylists = []
-    for user, coiffeur in results:
-        stylists.append({
-            'id': user.id,
-            'name': user.name,
-            'category': coiffeur.category,
-            'city': user.city,
-            'rating': coiffeur.rating,
-            'image': coiffeur.profile_image,
-            'description': coiffeur.description,
-            'capacity': coiffeur.current_capacity,
-            'waiting': coiffeur.people_waiting,
-            'lat': coiffeur.latitude,
-            'lng': coiffeur.longitude
-        })
-    return jsonify(stylists)
+    return overlay_positions([{
+        'id': row.id,
+        'name': row.name,
+        'category': row.category,
+        'city': row.city,
+        'rating': row.rating,
+        'image': pick_image_variant(row.profile_image, row.profile_image_variants, 'thumb'),
+        'capacity': row.current_capacity,
+        'waiting': row.people_waiting,
+        'lat': row.latitude,
+        'lng': row.longitude
+    } for row in query.limit(limit).all()])
 
-# --- UPDATED: Route to get a single stylist by ID (matches URL /api/stylists/<int:stylist_id>) ---
-# --- ADDED: PUT method to update stylist status (waiting queue) ---
-@app.route('/api/stylists/<int:stylist_id>', methods=['GET', 'PUT'])
-def api_get_stylist_detail(stylist_id):
-    if request.method == 'PUT':
-        if not is_logged_in() or session['user_id'] != stylist_id:
-            return jsonify({'error': 'Unauthorized'}), 403
-        
-        data = request.get_json()
-        coiffeur = Coiffeur.query.get(stylist_id)
-        if 'waiting_count' in data:
-            coiffeur.people_waiting = data['waiting_count']
-        
-        db.session.commit()
-        return jsonify({'message': 'Updated'}), 200
+@app.route('/api/search', methods=['GET'])
+@replica_read
+def api_search():
+    """
+    Ranked full-text search over stylist names, services, menus and
+    descriptions. Each word of `q` matches as a prefix. `lat`/`lng` boost
+    nearby stylists; `city` and `category` filter like /api/stylists.
+    Pass the returned `next_cursor` back as `cursor` for the next page.
+    """
+    q = request.args.get('q', '')
+    if not search_terms(q):
+        return jsonify({'error': 'q is required'}), 400
+    try:
+        limit, after = parse_page_args(SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT, 2)
+        if after and not all(isinstance(v, (int, float)) for v in after):
+            raise ValueError('Invalid cursor')
+        lat = float(request.args['lat']) if request.args.get('lat') else None
+        lng = float(request.args['lng']) if request.args.get('lng') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid limit, cursor, lat or lng'}), 400
 
-    data = get_coiffeur_data(stylist_id)
-    if not data:
-        return jsonify({'error': 'Stylist not found'}), 404
-        
+    stylists, next_cursor = search_stylists(
+        q, lat, lng, request.args.get('city'), request.args.get('category'), after, limit
+    )
+    return jsonify({'stylists': stylists, 'next_cursor': next_cursor})
+
+def serialize_feed_item(pub):
+    """JSON shape of one publication from get_publication_page()."""
+    return {
+        'id': pub['id'],
+        'text': pub['text'],
+        'images': pub['images'],
+        'images_full': pub['images_full'],
+        'created_at': pub['created_at'].strftime('%Y-%m-%d'),
+        'likes': pub['likes_count'],
+        'comments_count': pub['comments_count'],
+        'comments': pub['comments'],
+        'comments_next_cursor': pub['comments_next_cursor'],
+        'liked_by_user': pub['liked_by_user']
+    }
+
+def serialize_stylist_profile(data):
+    """Builds the viewer independent /api/stylists/<id> payload from get_coiffeur_data()."""
     coiffeur = data['coiffeur']
     user = data['user']
     
     photos = [p.image_path for p in data['photos']]
     menu = [{'id': m.id, 'name': m.name, 'price': m.price, 'description': m.description} for m in data['menu_items']]
-    services = [{'id': s.id, 'name': s.service_name, 'price': s.price} for s in data['services']]
+    services = [{'id': s.id, 'name': s.service_name, 'price': s.price, 'duration': s.duration_minutes} for s in data['services']]
     
-    feed = []
-    for pub in data['publications']:
-        feed.append({
-            'id': pub['id'],
-            'text': pub['text'],
-            'images': pub['images'],
-            'created_at': pub['created_at'].strftime('%Y-%m-%d'),
-            'likes': pub['likes_count'],
-            'comments': pub['comments'],
-            'liked_by_user': pub['liked_by_user']
-        })
+    feed = [serialize_feed_item(pub) for pub in data['publications']]
 
-    return jsonify({
+    return {
         'id': user.id,
         'name': user.name,
         'category': coiffeur.category,
         'city': user.city,
         'rating': coiffeur.rating,
-        'image': coiffeur.profile_image,
+        'image': coiffeur.image_variant('card'),
         'description': coiffeur.description,
         'address': coiffeur.address,
         'capacity': coiffeur.current_capacity,
@@ -766,10 +3626,117 @@ def api_get_stylist_detail(stylist_id):
         'menu': menu,
         'services': services,
         'feed': feed,
-        'is_subscribed': data['is_subscribed'],
+        'feed_next_cursor': data['feed_next_cursor'],
+        'is_subscribed': False,
         'subscriber_count': data['subscriber_count']
+    }
+
+# --- UPDATED: Route to get a single stylist by ID (matches URL /api/stylists/<int:stylist_id>) ---
+# --- ADDED: PUT method to update stylist status (waiting queue) ---
+@app.route('/api/stylists/<int:stylist_id>', methods=['GET', 'PUT'])
+@replica_read
+def api_get_stylist_detail(stylist_id):
+    if request.method == 'PUT':
+        if not is_logged_in() or session['user_id'] != stylist_id:
+            return jsonify({'error': 'Unauthorized'}), 403
+        
+        data = request.get_json()
+        coiffeur = Coiffeur.query.get(stylist_id)
+        if 'waiting_count' in data:
+            coiffeur.people_waiting = data['waiting_count']
+        if 'service_radius_km' in data:
+            try:
+                radius = float(data['service_radius_km'])
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Invalid service radius'}), 400
+            if not 0 < radius <= DEPLACEMENT_MAX_RADIUS_KM:
+                return jsonify({'error': f'Service radius must be between 0 and {DEPLACEMENT_MAX_RADIUS_KM} km'}), 400
+            coiffeur.service_radius_km = radius
+        
+        db.session.commit()
+        return jsonify({'message': 'Updated'}), 200
+
+    profile = stylist_profile_cache.get(stylist_id)
+    if profile is None:
+        # The cache is shared by all visitors: never fill it from a lagging replica
+        with primary_reads():
+            data = get_coiffeur_data(stylist_id, with_viewer=False)
+        if not data:
+            return jsonify({'error': 'Stylist not found'}), 404
+        profile = serialize_stylist_profile(data)
+        stylist_profile_cache.set(stylist_id, profile)
+
+    # Per-viewer fields are applied on top of the shared (cached) payload
+    is_subscribed, liked_ids = get_viewer_state(stylist_id, [pub['id'] for pub in profile['feed']])
+    response = dict(profile)
+    response['feed'] = [dict(pub, liked_by_user=pub['id'] in liked_ids) for pub in profile['feed']]
+    response['is_subscribed'] = is_subscribed
+    return jsonify(response)
+
+@app.route('/api/stylists/<int:stylist_id>/publications', methods=['GET'])
+@replica_read
+def api_get_stylist_publications(stylist_id):
+    """Pages through a stylist's feed, newest first. Pass `next_cursor` back as `cursor`."""
+    try:
+        limit, after = parse_page_args(FEED_PAGE_SIZE, FEED_MAX_PAGE_SIZE, 2)
+        publications, next_cursor = get_publication_page(stylist_id, after, limit)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+
+    _, liked_ids = get_viewer_state(stylist_id, [pub['id'] for pub in publications])
+    for pub in publications:
+        pub['liked_by_user'] = pub['id'] in liked_ids
+    return jsonify({
+        'publications': [serialize_feed_item(pub) for pub in publications],
+        'next_cursor': next_cursor
     })
 
+@app.route('/api/publications/<int:pub_id>/comments', methods=['GET', 'POST'])
+@replica_read
+def api_publication_comments(pub_id):
+    """Pages through a publication's comments, oldest first. POST adds one (clients only)."""
+    if request.method == 'POST':
+        if not is_logged_in() or session['user_type'] != 'client':
+            return jsonify({'error': 'Client login required'}), 403
+        data = request.get_json() or {}
+        comment_text = (data.get('text') or '').strip()
+        if not comment_text or len(comment_text) > 250:
+            return jsonify({'error': 'Comment must be 1-250 characters'}), 400
+        pub = Publication.query.get(pub_id)
+        if not pub:
+            return jsonify({'error': 'Not found'}), 404
+
+        new_comment = PublicationComment(publication_id=pub_id, client_id=session['user_id'], comment_text=comment_text)
+        db.session.add(new_comment)
+        pub.comments_count = Publication.comments_count + 1
+        db.session.commit()
+        return jsonify({'message': 'Comment added', 'id': new_comment.id}), 201
+
+    try:
+        limit, after = parse_page_args(COMMENTS_PAGE_SIZE, COMMENTS_MAX_PAGE_SIZE, 2)
+        query = db.session.query(
+            PublicationComment, User.name
+        ).join(
+            User, PublicationComment.client_id == User.id
+        ).filter(
+            PublicationComment.publication_id == pub_id
+        )
+        if after:
+            created_at, comment_id = datetime.fromisoformat(after[0]), int(after[1])
+            query = query.filter(or_(
+                PublicationComment.created_at > created_at,
+                and_(PublicationComment.created_at == created_at, PublicationComment.id > comment_id)
+            ))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+
+    rows = query.order_by(
+        PublicationComment.created_at.asc(), PublicationComment.id.asc()
+    ).limit(limit + 1).all()
+    comments = [serialize_pub_comment(c.PublicationComment, c.name) for c in rows[:limit]]
+    next_cursor = comments_cursor(comments[-1]) if len(rows) > limit else None
+    return jsonify({'comments': comments, 'next_cursor': next_cursor})
+
 @app.route('/api/stylists/<int:id>/comment', methods=['POST'])
 def api_add_stylist_comment(id):
     if not is_logged_in() or session['user_type'] != 'client':
@@ -799,23 +3766,23 @@ def api_reserve_form(coiffeur_id):
         
     try:
         # Determine service id if passed, otherwise default to None
-        service_id = data.get('service') if data.get('service') else None
-        
-        new_res = Reservation(
-            client_id=session['user_id'],
-            coiffeur_id=coiffeur_id,
+        service_id = int(data['service']) if data.get('service') else None
+        new_res = book_reservation(
+            session['user_id'],
+            coiffeur_id,
+            datetime.strptime(data['date'], '%Y-%m-%d').date(),
+            datetime.strptime(data['time'], '%H:%M').time(),
             service_id=service_id,
-            date=datetime.strptime(data['date'], '%Y-%m-%d').date(),
-            time=datetime.strptime(data['time'], '%H:%M').time(),
-            notes=data.get('notes'),
-            status='Pending'
+            notes=data.get('notes')
         )
-        db.session.add(new_res)
-        db.session.commit()
-        return jsonify({'message': 'Reservation submitted', 'id': new_res.id}), 201
+    except SlotUnavailable:
+        BOOKINGS.labels('conflict').inc()
+        return jsonify({'error': 'This slot is no longer available'}), 409
     except Exception as e:
         print(e)
         return jsonify({'error': str(e)}), 400
+    BOOKINGS.labels('booked').inc()
+    return jsonify({'message': 'Reservation submitted', 'id': new_res.id}), 201
 
 @app.route('/api/reserve', methods=['POST'])
 def api_reserve():
@@ -824,41 +3791,166 @@ def api_reserve():
     
     data = request.get_json()
     try:
-        new_res = Reservation(
-            client_id=session['user_id'],
-            coiffeur_id=data['coiffeur_id'],
-            service_id=data.get('service_id'),
-            date=datetime.strptime(data['date'], '%Y-%m-%d').date(),
-            time=datetime.strptime(data['time'], '%H:%M').time(),
-            notes=data.get('notes'),
-            status='Pending'
+        new_res = book_reservation(
+            session['user_id'],
+            int(data['coiffeur_id']),
+            datetime.strptime(data['date'], '%Y-%m-%d').date(),
+            datetime.strptime(data['time'], '%H:%M').time(),
+            service_id=int(data['service_id']) if data.get('service_id') else None,
+            notes=data.get('notes')
         )
-        db.session.add(new_res)
-        db.session.commit()
-        return jsonify({'message': 'Reservation submitted', 'id': new_res.id}), 201
+    except SlotUnavailable:
+        BOOKINGS.labels('conflict').inc()
+        return jsonify({'error': 'This slot is no longer available'}), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 400
+    BOOKINGS.labels('booked').inc()
+    return jsonify({'message': 'Reservation submitted', 'id': new_res.id}), 201
+
+@app.route('/api/stylists/<int:stylist_id>/availability', methods=['GET'])
+@replica_read
+def api_stylist_availability(stylist_id):
+    """
+    Bookable start times (HH:MM) for each of the next `days` days (from `from`,
+    default today), for the duration of `service_id` or a default slot.
+    """
+    if db.session.get(Coiffeur, stylist_id) is None:
+        return jsonify({'error': 'Stylist not found'}), 404
+    today = salon_now().date()
+    try:
+        days = min(int(request.args.get('days', AVAILABILITY_DEFAULT_DAYS)), AVAILABILITY_MAX_DAYS)
+        first_day = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else today
+        service_id = int(request.args['service_id']) if request.args.get('service_id') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid days, from or service_id'}), 400
+    if days <= 0:
+        return jsonify({'error': 'days must be positive'}), 400
+
+    duration = SLOT_DEFAULT_DURATION
+    if service_id is not None:
+        service = Service.query.filter_by(id=service_id, coiffeur_id=stylist_id).first()
+        if service is None:
+            return jsonify({'error': 'Service not found'}), 404
+        duration = service.duration_minutes or SLOT_DEFAULT_DURATION
+
+    availability = compute_availability(stylist_id, max(first_day, today), days, duration)
+    return jsonify({
+        'stylist_id': stylist_id,
+        'duration': duration,
+        'step': SLOT_STEP_MINUTES,
+        'days': [{
+            'date': day.isoformat(),
+            'slots': [f"{start // 60:02d}:{start % 60:02d}" for start in slots]
+        } for day, slots in availability]
+    })
+
+@app.route('/api/deplacement-requests', methods=['POST'])
+def api_create_deplacement_request():
+    """
+    Asks mobile stylists for a home visit. `location` is free text resolved
+    with the gazetteer, unless the client shares `latitude`/`longitude`.
+    """
+    if not is_logged_in() or session['user_type'] != 'client':
+        return jsonify({'error': 'Client login required'}), 403
+
+    data = request.get_json() or {}
+    if not data.get('service') or not data.get('location'):
+        return jsonify({'error': 'service and location are required'}), 400
+    try:
+        preferred_date = datetime.strptime(data['date'], '%Y-%m-%d').date()
+        preferred_time = datetime.strptime(data['time'], '%H:%M').time()
+        target_id = int(data['target_coiffeur_id']) if data.get('target_coiffeur_id') else None
+        if data.get('latitude') is not None and data.get('longitude') is not None:
+            position = (float(data['latitude']), float(data['longitude']))
+        else:
+            position = geocode_place(data['location'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Invalid date, time, target or coordinates'}), 400
+    if position is None and target_id is None:
+        return jsonify({'error': 'Unknown location: add the city or share your position'}), 400
+    if target_id is not None and db.session.get(Coiffeur, target_id) is None:
+        return jsonify({'error': 'Stylist not found'}), 404
+
+    req = DeplacementRequest(
+        client_id=session['user_id'],
+        target_coiffeur_id=target_id,
+        service_requested=data['service'],
+        client_location=data['location'],
+        latitude=position[0] if position else None,
+        longitude=position[1] if position else None,
+        preferred_date=preferred_date,
+        preferred_time=preferred_time,
+        details=data.get('details'),
+        status='Pending'
+    )
+    db.session.add(req)
+    db.session.flush()
+    matched = match_deplacement_request(req)
+    db.session.commit()
+    return jsonify({'message': 'Request submitted', 'id': req.id, 'matched_stylists': matched}), 201
 
 # --- ADDED: Fetch reservations for a coiffeur dashboard ---
+RESERVATIONS_PAGE_SIZE = 50
+RESERVATIONS_MAX_PAGE_SIZE = 200
+
 @app.route('/api/coiffeur/<int:id>/reservations', methods=['GET'])
+@replica_read
 def api_get_coiffeur_reservations(id):
+    """
+    A stylist's reservations in (date, time, id) order, one page at a time.
+    `from` / `to` (YYYY-MM-DD, inclusive) bound the dates, from today by default;
+    `status` is a comma separated list. Pass `next_cursor` back as `cursor`.
+    Client and service names come from the same query, so any page costs one query.
+    """
     if not is_logged_in() or session['user_id'] != id:
         return jsonify({'error': 'Unauthorized'}), 403
-        
-    reservations = Reservation.query.filter_by(coiffeur_id=id).order_by(Reservation.date, Reservation.time).all()
-    
-    res_list = []
-    for r in reservations:
-        res_list.append({
-            'id': r.id,
-            'client_name': r.client.name,
-            'service': r.service_detail.service_name if r.service_detail else 'General',
-            'date': str(r.date),
-            'time': str(r.time),
-            'status': r.status,
-            'notes': r.notes
-        })
-    return jsonify(res_list)
+
+    try:
+        limit, after = parse_page_args(RESERVATIONS_PAGE_SIZE, RESERVATIONS_MAX_PAGE_SIZE, 3)
+        first_day = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else salon_now().date()
+        last_day = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else None
+        query = db.session.query(
+            Reservation.id, Reservation.date, Reservation.time, Reservation.status, Reservation.notes,
+            User.name.label('client_name'), Service.service_name
+        ).join(
+            User, Reservation.client_id == User.id
+        ).outerjoin(
+            Service, Reservation.service_id == Service.id
+        ).filter(
+            Reservation.coiffeur_id == id,
+            Reservation.date >= first_day
+        )
+        if last_day:
+            query = query.filter(Reservation.date <= last_day)
+        if request.args.get('status'):
+            query = query.filter(Reservation.status.in_(request.args['status'].split(',')))
+        if after:
+            day = datetime.strptime(after[0], '%Y-%m-%d').date()
+            start_time = datetime.strptime(after[1], '%H:%M:%S').time()
+            res_id = int(after[2])
+            query = query.filter(or_(
+                Reservation.date > day,
+                and_(Reservation.date == day, Reservation.time > start_time),
+                and_(Reservation.date == day, Reservation.time == start_time, Reservation.id > res_id)
+            ))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid limit, cursor, from or to'}), 400
+
+    rows = query.order_by(Reservation.date, Reservation.time, Reservation.id).limit(limit + 1).all()
+    res_list = [{
+        'id': r.id,
+        'client_name': r.client_name,
+        'service': r.service_name or 'General',
+        'date': str(r.date),
+        'time': str(r.time),
+        'status': r.status,
+        'notes': r.notes
+    } for r in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = res_list[-1]
+        next_cursor = encode_cursor([last['date'], last['time'], last['id']])
+    return jsonify({'reservations': res_list, 'next_cursor': next_cursor})
 
 @app.route('/api/coiffeur/menu', methods=['POST'])
 def api_add_menu():
@@ -885,6 +3977,37 @@ def api_delete_menu(id):
         return jsonify({'message': 'Deleted'}), 200
     return jsonify({'error': 'Not found'}), 404
 
+@app.route('/api/coiffeur/working-hours', methods=['GET', 'PUT'])
+def api_working_hours():
+    """Opening hours, as [{"weekday": 0, "opens": "09:00", "closes": "13:00"}, ...] (0 = Monday)."""
+    if not is_logged_in() or session['user_type'] != 'coiffeur':
+        return jsonify({'error': 'Unauthorized'}), 403
+    coiffeur_id = session['user_id']
+
+    if request.method == 'PUT':
+        rows = []
+        try:
+            for item in (request.get_json() or {}).get('hours', []):
+                weekday = int(item['weekday'])
+                opens_at = datetime.strptime(item['opens'], '%H:%M').time()
+                closes_at = datetime.strptime(item['closes'], '%H:%M').time()
+                if not 0 <= weekday <= 6 or opens_at >= closes_at:
+                    raise ValueError
+                rows.append(WorkingHours(coiffeur_id=coiffeur_id, weekday=weekday, opens_at=opens_at, closes_at=closes_at))
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'Each entry needs weekday (0-6) and opens < closes as HH:MM'}), 400
+        WorkingHours.query.filter_by(coiffeur_id=coiffeur_id).delete()
+        db.session.add_all(rows)
+        # An empty list closes the salon rather than restoring the defaults
+        Coiffeur.query.get(coiffeur_id).working_hours_set = True
+        db.session.commit()
+
+    hours = working_hours_for(coiffeur_id)
+    return jsonify({'hours': [
+        {'weekday': weekday, 'opens': f"{opens // 60:02d}:{opens % 60:02d}", 'closes': f"{closes // 60:02d}:{closes % 60:02d}"}
+        for weekday in sorted(hours) for opens, closes in sorted(hours[weekday])
+    ]})
+
 # --- ADDED: Update coiffeur location ---
 @app.route('/api/coiffeur/location', methods=['POST'])
 def api_update_location():
@@ -892,16 +4015,38 @@ def api_update_location():
         return jsonify({'error': 'Unauthorized'}), 403
     
     data = request.get_json()
+    latitude, longitude = data.get('latitude'), data.get('longitude')
+    if latitude is not None and longitude is not None:
+        try:
+            latitude, longitude = float(latitude), float(longitude)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid coordinates'}), 400
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return jsonify({'error': 'Invalid coordinates'}), 400
+        if app.config.get('LOCATION_WRITE_BEHIND'):
+            # Written by the location_buffer flush, a few seconds later
+            location_buffer.submit(session['user_id'], latitude, longitude)
+            return jsonify({'message': 'Location updated'}), 200
+
+    location_buffer.forget(session['user_id'])
     coiffeur = Coiffeur.query.get(session['user_id'])
-    coiffeur.latitude = data.get('latitude')
-    coiffeur.longitude = data.get('longitude')
-    coiffeur.location_updated_at = datetime.utcnow()
+    coiffeur.set_location(latitude, longitude)
     db.session.commit()
     return jsonify({'message': 'Location updated'}), 200
 
 # --- ADDED: Get all coiffeur locations for map ---
+STYLIST_LOCATION_FIELDS = {
+    'id': 'id', 'name': 'name', 'lat': 'lat', 'lng': 'lng',
+    'address': 'address', 'category': 'category'
+}
+
 @app.route('/api/coiffeurs/locations', methods=['GET'])
+@replica_read
 def api_get_all_locations():
+    if app.config.get('STYLIST_READ_MODEL'):
+        snap = stylist_read_model.snapshot()
+        return jsonify(snap.records(np.flatnonzero(~np.isnan(snap.columns['lat'])), STYLIST_LOCATION_FIELDS))
+
     active_coiffeurs = db.session.query(User, Coiffeur).join(Coiffeur).filter(
         Coiffeur.latitude.is_not(None), Coiffeur.status == 'active'
     ).all()
@@ -916,31 +4061,315 @@ def api_get_all_locations():
             'address': coif.address,
             'category': coif.category
         })
-    return jsonify(locations)
+    return jsonify(overlay_positions(locations))
+
+NEARBY_DEFAULT_RADIUS_KM = 50
+NEARBY_MAX_RADIUS_KM = 500
+NEARBY_DEFAULT_LIMIT = 50
+NEARBY_MAX_LIMIT = 200
 
 @app.route('/api/coiffeurs/nearby', methods=['GET'])
+@replica_read
 def api_nearby():
     try:
         lat = float(request.args.get('lat', 48.86))
         lon = float(request.args.get('lon', 2.33))
-        
-        active_coiffeurs = db.session.query(User, Coiffeur).join(Coiffeur).filter(
-            Coiffeur.latitude.is_not(None), Coiffeur.status == 'active'
-        ).all()
-        
-        nearby = []
-        for user, coif in active_coiffeurs:
-            dist = haversine(lat, lon, coif.latitude, coif.longitude)
-            if dist < 50:
-                nearby.append({
-                    'id': user.id, 'name': user.name, 
-                    'lat': coif.latitude, 'lng': coif.longitude,
-                    'dist': round(dist, 1)
-                })
-        return jsonify(nearby)
-    except:
+        radius = min(float(request.args.get('radius', NEARBY_DEFAULT_RADIUS_KM)), NEARBY_MAX_RADIUS_KM)
+        limit = min(int(request.args.get('limit', NEARBY_DEFAULT_LIMIT)), NEARBY_MAX_LIMIT)
+    except (TypeError, ValueError):
+        return jsonify([])
+    if radius <= 0 or limit <= 0:
         return jsonify([])
 
+    if app.config.get('STYLIST_READ_MODEL'):
+        snap = stylist_read_model.snapshot()
+        indices, distances = snap.nearby(lat, lon, radius, limit)
+        nearby = snap.records(indices, {'id': 'id', 'name': 'name', 'lat': 'lat', 'lng': 'lng'})
+        for item, dist in zip(nearby, distances):
+            item['dist'] = round(float(dist), 1)
+        return jsonify(nearby)
+
+    # 1. Geohash cells covering the bounding box -> indexed range scans
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius)
+    cells = geohash_cells_for_box(min_lat, max_lat, min_lon, max_lon)
+    query = db.session.query(
+        User.id, User.name, Coiffeur.latitude, Coiffeur.longitude
+    ).join(Coiffeur, User.id == Coiffeur.user_id).filter(
+        Coiffeur.status == 'active',
+        # 2. Bounding box prefilter drops the corners of the covering cells
+        Coiffeur.latitude.between(min_lat, max_lat),
+        Coiffeur.longitude.between(min_lon, max_lon)
+    )
+    if cells:
+        query = query.filter(or_(*[
+            and_(Coiffeur.geohash >= cell, Coiffeur.geohash < cell + '~') for cell in cells
+        ]))
+
+    # 3. Exact distance check on the few remaining candidates. Buffered fixes
+    # replace stored positions; a stylist only moving into the area shows up
+    # once its fix is flushed.
+    _, positions = location_buffer.positions()
+    nearby = []
+    for coif_id, name, coif_lat, coif_lng in query.all():
+        coif_lat, coif_lng = positions.get(coif_id, (coif_lat, coif_lng))
+        dist = haversine(lat, lon, coif_lat, coif_lng)
+        if dist <= radius:
+            nearby.append({
+                'id': coif_id, 'name': name,
+                'lat': coif_lat, 'lng': coif_lng,
+                'dist': round(dist, 1)
+            })
+    nearby.sort(key=lambda item: item['dist'])
+    return jsonify(nearby[:limit])
+
+# --- Live Updates ---
+# GET /api/live streams Server-Sent Events to clients watching some stylists
+# (?stylists=1,2) or a map viewport (?bbox=min_lat,min_lng,max_lat,max_lng):
+#   event: waiting   data: {"id": 7, "waiting": 3, "capacity": 2}
+#   event: location  data: {"id": 7, "lat": 33.57, "lng": -7.59}
+# Changes are written to live_events in the same transaction as the stylist row
+# (see _record_live_events and write_locations). One thread per worker tails that table and queues
+# each event, formatted once, to the matching streams: the database sees one poll
+# per worker whatever the number of subscribers. A client that reconnects sends
+# Last-Event-ID and gets the events it missed replayed from the table.
+LIVE_QUEUE_SIZE = 256
+LIVE_MAX_STYLISTS = 200
+LIVE_HEARTBEAT_SECONDS = 15
+LIVE_POLL_BATCH = 500
+LIVE_REPLAY_LIMIT = 1000
+LIVE_PRUNE_INTERVAL = 60
+LIVE_RETRY_MS = 3000
+# Retry-After of the 503 sent past LIVE_MAX_SUBSCRIBERS
+LIVE_BUSY_RETRY_SECONDS = 15
+# Ids are allocated before commit, so a row may become visible after a higher
+# id was already read; the poller re-reads this many ids back and skips duplicates
+LIVE_REORDER_WINDOW = 100
+
+def format_live_event(event_id, kind, payload):
+    return f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n"
+
+class LiveSubscriber:
+    """One open stream: what it watches and the events waiting to be sent."""
+
+    def __init__(self, stylist_ids=(), bbox=None):
+        self.stylist_ids = frozenset(stylist_ids)
+        self.bbox = bbox
+        self.queue = queue.Queue(maxsize=LIVE_QUEUE_SIZE)
+        self.overflowed = False
+        self.subscribed = False
+
+    def push(self, event_id, message):
+        try:
+            self.queue.put_nowait((event_id, message))
+        except queue.Full:
+            # Too slow to keep up: the stream ends and the client resumes from Last-Event-ID
+            self.overflowed = True
+
+class LiveBroker:
+    """Per-worker registry of open streams, fed by a thread tailing live_events."""
+
+    def __init__(self, poll_interval=1.0, retention=600):
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._by_stylist = {}
+        self._viewports = set()
+        self._viewport_list = None
+        self._viewport_boxes = None
+        self._count = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self):
+        return self._count
+
+    def subscribe(self, subscriber):
+        with self._lock:
+            subscriber.subscribed = True
+            for stylist_id in subscriber.stylist_ids:
+                self._by_stylist.setdefault(stylist_id, set()).add(subscriber)
+            if subscriber.bbox is not None:
+                self._viewports.add(subscriber)
+                self._viewport_boxes = None
+            self._count += 1
+            LIVE_SUBSCRIBERS.inc()
+            # The poller only runs while this worker has subscribers
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='live-events', daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if not subscriber.subscribed:
+                return
+            subscriber.subscribed = False
+            for stylist_id in subscriber.stylist_ids:
+                watchers = self._by_stylist.get(stylist_id)
+                if watchers is not None:
+                    watchers.discard(subscriber)
+                    if not watchers:
+                        del self._by_stylist[stylist_id]
+            if subscriber in self._viewports:
+                self._viewports.discard(subscriber)
+                self._viewport_boxes = None
+            self._count -= 1
+            LIVE_SUBSCRIBERS.dec()
+
+    def _in_viewport(self, lat, lng):
+        """Viewport subscribers whose box contains (lat, lng), one vectorized test."""
+        if lat is None or lng is None or not self._viewports:
+            return ()
+        if self._viewport_boxes is None:
+            self._viewport_list = list(self._viewports)
+            self._viewport_boxes = np.array([s.bbox for s in self._viewport_list], dtype=np.float64)
+        boxes = self._viewport_boxes
+        hits = np.flatnonzero(
+            (boxes[:, 0] <= lat) & (lat <= boxes[:, 2]) & (boxes[:, 1] <= lng) & (lng <= boxes[:, 3])
+        )
+        return [self._viewport_list[i] for i in hits]
+
+    def dispatch(self, rows):
+        """Queues live_events rows to the streams watching their stylist or position."""
+        with self._lock:
+            for row in rows:
+                targets = set(self._by_stylist.get(row.stylist_id, ()))
+                targets.update(self._in_viewport(row.latitude, row.longitude))
+                if not targets:
+                    continue
+                message = format_live_event(row.id, row.kind, row.payload)
+                for subscriber in targets:
+                    subscriber.push(row.id, message)
+                LIVE_EVENTS_SENT.labels(row.kind).inc(len(targets))
+
+    def _run(self):
+        last_id = None
+        seen = set()
+        next_prune = 0
+        with app.app_context():
+            while True:
+                with self._lock:
+                    if not self._count:
+                        self._thread = None
+                        return
+                try:
+                    with db.engine.connect() as conn:
+                        if last_id is None:
+                            last_id = conn.execute(db.select(func.max(LiveEvent.id))).scalar() or 0
+                            # Streams start from now: existing events are only replayed on request
+                            seen = set(conn.execute(
+                                db.select(LiveEvent.id).where(LiveEvent.id > last_id - LIVE_REORDER_WINDOW)
+                            ).scalars())
+                        rows = conn.execute(
+                            db.select(LiveEvent.id, LiveEvent.kind, LiveEvent.stylist_id,
+                                      LiveEvent.latitude, LiveEvent.longitude, LiveEvent.payload)
+                            .where(LiveEvent.id > last_id - LIVE_REORDER_WINDOW)
+                            .order_by(LiveEvent.id).limit(LIVE_POLL_BATCH)
+                        ).all()
+                    if time.monotonic() >= next_prune:
+                        self.prune()
+                        next_prune = time.monotonic() + LIVE_PRUNE_INTERVAL
+                except Exception:
+                    app.logger.exception("Live events poll failed")
+                    time.sleep(self.poll_interval)
+                    continue
+                fresh = [row for row in rows if row.id not in seen]
+                if fresh:
+                    self.dispatch(fresh)
+                    seen.update(row.id for row in fresh)
+                    last_id = max(last_id, fresh[-1].id)
+                    seen = {event_id for event_id in seen if event_id > last_id - LIVE_REORDER_WINDOW}
+                if len(rows) < LIVE_POLL_BATCH or not fresh:
+                    time.sleep(self.poll_interval)
+
+    def prune(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+        with db.engine.begin() as conn:
+            conn.execute(LiveEvent.__table__.delete().where(LiveEvent.created_at < cutoff))
+
+live_broker = LiveBroker(
+    poll_interval=app.config.get('LIVE_POLL_INTERVAL', 1.0),
+    retention=app.config.get('LIVE_EVENT_RETENTION', 600)
+)
+
+def live_replay(subscriber, last_event_id):
+    """
+    Events after last_event_id for `subscriber`, or None when some were already
+    pruned (or too many were missed) and the client should refetch instead.
+    """
+    oldest = db.session.query(func.min(LiveEvent.id)).scalar()
+    if oldest is not None and oldest > last_event_id + 1:
+        return None
+    watched = []
+    if subscriber.stylist_ids:
+        watched.append(LiveEvent.stylist_id.in_(subscriber.stylist_ids))
+    if subscriber.bbox is not None:
+        min_lat, min_lng, max_lat, max_lng = subscriber.bbox
+        watched.append(and_(LiveEvent.latitude.between(min_lat, max_lat), LiveEvent.longitude.between(min_lng, max_lng)))
+    rows = db.session.query(LiveEvent).filter(
+        LiveEvent.id > last_event_id, or_(*watched)
+    ).order_by(LiveEvent.id).limit(LIVE_REPLAY_LIMIT + 1).all()
+    if len(rows) > LIVE_REPLAY_LIMIT:
+        return None
+    return [(row.id, format_live_event(row.id, row.kind, row.payload)) for row in rows]
+
+@app.route('/api/live', methods=['GET'])
+def api_live():
+    """Event stream for ?stylists=1,2,3 and/or ?bbox=min_lat,min_lng,max_lat,max_lng."""
+    try:
+        stylist_ids = {int(v) for v in request.args.get('stylists', '').split(',') if v.strip()}
+        bbox = request.args.get('bbox')
+        bbox = tuple(float(v) for v in bbox.split(',')) if bbox else None
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        return jsonify({'error': 'Invalid stylists, bbox or Last-Event-ID'}), 400
+    if bbox is not None and (len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]):
+        return jsonify({'error': 'bbox must be min_lat,min_lng,max_lat,max_lng'}), 400
+    if not stylist_ids and bbox is None:
+        return jsonify({'error': 'Pass stylists or bbox'}), 400
+    if len(stylist_ids) > LIVE_MAX_STYLISTS:
+        return jsonify({'error': f'At most {LIVE_MAX_STYLISTS} stylists per stream'}), 400
+    if len(live_broker) >= app.config.get('LIVE_MAX_SUBSCRIBERS', 1500):
+        # EventSource does not retry a non-200 answer; the pages retry on their own
+        return jsonify({'error': 'Too many live subscribers, retry later'}), 503, {'Retry-After': str(LIVE_BUSY_RETRY_SECONDS)}
+
+    subscriber = LiveSubscriber(stylist_ids, bbox)
+    # Subscribed before the replay query, so nothing falls between the two
+    live_broker.subscribe(subscriber)
+    try:
+        missed = live_replay(subscriber, last_event_id) if last_event_id else []
+    except Exception:
+        live_broker.unsubscribe(subscriber)
+        raise
+
+    def stream():
+        sent_id = last_event_id
+        yield f"retry: {LIVE_RETRY_MS}\n\n"
+        if missed is None:
+            # The client reloads the full state, then listens from here
+            yield "event: reset\ndata: {}\n\n"
+        for event_id, message in missed or ():
+            sent_id = event_id
+            yield message
+        while not subscriber.overflowed:
+            try:
+                event_id, message = subscriber.queue.get(timeout=LIVE_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                # Keeps proxies from closing an idle stream
+                yield ": ping\n\n"
+                continue
+            # Replayed events may also arrive through the poller
+            if event_id > sent_id:
+                sent_id = event_id
+                yield message
+
+    response = Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # nginx would otherwise buffer the stream
+        'X-Accel-Buffering': 'no',
+    })
+    # Runs when the client disconnects, even if the stream never started
+    response.call_on_close(lambda: live_broker.unsubscribe(subscriber))
+    return response
+
 # --- Subscription / Social API ---
 
 @app.route('/api/coiffeur/<int:id>/subscribe', methods=['POST', 'DELETE'])
@@ -948,18 +4377,58 @@ def api_subscribe(id):
     if not is_logged_in() or session['user_type'] != 'client':
         return jsonify({'error': 'Unauthorized'}), 403
     
-    sub = Subscription.query.filter_by(client_id=session['user_id'], coiffeur_id=id).first()
+    coiffeur = Coiffeur.query.get(id)
+    if not coiffeur:
+        return jsonify({'error': 'Not found'}), 404
     
+    # Counters are incremented in SQL so concurrent requests don't lose updates
     if request.method == 'POST':
-        if not sub:
+        if not Subscription.query.filter_by(client_id=session['user_id'], coiffeur_id=id).first():
             db.session.add(Subscription(client_id=session['user_id'], coiffeur_id=id))
+            coiffeur.subscriber_count = Coiffeur.subscriber_count + 1
     elif request.method == 'DELETE':
-        if sub:
-            db.session.delete(sub)
+        # Of two concurrent unsubscribes, only the one whose DELETE removed the row decrements
+        deleted = db.session.execute(Subscription.__table__.delete().where(
+            Subscription.client_id == session['user_id'], Subscription.coiffeur_id == id
+        )).rowcount
+        if deleted == 1:
+            coiffeur.subscriber_count = Coiffeur.subscriber_count - 1
             
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Same subscription inserted by a concurrent request
+        db.session.rollback()
     return jsonify({'message': 'Updated'}), 200
 
+@app.route('/api/publications/<int:pub_id>/like', methods=['POST', 'DELETE'])
+def api_like_publication(pub_id):
+    if not is_logged_in() or session['user_type'] != 'client':
+        return jsonify({'error': 'Client login required'}), 403
+
+    pub = Publication.query.get(pub_id)
+    if not pub:
+        return jsonify({'error': 'Not found'}), 404
+
+    if request.method == 'POST':
+        if not PublicationLike.query.filter_by(publication_id=pub_id, client_id=session['user_id']).first():
+            db.session.add(PublicationLike(publication_id=pub_id, client_id=session['user_id']))
+            pub.likes_count = Publication.likes_count + 1
+    else:
+        # Of two concurrent unlikes, only the one whose DELETE removed the row decrements
+        deleted = db.session.execute(PublicationLike.__table__.delete().where(
+            PublicationLike.publication_id == pub_id, PublicationLike.client_id == session['user_id']
+        )).rowcount
+        if deleted == 1:
+            pub.likes_count = Publication.likes_count - 1
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Same like inserted by a concurrent request
+        db.session.rollback()
+    return jsonify({'message': 'Updated', 'likes': Publication.query.get(pub_id).likes_count}), 200
+
 # --- NEW: General Upload Route ---
 @app.route('/api/upload', methods=['POST'])
 def api_upload_file():
@@ -988,17 +4457,86 @@ def api_create_pub():
         return jsonify({'error': 'Unauthorized'}), 403
     
     text = request.form.get('text', '')
-    images = []
-    
-    for file in request.files.getlist('pub_images'):
-        if file and allowed_file(file.filename):
-            # UPDATE: Use S3 upload instead of local save
-            uploaded_url = upload_file_to_s3(file, prefix='pub')
-            if uploaded_url:
-                images.append(uploaded_url)
+    files = [file for file in request.files.getlist('pub_images') if file and allowed_file(file.filename)]
+    images = [url for url in upload_files_to_s3(files, prefix='pub') if url]
             
     pub = Publication(author_id=session['user_id'], text=text, images=json.dumps(images))
     db.session.add(pub)
+    db.session.flush()
+    queue_image_job('publication', pub.id, images)
+    db.session.commit()
+    return jsonify({'message': 'Published', 'id': pub.id}), 201
+
+# --- Direct-to-S3 Uploads ---
+# The browser asks for a presigned POST, uploads the file straight to the
+# bucket, then sends only the resulting key(s) to the API.
+PRESIGN_PREFIXES = {'pub', 'avatar', 'upload'}
+# The signed Content-Type comes from the validated extension, never from the
+# client: the objects are public, and text/html or image/svg+xml served from the
+# bucket would be stored XSS
+UPLOAD_CONTENT_TYPES = {'png': 'image/png', 'jpg': 'image/jpeg', 'jpeg': 'image/jpeg'}
+
+@app.route('/api/uploads/presign', methods=['POST'])
+def api_presign_upload():
+    if not is_logged_in():
+        return jsonify({'error': 'Login required'}), 403
+
+    data = request.get_json() or {}
+    filename = data.get('filename', '')
+    prefix = data.get('prefix', 'upload')
+    if prefix not in PRESIGN_PREFIXES or not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed'}), 400
+    content_type = UPLOAD_CONTENT_TYPES[filename.rsplit('.', 1)[1].lower()]
+
+    key = build_upload_key(filename, prefix)
+    try:
+        post = s3_client.generate_presigned_post(
+            app.config.get('BUCKET_NAME'),
+            key,
+            Fields={'acl': 'public-read', 'Content-Type': content_type},
+            Conditions=[
+                {'acl': 'public-read'},
+                {'Content-Type': content_type},
+                ['content-length-range', 1, MAX_UPLOAD_BYTES]
+            ],
+            ExpiresIn=PRESIGNED_UPLOAD_EXPIRES
+        )
+    except Exception as e:
+        print(f"S3 Presign Error: {e}")
+        S3_ERRORS.labels('presign').inc()
+        return jsonify({'error': 'Upload not available'}), 500
+
+    return jsonify({'url': post['url'], 'fields': post['fields'], 'key': key, 'public_url': s3_public_url(key)}), 200
+
+def validate_uploaded_keys(keys, prefix):
+    """
+    Checks that presigned upload keys belong to the current user and exist in
+    the bucket (HEAD requests run concurrently). Returns an error message or None.
+    """
+    owner_prefix = f"{prefix}_{session['user_id']}_"
+    if not isinstance(keys, list) or not all(isinstance(k, str) and k.startswith(owner_prefix) for k in keys):
+        return 'Invalid upload key'
+    if not all(s3_upload_pool.map(s3_object_exists, keys)):
+        return 'Upload not found'
+    return None
+
+@app.route('/api/publications', methods=['POST'])
+def api_create_pub_from_keys():
+    """Creates a publication from images already uploaded with /api/uploads/presign."""
+    if not is_logged_in() or session['user_type'] != 'coiffeur':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    data = request.get_json() or {}
+    keys = data.get('image_keys', [])
+    error = validate_uploaded_keys(keys, 'pub')
+    if error:
+        return jsonify({'error': error}), 400
+
+    images = [s3_public_url(k) for k in keys]
+    pub = Publication(author_id=session['user_id'], text=data.get('text', ''), images=json.dumps(images))
+    db.session.add(pub)
+    db.session.flush()
+    queue_image_job('publication', pub.id, images)
     db.session.commit()
     return jsonify({'message': 'Published', 'id': pub.id}), 201
 
@@ -1008,6 +4546,17 @@ def api_upload_avatar():
     if not is_logged_in() or session['user_type'] != 'coiffeur':
         return jsonify({'error': 'Unauthorized'}), 403
 
+    # Presigned flow: the file is already in the bucket, only record its key
+    if request.is_json:
+        key = (request.get_json() or {}).get('key')
+        error = validate_uploaded_keys([key], 'avatar')
+        if error:
+            return jsonify({'error': error}), 400
+        coiffeur = Coiffeur.query.get(session['user_id'])
+        coiffeur.set_profile_image(s3_public_url(key))
+        db.session.commit()
+        return jsonify({'message': 'Avatar updated', 'image_url': coiffeur.profile_image}), 200
+
     if 'avatar_file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
         
@@ -1019,7 +4568,7 @@ def api_upload_avatar():
         if uploaded_url:
             # Update user/coiffeur record
             coiffeur = Coiffeur.query.get(session['user_id'])
-            coiffeur.profile_image = uploaded_url
+            coiffeur.set_profile_image(uploaded_url)
             db.session.commit()
             
             return jsonify({'message': 'Avatar updated', 'image_url': uploaded_url}), 200
@@ -1028,6 +4577,40 @@ def api_upload_avatar():
     
     return jsonify({'error': 'Invalid file'}), 400
 
+# --- Operational Endpoints ---
+# Per-worker numbers: gunicorn routes each call to one worker, identified by pid.
+
+def stats_token_valid():
+    """X-Stats-Token header, or a bearer token (what Prometheus scrape configs send)."""
+    token = app.config.get('STATS_TOKEN')
+    auth = request.headers.get('Authorization', '')
+    sent = auth[len('Bearer '):] if auth.startswith('Bearer ') else request.headers.get('X-Stats-Token', '')
+    return bool(token) and secrets.compare_digest(sent, token)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if not stats_token_valid():
+        abort(404)
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+
+@app.route('/api/internal/db-pool', methods=['GET'])
+def api_db_pool_stats():
+    if not stats_token_valid():
+        abort(404)
+    return jsonify({
+        'pid': os.getpid(),
+        'pool': pool_stats.stats(db.engine.pool),
+        'caches': {
+            'stylist_profiles': stylist_profile_cache.stats(),
+            'identities': identity_cache.stats(),
+        },
+    })
+
 # --- Catch-All for React Frontend ---
 
 @app.route('/', defaults={'path': ''})
@@ -0,0 +1,299 @@
+"""
+Benchmarks the hot read endpoints against a large synthetic dataset.
+
+    python benchmark.py                          # SQLite file benchmark.db, full volume
+    python benchmark.py --scale 0.1 --out before.json
+    python benchmark.py --compare before.json --out after.json
+    python benchmark.py --base-url http://127.0.0.1:8000 --concurrency 32
+
+The database comes from DATABASE_URL (or --db, a SQLite file) and is filled by
+generate_dataset() on the first run. Each endpoint is driven sequentially
+through the Flask test client, then by --concurrency threads. With --base-url
+the same load goes over HTTP to a running server (gunicorn, replicas...) instead.
+Results (p50/p95/p99, throughput, SQL statements per request from the
+Server-Timing header) are written as JSON for comparison across commits.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.cookiejar import CookieJar
+
+import numpy as np
+
+ENDPOINTS = ['stylists', 'stylist_detail', 'nearby', 'locations', 'dashboard']
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+# The workload only queries around stylists, so these must always find some
+NEVER_EMPTY = {'nearby', 'locations', 'stylist_detail'}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='benchmark.db', help='SQLite file used when DATABASE_URL is not set.')
+    parser.add_argument('--scale', type=float, default=1.0, help='Fraction of the full dataset volume.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and mode.')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    parser.add_argument('--base-url', help='Drive a running server over HTTP instead of the test client.')
+    parser.add_argument('--out', default='benchmark-results.json')
+    parser.add_argument('--compare', help='Previous results file to print deltas against.')
+    parser.add_argument('--verbose', action='store_true', help="Keep the app's slow SQL log on.")
+    return parser.parse_args()
+
+
+class TestClientSession:
+    """One logged in (or anonymous) visitor, through the Flask test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def login(self, email):
+        self.client.post('/api/auth/login', json={'email': email, 'password': 'password'})
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.headers.get('Server-Timing', ''), response.data
+
+    def post(self, path, payload):
+        return self.client.post(path, json=payload).status_code
+
+
+class HTTPSession:
+    """Same interface over HTTP, keeping the session cookie."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def login(self, email):
+        body = json.dumps({'email': email, 'password': 'password'}).encode()
+        request = urllib.request.Request(self.base_url + '/api/auth/login', data=body, headers={'Content-Type': 'application/json'})
+        self.opener.open(request).read()
+
+    def get(self, path):
+        try:
+            with self.opener.open(self.base_url + path) as response:
+                return response.status, response.headers.get('Server-Timing', ''), response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get('Server-Timing', ''), e.read()
+
+    def post(self, path, payload):
+        request = urllib.request.Request(self.base_url + path, data=json.dumps(payload).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class Workload:
+    """Deterministic request paths drawn from the generated dataset."""
+
+    def __init__(self, app_module, seed):
+        A = app_module
+        with A.app.app_context():
+            self.stylist_ids = [row[0] for row in A.db.session.query(A.Coiffeur.user_id).filter(A.Coiffeur.status == 'active')]
+            self.coiffeur_emails = [row[0] for row in A.db.session.query(A.User.email).filter(A.User.type == 'coiffeur').limit(1000)]
+            # Nearby searches start next to a real stylist, so every one has results
+            self.positions = A.db.session.query(A.Coiffeur.latitude, A.Coiffeur.longitude).filter(
+                A.Coiffeur.status == 'active', A.Coiffeur.latitude.isnot(None), A.Coiffeur.longitude.isnot(None)).all()
+        self.cities = A.SYNTHETIC_CITIES
+        self.categories = A.SYNTHETIC_CATEGORIES[0]
+        self.seed = seed
+
+    def paths(self, endpoint, count, stream):
+        rng = np.random.default_rng([self.seed, ENDPOINTS.index(endpoint), stream])
+        for _ in range(count):
+            if endpoint == 'stylists':
+                city = self.cities[rng.integers(len(self.cities))][0]
+                params = [f"city={city}"] if rng.random() < 0.7 else []
+                if rng.random() < 0.5:
+                    params.append(f"category={self.categories[rng.integers(len(self.categories))]}")
+                if rng.random() < 0.3:
+                    params.append('sort_by=waiting')
+                yield '/api/stylists?' + '&'.join(params + ['limit=24'])
+            elif endpoint == 'stylist_detail':
+                yield f"/api/stylists/{self.stylist_ids[rng.integers(len(self.stylist_ids))]}"
+            elif endpoint == 'nearby':
+                lat, lng = self.positions[rng.integers(len(self.positions))]
+                yield f"/api/coiffeurs/nearby?lat={lat + rng.normal(0, 0.01):.5f}&lon={lng + rng.normal(0, 0.01):.5f}&radius=5"
+            elif endpoint == 'locations':
+                yield '/api/coiffeurs/locations'
+            else:
+                yield '/api/dashboard'
+
+    def login_email(self, endpoint, worker):
+        return self.coiffeur_emails[worker % len(self.coiffeur_emails)] if endpoint == 'dashboard' else None
+
+
+def summarize(latencies, queries, errors, empty, elapsed):
+    ms = np.array(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'empty': empty,
+        'p50_ms': round(float(np.percentile(ms, 50)), 2),
+        'p95_ms': round(float(np.percentile(ms, 95)), 2),
+        'p99_ms': round(float(np.percentile(ms, 99)), 2),
+        'mean_ms': round(float(ms.mean()), 2),
+        'max_ms': round(float(ms.max()), 2),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'queries_per_request': round(float(np.mean(queries)), 2) if queries else None,
+        'max_queries': max(queries) if queries else None,
+    }
+
+
+def run(endpoint, workload, new_session, count, concurrency):
+    """Sends `count` requests from `concurrency` threads (each a separate visitor)."""
+    # Each concurrency level draws its own paths, so it does not only hit caches warmed by the previous run
+    paths = list(workload.paths(endpoint, count + concurrency, concurrency))
+    latencies, queries = [], []
+    errors = empty = 0
+    lock = threading.Lock()
+    local = threading.local()
+    sessions = iter(range(concurrency))
+
+    def one(path):
+        nonlocal errors, empty
+        if not hasattr(local, 'session'):
+            with lock:
+                worker = next(sessions)
+            local.session = new_session()
+            email = workload.login_email(endpoint, worker)
+            if email:
+                local.session.login(email)
+        start = time.perf_counter()
+        status, timing, body = local.session.get(path)
+        latency = time.perf_counter() - start
+        match = QUERIES_RE.search(timing)
+        with lock:
+            latencies.append(latency)
+            errors += status >= 400
+            # An empty result set is fast for the wrong reason
+            empty += status < 400 and body.strip() in (b'[]', b'{}')
+            if match:
+                queries.append(int(match.group(1)))
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        # Warm-up: connection pool, read model snapshot, logins
+        list(pool.map(one, paths[count:]))
+        latencies.clear()
+        queries.clear()
+        errors = empty = 0
+
+        start = time.perf_counter()
+        list(pool.map(one, paths[:count]))
+        elapsed = time.perf_counter() - start
+    return summarize(latencies, queries, errors, empty, elapsed)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results, baseline):
+    print(f"\n{'endpoint':16} {'mode':11} {'p95 ms':>18} {'rps':>18} {'queries':>14}")
+    for endpoint, modes in results['endpoints'].items():
+        for mode, now in modes.items():
+            before = baseline.get('endpoints', {}).get(endpoint, {}).get(mode)
+            if not before:
+                continue
+            delta = (now['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0.0
+            print(
+                f"{endpoint:16} {mode:11} {before['p95_ms']:>7} -> {now['p95_ms']:<7} {delta:+5.0f}% "
+                f"{before['throughput_rps']:>7} -> {now['throughput_rps']:<7} "
+                f"{before['queries_per_request']} -> {now['queries_per_request']}"
+            )
+
+
+def main():
+    args = parse_args()
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.abspath(args.db)}")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as A
+    if not args.verbose:
+        # Under concurrent load every statement waits on the GIL and looks slow
+        A.app.logger.setLevel(logging.ERROR)
+
+    # Full volume (SYNTHETIC_VOLUMES) is 10k stylists, 100k posts, 1M likes, 200k reservations...
+    volumes = {name: int(count * args.scale) for name, count in A.SYNTHETIC_VOLUMES.items()}
+    with A.app.app_context():
+        existing = A.Coiffeur.query.count()
+        if existing < volumes['coiffeurs']:
+            print(f"Generating dataset {volumes} ...")
+            started = time.perf_counter()
+            A.generate_dataset(volumes, seed=args.seed)
+            print(f"Dataset generated in {time.perf_counter() - started:.0f}s")
+        dataset = {table.name: A.db.session.execute(A.db.select(A.func.count()).select_from(table)).scalar()
+                   for table in (A.User.__table__, A.Coiffeur.__table__, A.Publication.__table__,
+                                 A.PublicationLike.__table__, A.Reservation.__table__)}
+        dialect = A.db.engine.dialect.name
+
+    workload = Workload(A, args.seed)
+    if args.base_url:
+        new_session = lambda: HTTPSession(args.base_url)
+    else:
+        new_session = lambda: TestClientSession(A.app)
+
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'database': dialect,
+            'target': args.base_url or 'flask-test-client',
+            'dataset': dataset,
+            'settings': {
+                'requests': args.requests,
+                'concurrency': args.concurrency,
+                'seed': args.seed,
+                'stylist_read_model': A.app.config.get('STYLIST_READ_MODEL'),
+            },
+        },
+        'endpoints': {},
+    }
+    for endpoint in args.endpoints.split(','):
+        results['endpoints'][endpoint] = {
+            'sequential': run(endpoint, workload, new_session, args.requests, 1),
+            'concurrent': run(endpoint, workload, new_session, args.requests, args.concurrency),
+        }
+        for mode, stats in results['endpoints'][endpoint].items():
+            print(
+                f"{endpoint:16} {mode:11} p50 {stats['p50_ms']:>8} p95 {stats['p95_ms']:>8} p99 {stats['p99_ms']:>8} ms"
+                f"  {stats['throughput_rps']:>8} req/s  {stats['queries_per_request']} queries/req  {stats['errors']} errors"
+                f"  {stats['empty']} empty"
+            )
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+
+    empty = [endpoint for endpoint, modes in results['endpoints'].items()
+             if endpoint in NEVER_EMPTY and any(stats['empty'] for stats in modes.values())]
+    if empty:
+        print(f"Empty responses from {', '.join(empty)}: the workload does not exercise the endpoint")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
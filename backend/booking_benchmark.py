@@ -0,0 +1,177 @@
+"""
+Stress test of the booking path: many clients booking at the same instant.
+
+    python booking_benchmark.py                           # SQLite file benchmark.db
+    python booking_benchmark.py --bookings 500 --concurrency 128
+    python booking_benchmark.py --base-url http://127.0.0.1:8000
+
+Scenarios, each fired from --concurrency threads released together:
+  same_slot     every client books the same stylist, day and time
+  hot_stylist   every client books one of --hot-slots times of one stylist
+  spread_slots  every client books a different stylist/time
+
+Every scenario is checked against the database afterwards: each slot must be
+held by exactly one reservation, and the number of 201 responses must match
+the rows written (exactly-once). Results (latency, request and booking
+throughput, conflicts) are written as JSON like benchmark.py.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from benchmark import HTTPSession, TestClientSession, git_commit
+
+SCENARIOS = ['same_slot', 'hot_stylist', 'spread_slots']
+# Only stylists and clients matter here; the other tables get a token volume
+DATASET = {'coiffeurs': 200, 'clients': 1000, 'publications': 10, 'likes': 10, 'publication_comments': 10,
+           'subscriptions': 10, 'reviews': 10, 'reservations': 10, 'deplacement_requests': 10}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='benchmark.db', help='SQLite file used when DATABASE_URL is not set.')
+    parser.add_argument('--bookings', type=int, default=300, help='Booking requests per scenario.')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--hot-slots', type=int, default=8, help='Distinct times offered in hot_stylist.')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--base-url', help='Drive a running server over HTTP instead of the test client.')
+    parser.add_argument('--out', default='booking-benchmark-results.json')
+    parser.add_argument('--verbose', action='store_true', help="Keep the app's slow SQL log on.")
+    return parser.parse_args()
+
+
+def booking_plan(scenario, count, stylist_ids, hot_slots, opens, closes, step):
+    """(stylist id, HH:MM) of each request, on the grid of the opening hours."""
+    per_day = (closes - opens) // step
+
+    def hhmm(slot):
+        minutes = opens + step * slot
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+    if scenario == 'same_slot':
+        return [(stylist_ids[0], hhmm(0))] * count
+    if scenario == 'hot_stylist':
+        return [(stylist_ids[0], hhmm(i % min(hot_slots, per_day))) for i in range(count)]
+    # Every slot of the day per stylist, one request each
+    return [(stylist_ids[i // per_day % len(stylist_ids)], hhmm(i % per_day)) for i in range(count)]
+
+
+def run(scenario, plan, day, sessions, concurrency):
+    """Fires the planned bookings once every session is logged in. Returns statuses, latencies and wall time."""
+    barrier = threading.Barrier(concurrency)
+    results = [None] * len(plan)
+
+    def worker(w):
+        barrier.wait()
+        for i in range(w, len(plan), concurrency):
+            stylist_id, hhmm = plan[i]
+            start = time.perf_counter()
+            status = sessions[i].post('/api/reserve', {'coiffeur_id': stylist_id, 'date': day, 'time': hhmm,
+                                                       'notes': f'booking benchmark {scenario}'})
+            results[i] = (status, time.perf_counter() - start)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return results, time.perf_counter() - started
+
+
+def main():
+    args = parse_args()
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.abspath(args.db)}")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as A
+    if not args.verbose:
+        A.app.logger.setLevel(logging.ERROR)
+
+    with A.app.app_context():
+        if A.Coiffeur.query.filter_by(status='active').count() < 2 or A.User.query.filter_by(type='client').count() < args.bookings:
+            print(f"Generating dataset {DATASET} ...")
+            A.generate_dataset(dict(DATASET, clients=max(DATASET['clients'], args.bookings)))
+        stylist_ids = [row[0] for row in A.db.session.query(A.Coiffeur.user_id).filter(
+            A.Coiffeur.status == 'active').order_by(A.Coiffeur.user_id)]
+        client_emails = [row[0] for row in A.db.session.query(A.User.email).filter(
+            A.User.type == 'client').order_by(A.User.id).limit(args.bookings)]
+        # A future day no earlier run (nor the generated data) booked. Generated
+        # stylists keep the default working hours.
+        last_day = max(A.db.session.query(A.func.max(A.Reservation.date)).scalar() or date.min, A.salon_now().date())
+        (opens, closes), = A.DEFAULT_WORKING_HOURS[0]
+        open_days = set(A.DEFAULT_WORKING_HOURS)
+        step = A.SLOT_STEP_MINUTES
+        dialect = A.db.engine.dialect.name
+
+    new_session = (lambda: HTTPSession(args.base_url)) if args.base_url else (lambda: TestClientSession(A.app))
+    concurrency = min(args.concurrency, args.bookings)
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'git_commit': git_commit(),
+            'database': dialect,
+            'target': args.base_url or 'flask-test-client',
+            'settings': {'bookings': args.bookings, 'concurrency': concurrency, 'hot_slots': args.hot_slots},
+        },
+        'scenarios': {},
+    }
+    failed = False
+    day = last_day
+    for scenario in args.scenarios.split(','):
+        day += timedelta(days=1)
+        while day.weekday() not in open_days:
+            day += timedelta(days=1)
+        plan = booking_plan(scenario, args.bookings, stylist_ids, args.hot_slots, opens, closes, step)
+        # One visitor per request, logged in before the clock starts
+        sessions = [new_session() for _ in plan]
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(lambda pair: pair[0].login(pair[1]), zip(sessions, client_emails)))
+
+        responses, elapsed = run(scenario, plan, day.isoformat(), sessions, concurrency)
+        statuses = [status for status, _ in responses]
+        ms = np.array([latency for _, latency in responses]) * 1000
+        booked, conflicts = statuses.count(201), statuses.count(409)
+
+        with A.app.app_context():
+            rows = A.db.session.query(A.Reservation.coiffeur_id, A.Reservation.time).filter(
+                A.Reservation.date == day,
+                A.Reservation.notes == f'booking benchmark {scenario}').all()
+        expected = len(set(plan))
+        verified = booked == len(rows) == len(set(rows)) == expected and booked + conflicts == len(plan)
+        failed |= not verified
+
+        stats = {
+            'requests': len(plan),
+            'distinct_slots': expected,
+            'booked': booked,
+            'conflicts': conflicts,
+            'errors': len(plan) - booked - conflicts,
+            'rows_written': len(rows),
+            'exactly_once': verified,
+            'p50_ms': round(float(np.percentile(ms, 50)), 2),
+            'p95_ms': round(float(np.percentile(ms, 95)), 2),
+            'p99_ms': round(float(np.percentile(ms, 99)), 2),
+            'max_ms': round(float(ms.max()), 2),
+            'throughput_rps': round(len(plan) / elapsed, 1),
+            'bookings_per_s': round(booked / elapsed, 1),
+        }
+        results['scenarios'][scenario] = stats
+        print(
+            f"{scenario:13} {stats['booked']:>5} booked {stats['conflicts']:>5} conflicts {stats['errors']:>3} errors"
+            f"  p50 {stats['p50_ms']:>8} p95 {stats['p95_ms']:>8} ms  {stats['throughput_rps']:>8} req/s"
+            f"  {stats['bookings_per_s']:>8} bookings/s  {'OK' if verified else 'DOUBLE BOOKED OR LOST'}"
+        )
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -43,11 +43,111 @@ class Config:
         # For other databases like MySQL (local fallback)
         SQLALCHEMY_DATABASE_URI = DATABASE_URL
 
+    # Load the demo dataset (a few dozen stylists around Moroccan cities) into an
+    # empty database on startup. Bigger volumes: `flask generate-data`.
+    SEED_DEMO_DATA = os.environ.get('SEED_DEMO_DATA', 'false').lower() == 'true'
+
+    # --- Read Replica ---
+    # Optional replica that serves the public GET endpoints. Empty: every query
+    # goes to the primary. After a visitor writes, their requests keep reading the
+    # primary for READ_YOUR_WRITES_SECONDS, which must exceed the replication lag.
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    if DATABASE_REPLICA_URL:
+        if DATABASE_REPLICA_URL.startswith('postgres://'):
+            SQLALCHEMY_REPLICA_URI = urlunparse(urlparse(DATABASE_REPLICA_URL)._replace(scheme='postgresql+psycopg2'))
+        elif DATABASE_REPLICA_URL.startswith('postgresql://'):
+            SQLALCHEMY_REPLICA_URI = DATABASE_REPLICA_URL.replace('postgresql://', 'postgresql+psycopg2://', 1)
+        else:
+            SQLALCHEMY_REPLICA_URI = DATABASE_REPLICA_URL
+    else:
+        SQLALCHEMY_REPLICA_URI = None
+    READ_YOUR_WRITES_SECONDS = int(os.environ.get('READ_YOUR_WRITES_SECONDS', 10))
+
+    # --- Connection Pool ---
+    # Each gunicorn worker holds up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections,
+    # so workers * that sum must stay under the server's max_connections.
+    # DB_POOL_TIMEOUT: seconds a request waits for a free connection before failing.
+    # DB_POOL_RECYCLE: seconds after which a connection is replaced, below the
+    # server/proxy idle timeout. DB_POOL_PRE_PING tests connections on checkout so
+    # stale ones are replaced instead of failing the request.
+    # DB_STATEMENT_TIMEOUT_MS: server-side cap per statement (0 disables).
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 15000))
+
+    # --- SQL Accounting ---
+    # SERVER_TIMING adds per-request DB time and statement count to responses.
+    # Statements slower than SQL_SLOW_QUERY_MS are logged (with their EXPLAIN
+    # plan if SQL_EXPLAIN_SLOW_QUERIES), and so are requests running more than
+    # SQL_QUERY_COUNT_WARN statements.
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', 'true').lower() == 'true'
+    SQL_SLOW_QUERY_MS = int(os.environ.get('SQL_SLOW_QUERY_MS', 100))
+    SQL_EXPLAIN_SLOW_QUERIES = os.environ.get('SQL_EXPLAIN_SLOW_QUERIES', 'true').lower() == 'true'
+    SQL_QUERY_COUNT_WARN = int(os.environ.get('SQL_QUERY_COUNT_WARN', 30))
+
+    # Shared secret for /metrics and /api/internal/* operational endpoints, sent
+    # as the X-Stats-Token header or as a bearer token. The endpoints answer 404
+    # while it is unset.
+    STATS_TOKEN = os.environ.get('STATS_TOKEN')
+
     # --- AWS S3 Configuration ---
     AWS_ACCESS_KEY_ID = os.environ.get('AWS_ACCESS_KEY_ID')
     AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
     AWS_REGION = os.environ.get('AWS_REGION', 'eu-north-1') # Default fallback
     BUCKET_NAME = os.environ.get('BUCKET_NAME')
+    # Optional S3 compatible endpoint (moto server, MinIO) for local development
+    AWS_S3_ENDPOINT_URL = os.environ.get('AWS_S3_ENDPOINT_URL')
+    # Threads used to upload the images of one request concurrently
+    S3_UPLOAD_WORKERS = int(os.environ.get('S3_UPLOAD_WORKERS', 4))
+
+    # --- Stylist Read Model ---
+    # Serve /api/stylists, /api/coiffeurs/locations and /api/coiffeurs/nearby from an
+    # in-memory snapshot instead of the database. MAX_AGE (seconds) bounds how long
+    # a worker may miss writes made by other workers before it rebuilds.
+    STYLIST_READ_MODEL = os.environ.get('STYLIST_READ_MODEL', 'true').lower() == 'true'
+    STYLIST_READ_MODEL_MAX_AGE = int(os.environ.get('STYLIST_READ_MODEL_MAX_AGE', 300))
+
+    # --- Stylist Profile Cache ---
+    # LRU cache of the shared part of /api/stylists/<id>. TTL (seconds) bounds
+    # staleness for writes handled by another worker.
+    PROFILE_CACHE_MAX_ENTRIES = int(os.environ.get('PROFILE_CACHE_MAX_ENTRIES', 500))
+    PROFILE_CACHE_TTL = int(os.environ.get('PROFILE_CACHE_TTL', 60))
+
+    # --- Identity Cache ---
+    # Per-worker cache of the /api/me payload. Local writes evict it; TTL
+    # (seconds) bounds staleness for writes handled by another worker. 0 disables it.
+    IDENTITY_CACHE_MAX_ENTRIES = int(os.environ.get('IDENTITY_CACHE_MAX_ENTRIES', 2000))
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL', 30))
+
+    # --- Live Updates ---
+    # /api/live streams. Each worker polls the live_events table every
+    # LIVE_POLL_INTERVAL seconds while it has subscribers and keeps events
+    # LIVE_EVENT_RETENTION seconds for reconnecting clients. LIVE_MAX_SUBSCRIBERS
+    # is per worker: gthread workers (the gunicorn.conf.py default) spend a
+    # thread per stream and gunicorn.conf.py lowers it below GUNICORN_THREADS;
+    # opt-in gevent workers keep this default. Streams past the cap get a 503
+    # and the pages fall back to refetching, then subscribe again later.
+    LIVE_POLL_INTERVAL = float(os.environ.get('LIVE_POLL_INTERVAL', 1.0))
+    LIVE_EVENT_RETENTION = int(os.environ.get('LIVE_EVENT_RETENTION', 600))
+    LIVE_MAX_SUBSCRIBERS = int(os.environ.get('LIVE_MAX_SUBSCRIBERS', 1500))
+
+    # --- Location Write-Behind ---
+    # GPS fixes are buffered per worker and written every LOCATION_FLUSH_INTERVAL
+    # seconds. Fixes closer than LOCATION_MIN_MOVE_METERS to the previous one are
+    # dropped unless LOCATION_REFRESH_SECONDS have passed. Set LOCATION_WRITE_BEHIND
+    # to false to write every fix immediately.
+    LOCATION_WRITE_BEHIND = os.environ.get('LOCATION_WRITE_BEHIND', 'true').lower() == 'true'
+    LOCATION_FLUSH_INTERVAL = float(os.environ.get('LOCATION_FLUSH_INTERVAL', 5.0))
+    LOCATION_MIN_MOVE_METERS = float(os.environ.get('LOCATION_MIN_MOVE_METERS', 25))
+    LOCATION_REFRESH_SECONDS = int(os.environ.get('LOCATION_REFRESH_SECONDS', 60))
+
+    # --- Bookings ---
+    # IANA timezone of the salons' wall clock: reservation dates and times, "today"
+    # and past slots are in this zone, not the server's (often UTC)
+    SALON_TIMEZONE = os.environ.get('SALON_TIMEZONE', 'Africa/Casablanca')
 
 
 # You can define a separate config for production if you want
@@ -55,12 +155,27 @@ class DevelopmentConfig(Config):
     DEBUG = True
     # If using your existing MySQL configuration for local dev, you'd override it here:
     # SQLALCHEMY_DATABASE_URI = 'mysql+pymysql://root:@localhost:3307/myhair'
+    SEED_DEMO_DATA = os.environ.get('SEED_DEMO_DATA', 'true').lower() == 'true'
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 2))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 3))
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+
+class TestingConfig(Config):
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 2))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 0))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 5))
+
+class ProductionConfig(Config):
+    # Sized for 4 workers (2 * CPU on a small instance) against a 100 connection server
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 900))
 
 # A helper dictionary to choose the config based on FLASK_ENV
 config_by_name = {
     'development': DevelopmentConfig,
-    'testing': Config,
-    'production': Config
+    'testing': TestingConfig,
+    'production': ProductionConfig
 }
 
 # Simple function to load the configuration
@@ -0,0 +1,49 @@
+# Loaded automatically by gunicorn when it is started from backend/.
+import os
+
+# Every worker writes its Prometheus samples here; /metrics aggregates them.
+# Set before the workers import the app so prometheus_client picks it up. The
+# queue workers (flask deliver-emails / process-images) must be started with
+# the same PROMETHEUS_MULTIPROC_DIR on this host for their counters to show up.
+prometheus_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/myhair-prometheus')
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def on_starting(server):
+    # Drops the samples of processes gone since the previous run. Files of
+    # running processes (the queue workers) stay: they are still writing them.
+    os.makedirs(prometheus_dir, exist_ok=True)
+    for name in os.listdir(prometheus_dir):
+        pid = os.path.splitext(name)[0].rsplit('_', 1)[-1]
+        if not pid.isdigit() or not process_alive(int(pid)):
+            os.remove(os.path.join(prometheus_dir, name))
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+# /api/live streams stay open as long as a page does. Under the default gthread
+# workers every stream takes one of GUNICORN_THREADS threads, so
+# LIVE_MAX_SUBSCRIBERS defaults to a cap that leaves threads for the API.
+# GUNICORN_WORKER_CLASS=gevent (pip install gevent psycogreen) makes each
+# stream a greenlet instead, up to GUNICORN_WORKER_CONNECTIONS per worker; it
+# also monkeypatches every endpoint and background thread of the app.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 64))
+if worker_class == 'gthread':
+    os.environ.setdefault('LIVE_MAX_SUBSCRIBERS', str(max(threads - 16, 1)))
+elif worker_class == 'gevent':
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 2000))
+
+def post_fork(server, worker):
+    if worker_class == 'gevent' and os.environ.get('DATABASE_URL', '').startswith('postgres'):
+        # Otherwise a PostgreSQL query blocks every greenlet of the worker
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
@@ -0,0 +1,82 @@
+"""
+The app reads its configuration and creates its tables when it is imported, so
+the test database is chosen here, before the first `import app`. Run from
+backend/: python -m pytest tests
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+DB_DIR = tempfile.mkdtemp(prefix='myhair-tests-')
+PRIMARY_DB = os.path.join(DB_DIR, 'primary.db')
+# A second file stands in for the read replica; copy_to_replica "replicates"
+REPLICA_DB = os.path.join(DB_DIR, 'replica.db')
+os.environ.update({
+    'FLASK_ENV': 'testing',
+    'DATABASE_URL': f'sqlite:///{PRIMARY_DB}',
+    'DATABASE_REPLICA_URL': f'sqlite:///{REPLICA_DB}',
+    'SEED_DEMO_DATA': 'false',
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def A():
+    """The app module, on a database brought up to date by `flask upgrade-db`."""
+    result = app_module.app.test_cli_runner().invoke(app_module.upgrade_db_command)
+    assert result.exit_code == 0, result.output
+    yield app_module
+    shutil.rmtree(DB_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def ctx(A):
+    with A.app.app_context():
+        yield
+        A.db.session.rollback()
+
+
+@pytest.fixture
+def copy_to_replica(A, ctx):
+    """Replaces the replica file by a copy of the primary."""
+    def copy():
+        A.db.session.commit()
+        primary, replica = sqlite3.connect(PRIMARY_DB), sqlite3.connect(REPLICA_DB)
+        with replica:
+            primary.backup(replica)
+        primary.close()
+        replica.close()
+        A.db.engines['replica'].dispose()
+    return copy
+
+
+@pytest.fixture
+def make_client(A, ctx):
+    def make(**fields):
+        user = A.User(name='Client', email=f'client-{A.secrets.token_hex(6)}@example.com', password='x',
+                      type='client', city='Rabat', is_confirmed=True, **fields)
+        A.db.session.add(user)
+        A.db.session.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def make_stylist(A, ctx):
+    def make(category='Homme', latitude=34.02, longitude=-6.84, **fields):
+        user = A.User(name='Salon', email=f'salon-{A.secrets.token_hex(6)}@example.com', password='x',
+                      type='coiffeur', city='Rabat', is_confirmed=True)
+        A.db.session.add(user)
+        A.db.session.flush()
+        stylist = A.Coiffeur(user_id=user.id, category=category, status='active', **fields)
+        stylist.set_location(latitude, longitude)
+        A.db.session.add(stylist)
+        A.db.session.commit()
+        return stylist
+    return make
@@ -0,0 +1,80 @@
+from datetime import date, time
+
+import pytest
+
+MOBILE = 'Déplacé'
+KM = 1 / 111.2  # degrees of latitude
+
+
+@pytest.fixture
+def make_request(A, make_client):
+    client = make_client()
+
+    def make(lat, lng):
+        req = A.DeplacementRequest(client_id=client.id, service_requested='Coupe', client_location='Agadir',
+                                   latitude=lat, longitude=lng, preferred_date=date(2030, 1, 7),
+                                   preferred_time=time(10, 0), status='Pending')
+        A.db.session.add(req)
+        A.db.session.flush()
+        A.match_deplacement_request(req)
+        A.db.session.commit()
+        return req.id
+    return make
+
+
+def inbox(A, stylist_id):
+    return {row[0] for row in A.db.session.query(A.DeplacementMatch.request_id).filter_by(coiffeur_id=stylist_id)}
+
+
+def test_stylist_is_rematched_when_radius_category_or_position_change(A, make_stylist, make_request):
+    stylist = make_stylist(category=MOBILE, latitude=30.0, longitude=-9.0, service_radius_km=5)
+    far = make_request(30.0 + 8 * KM, -9.0)
+    assert far not in inbox(A, stylist.user_id)
+
+    stylist.service_radius_km = 10
+    A.db.session.commit()
+    assert far in inbox(A, stylist.user_id)
+
+    stylist.category = 'Homme'
+    A.db.session.commit()
+    assert far not in inbox(A, stylist.user_id)
+
+    stylist.category = MOBILE
+    stylist.service_radius_km = 5
+    A.db.session.commit()
+    assert far not in inbox(A, stylist.user_id)
+
+    stylist.set_location(30.0 + 6 * KM, -9.0)
+    A.db.session.commit()
+    assert far in inbox(A, stylist.user_id)
+
+
+def test_buffered_move_rematches_on_flush(A, make_stylist, make_request):
+    stylist = make_stylist(category=MOBILE, latitude=31.0, longitude=-8.0, service_radius_km=5)
+    far = make_request(31.0 + 20 * KM, -8.0)
+    assert far not in inbox(A, stylist.user_id)
+
+    A.location_buffer.submit(stylist.user_id, 31.0 + 18 * KM, -8.0)
+    A.location_buffer.flush()
+    A.db.session.expire_all()
+    assert far in inbox(A, stylist.user_id)
+
+
+def test_rebuild_keeps_requests_created_meanwhile(A, make_stylist, make_request, monkeypatch):
+    stylist = make_stylist(category=MOBILE, latitude=32.0, longitude=-7.0, service_radius_km=10)
+    before = make_request(32.0, -7.0)
+    created = []
+    positions = A.location_buffer.positions
+
+    def create_request_during_rebuild():
+        # Runs between the rebuild's reads and its writes
+        if not created:
+            created.append(None)
+            created[0] = make_request(32.0 + KM, -7.0)
+        return positions()
+    monkeypatch.setattr(A.location_buffer, 'positions', create_request_during_rebuild)
+    A.rebuild_deplacement_inbox()
+    monkeypatch.undo()
+
+    A.db.session.expire_all()
+    assert {before, created[0]} <= inbox(A, stylist.user_id)
@@ -0,0 +1,106 @@
+import smtplib
+from datetime import datetime, timedelta
+
+import pytest
+
+
+class FakeSMTP:
+    """Stands in for smtplib.SMTP_SSL: records connections and the messages sent."""
+    connections = []
+    refused = set()
+    down = False
+
+    def __init__(self, host, port):
+        if FakeSMTP.down:
+            raise ConnectionRefusedError(f'{host}:{port}')
+        self.sent = []
+        self.closed = False
+        FakeSMTP.connections.append(self)
+
+    def set_debuglevel(self, level):
+        pass
+
+    def login(self, username, password):
+        pass
+
+    def sendmail(self, sender, recipients, message, mail_options=(), rcpt_options=()):
+        if set(recipients) & FakeSMTP.refused:
+            raise smtplib.SMTPRecipientsRefused({r: (550, b'No such user') for r in recipients})
+        self.sent.append((recipients, message))
+
+    def quit(self):
+        self.closed = True
+
+
+@pytest.fixture
+def smtp(A, ctx, monkeypatch):
+    monkeypatch.setattr(smtplib, 'SMTP_SSL', FakeSMTP)
+    monkeypatch.setattr(smtplib, 'SMTP', FakeSMTP)
+    # TESTING suppresses Flask-Mail sends; the fake server takes them instead
+    monkeypatch.setattr(A.app.extensions['mail'], 'suppress', False)
+    monkeypatch.setattr(FakeSMTP, 'connections', [])
+    monkeypatch.setattr(FakeSMTP, 'refused', set())
+    monkeypatch.setattr(FakeSMTP, 'down', False)
+    A.EmailOutbox.query.delete()
+    A.db.session.commit()
+    return FakeSMTP
+
+
+def queue(A, *recipients):
+    for recipient in recipients:
+        A.queue_email(recipient, 'Subject', f'Hello {recipient}')
+    A.db.session.commit()
+
+
+def test_signup_queues_the_email_without_smtp(A, smtp):
+    response = A.app.test_client().post('/api/auth/signup/client', json={
+        'name': 'New', 'email': 'new-client@example.com', 'password': 'x', 'city': 'Rabat'})
+    assert response.status_code == 201
+    assert smtp.connections == []
+    row, = A.EmailOutbox.query.all()
+    assert (row.recipient, row.status) == ('new-client@example.com', 'pending')
+    assert 'CODE:' in row.body
+
+
+def test_one_connection_per_batch(A, smtp):
+    queue(A, 'a@example.com', 'b@example.com', 'c@example.com')
+    assert A.deliver_outbox(batch_size=2) == (2, 0)
+    assert A.deliver_outbox(batch_size=2) == (1, 0)
+    assert A.deliver_outbox(batch_size=2) == (0, 0)
+
+    assert [len(conn.sent) for conn in smtp.connections] == [2, 1]
+    assert all(conn.closed for conn in smtp.connections)
+    assert {row.status for row in A.EmailOutbox.query} == {'sent'}
+
+
+def test_rejected_email_is_retried_with_backoff(A, smtp):
+    smtp.refused = {'bounce@example.com'}
+    queue(A, 'ok@example.com', 'bounce@example.com')
+    started = datetime.utcnow()
+    assert A.deliver_outbox() == (1, 1)
+
+    row = A.EmailOutbox.query.filter_by(recipient='bounce@example.com').one()
+    assert (row.status, row.attempts) == ('pending', 1)
+    assert 'No such user' in row.last_error
+    delay = timedelta(seconds=A.QUEUE_RETRY_BASE_SECONDS)
+    assert started + delay <= row.next_attempt_at <= datetime.utcnow() + delay
+    # Not due yet
+    assert A.deliver_outbox() == (0, 0)
+
+
+def test_connection_failure_retries_the_batch(A, smtp):
+    smtp.down = True
+    queue(A, 'a@example.com', 'b@example.com')
+    assert A.deliver_outbox() == (0, 2)
+    for attempt in range(2, A.EMAIL_MAX_ATTEMPTS + 1):
+        A.EmailOutbox.query.update({'next_attempt_at': datetime.utcnow()})
+        A.db.session.commit()
+        started = datetime.utcnow()
+        assert A.deliver_outbox() == (0, 2)
+        rows = A.EmailOutbox.query.all()
+        assert {row.attempts for row in rows} == {attempt}
+        if attempt < A.EMAIL_MAX_ATTEMPTS:
+            # The delay doubles after every failed attempt
+            delay = timedelta(seconds=A.QUEUE_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+            assert all(row.next_attempt_at >= started + delay for row in rows)
+    assert {row.status for row in A.EmailOutbox.query} == {'failed'}
@@ -0,0 +1,16 @@
+from datetime import datetime, timedelta
+
+
+def test_flush_forgets_stylists_who_stopped_sending(A, ctx, make_stylist):
+    buffer = A.LocationBuffer(flush_interval=3600, min_move_meters=25, refresh_seconds=60)
+    quiet, active = make_stylist(), make_stylist()
+    assert buffer.submit(quiet.user_id, 34.02, -6.84)
+    assert buffer.submit(active.user_id, 34.03, -6.85)
+    lat, lng, _ = buffer._accepted[quiet.user_id]
+    buffer._accepted[quiet.user_id] = (lat, lng, datetime.utcnow() - timedelta(seconds=61))
+
+    assert buffer.flush() == 2
+    assert set(buffer._accepted) == {active.user_id}
+    # The distance check still applies to the stylist who keeps sending
+    assert not buffer.submit(active.user_id, 34.03, -6.85)
+    assert buffer.submit(quiet.user_id, 34.02, -6.84)
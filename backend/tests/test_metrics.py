@@ -0,0 +1,26 @@
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy.exc import OperationalError
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_integrity_errors_are_conflicts_not_db_errors(A, ctx):
+    conflicts, errors = sample('db_conflicts_total'), sample('db_errors_total', error='IntegrityError')
+    insert = A.text('INSERT INTO slot_claims (coiffeur_id, date, slot, reservation_id) VALUES (1, :day, 600, 1)')
+    with A.db.engine.connect() as conn:
+        conn.execute(insert, {'day': '2030-01-07'})
+        with pytest.raises(A.IntegrityError):
+            conn.execute(insert, {'day': '2030-01-07'})
+        conn.rollback()
+    assert sample('db_conflicts_total') == conflicts + 1
+    assert sample('db_errors_total', error='IntegrityError') == errors
+
+
+def test_other_database_errors_are_counted(A, ctx):
+    errors = sample('db_errors_total', error='OperationalError')
+    with A.db.engine.connect() as conn, pytest.raises(OperationalError):
+        conn.execute(A.text('SELECT * FROM no_such_table'))
+    assert sample('db_errors_total', error='OperationalError') == errors + 1
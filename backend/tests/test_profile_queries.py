@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+from flask import g, session
+
+
+def add_publications(A, stylist, viewer, count):
+    for i in range(count):
+        pub = A.Publication(author_id=stylist.user_id, text=f'post {i}', images='[]',
+                            created_at=datetime(2024, 1, 1) + timedelta(hours=i))
+        A.db.session.add(pub)
+        A.db.session.flush()
+        A.db.session.add(A.PublicationLike(publication_id=pub.id, client_id=viewer.id))
+        for j in range(2):
+            A.db.session.add(A.PublicationComment(publication_id=pub.id, client_id=viewer.id, comment_text=f'comment {j}'))
+    A.db.session.commit()
+
+
+def profile_statements(A, stylist_id, viewer):
+    """SQL statements run by get_coiffeur_data and the profile serialization, counted by the engine hooks."""
+    A.db.session.expire_all()
+    with A.app.test_request_context(f'/api/stylists/{stylist_id}'):
+        session['user_id'] = viewer.id
+        session['user_type'] = viewer.type
+        g.sql_stats = A.RequestSQLStats()
+        data = A.get_coiffeur_data(stylist_id)
+        A.serialize_stylist_profile(data)
+        return g.sql_stats.count, len(data['publications'])
+
+
+def test_profile_statement_count_does_not_grow_with_publications(A, make_stylist, make_client):
+    viewer = make_client()
+    one, many = make_stylist(), make_stylist()
+    add_publications(A, one, viewer, 1)
+    add_publications(A, many, viewer, 6)
+
+    one_count, one_pubs = profile_statements(A, one.user_id, viewer)
+    many_count, many_pubs = profile_statements(A, many.user_id, viewer)
+    assert (one_pubs, many_pubs) == (1, 6)
+    assert one_count == many_count
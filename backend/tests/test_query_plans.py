@@ -0,0 +1,23 @@
+import re
+
+# SQLite plan steps that read through an index: a named or covering index, the
+# rowid, or the full-text index of a virtual table
+INDEXED_STEP = re.compile(r'USING (COVERING )?INDEX|USING INTEGER PRIMARY KEY|VIRTUAL TABLE INDEX')
+
+
+def test_hot_queries_use_indexes(A, ctx):
+    unindexed = {}
+    with A.db.engine.connect() as conn:
+        for name, stmt in A.hot_queries().items():
+            plan = A.explain_query(conn, stmt)
+            steps = [step for step in plan if step.startswith(('SEARCH ', 'SCAN '))]
+            if not steps or A.full_scans(plan) or not all(INDEXED_STEP.search(step) for step in steps) \
+                    or not any('INDEX' in step for step in steps):
+                unindexed[name] = plan
+    assert not unindexed, unindexed
+
+
+def test_search_index_created_by_upgrade_db(A, ctx):
+    assert A.search_index_ready()
+    plan = A.explain_query(A.db.session.connection(), A.search_query(['coupe']))
+    assert any('VIRTUAL TABLE INDEX' in step for step in plan), plan
@@ -0,0 +1,36 @@
+def login(A, user):
+    client = A.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user.id
+        session['user_type'] = user.type
+    return client
+
+
+def comments(client, pub_id):
+    response = client.get(f'/api/publications/{pub_id}/comments')
+    assert response.status_code == 200
+    return [c['text'] for c in response.get_json()['comments']]
+
+
+def test_gets_read_the_replica_except_after_a_write(A, make_stylist, make_client, copy_to_replica, monkeypatch):
+    stylist = make_stylist()
+    pub = A.Publication(author_id=stylist.user_id, text='before', images='[]')
+    A.db.session.add(pub)
+    A.db.session.commit()
+    writer, reader = make_client(), make_client()
+    copy_to_replica()
+
+    writer_http = login(A, writer)
+    response = writer_http.post(f'/api/publications/{pub.id}/comments', json={'text': 'only on the primary'})
+    assert response.status_code == 201
+
+    # The writer reads the primary for READ_YOUR_WRITES_SECONDS, everyone else the replica
+    assert comments(writer_http, pub.id) == ['only on the primary']
+    assert comments(login(A, reader), pub.id) == []
+    assert comments(A.app.test_client(), pub.id) == []
+
+    monkeypatch.setitem(A.app.config, 'READ_YOUR_WRITES_SECONDS', 0)
+    assert comments(writer_http, pub.id) == []
+
+    copy_to_replica()
+    assert comments(A.app.test_client(), pub.id) == ['only on the primary']
@@ -0,0 +1,77 @@
+from datetime import date, time, timedelta
+
+
+def next_monday():
+    day = date.today() + timedelta(days=1)
+    return day + timedelta(days=-day.weekday() % 7)
+
+
+def login(A, client):
+    http = A.app.test_client()
+    with http.session_transaction() as session:
+        session['user_id'] = client.id
+        session['user_type'] = 'client'
+    return http
+
+
+def reserve(A, client, stylist, hhmm, service=None):
+    return login(A, client).post('/api/reserve', json={
+        'coiffeur_id': stylist.user_id, 'date': next_monday().isoformat(), 'time': hhmm,
+        'service_id': service.id if service else None})
+
+
+def add_service(A, stylist, minutes):
+    service = A.Service(coiffeur_id=stylist.user_id, service_name=f'{minutes} min', price=100, duration_minutes=minutes)
+    A.db.session.add(service)
+    A.db.session.commit()
+    return service
+
+
+def claimed_slots(A, stylist):
+    return sorted(A.db.session.query(A.SlotClaim.slot, A.SlotClaim.reservation_id).filter_by(coiffeur_id=stylist.user_id))
+
+
+def test_same_slot_is_booked_once(A, make_stylist, make_client):
+    stylist = make_stylist()
+    first = reserve(A, make_client(), stylist, '10:00')
+    assert first.status_code == 201
+    second = reserve(A, make_client(), stylist, '10:00')
+    assert second.status_code == 409
+    assert A.Reservation.query.filter_by(coiffeur_id=stylist.user_id).count() == 1
+    assert claimed_slots(A, stylist) == [(600, first.get_json()['id'])]
+
+
+def test_longer_service_overlapping_a_claim_is_refused(A, make_stylist, make_client):
+    stylist = make_stylist()
+    short, long = add_service(A, stylist, 30), add_service(A, stylist, 90)
+    booked = reserve(A, make_client(), stylist, '11:00', short)
+    assert booked.status_code == 201
+
+    # 10:00-11:30 covers the 11:00 cell, 9:00-10:30 does not
+    assert reserve(A, make_client(), stylist, '10:00', long).status_code == 409
+    assert reserve(A, make_client(), stylist, '09:00', long).status_code == 201
+    assert [slot for slot, _ in claimed_slots(A, stylist)] == [540, 570, 600, 660]
+    assert reserve(A, make_client(), stylist, '10:00', short).status_code == 409
+
+
+def test_claims_are_backfilled_for_existing_reservations(A, make_stylist, make_client):
+    stylist, client = make_stylist(), make_client()
+    long = add_service(A, stylist, 60)
+    day = next_monday()
+    # Written as before slot_claims existed: no claims. The second overlaps the
+    # first, which is older and keeps the slot
+    rows = [
+        A.Reservation(client_id=client.id, coiffeur_id=stylist.user_id, date=day, time=time(10), service_id=long.id,
+                      status='Confirmed'),
+        A.Reservation(client_id=client.id, coiffeur_id=stylist.user_id, date=day, time=time(10, 30), status='Pending'),
+        A.Reservation(client_id=client.id, coiffeur_id=stylist.user_id, date=day, time=time(14), status='Pending'),
+        A.Reservation(client_id=client.id, coiffeur_id=stylist.user_id, date=day, time=time(16), status='Cancelled'),
+    ]
+    A.db.session.add_all(rows)
+    A.db.session.commit()
+
+    assert A.claim_existing_reservations() == 3
+    assert claimed_slots(A, stylist) == [(600, rows[0].id), (630, rows[0].id), (840, rows[2].id)]
+    assert A.claim_existing_reservations() == 0
+    assert reserve(A, make_client(), stylist, '10:30').status_code == 409
+    assert reserve(A, make_client(), stylist, '16:00').status_code == 201
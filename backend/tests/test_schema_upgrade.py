@@ -0,0 +1,27 @@
+import pytest
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+
+@pytest.mark.parametrize('dialect, ddl', [
+    (sqlite.dialect(), 'working_hours_set BOOLEAN DEFAULT 0'),
+    (postgresql.dialect(), 'working_hours_set BOOLEAN DEFAULT false'),
+    (mysql.dialect(), 'working_hours_set BOOL DEFAULT false'),
+])
+def test_added_column_default_is_rendered_for_the_dialect(A, dialect, ddl):
+    assert A.added_column_ddl(A.Coiffeur.__table__.c.working_hours_set, dialect) == ddl
+
+
+def test_text_defaults_are_quoted(A):
+    column = A.Coiffeur.__table__.c.service_radius_km
+    assert A.added_column_ddl(column, postgresql.dialect()) == "service_radius_km FLOAT DEFAULT '10'"
+
+
+def test_upgrade_schema_adds_missing_columns_with_their_default(A, ctx, make_stylist):
+    stylist = make_stylist()
+    with A.db.engine.begin() as conn:
+        conn.exec_driver_sql('ALTER TABLE coiffeurs DROP COLUMN working_hours_set')
+    assert ('coiffeurs', 'working_hours_set') in A.upgrade_schema()
+    with A.db.engine.connect() as conn:
+        value = conn.exec_driver_sql('SELECT working_hours_set FROM coiffeurs WHERE user_id = ?',
+                                     (stylist.user_id,)).scalar()
+    assert value == 0
@@ -0,0 +1,48 @@
+import pytest
+
+
+def make_rated(A, make_stylist, rating):
+    stylist = make_stylist()
+    # The column default fills in an explicit None on insert
+    A.db.session.execute(A.db.update(A.Coiffeur).where(A.Coiffeur.user_id == stylist.user_id).values(rating=rating))
+    A.db.session.commit()
+    return stylist
+
+
+def all_pages(A, **params):
+    ids, cursor = [], None
+    http = A.app.test_client()
+    while True:
+        response = http.get('/api/stylists', query_string=dict(params, limit=2, **({'cursor': cursor} if cursor else {})))
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        ids += [s['id'] for s in body['stylists']]
+        cursor = body['next_cursor']
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize('read_model', [False, True])
+@pytest.mark.parametrize('sort_by', ['rating', 'waiting'])
+def test_pages_return_every_stylist_once(A, make_stylist, copy_to_replica, monkeypatch, read_model, sort_by):
+    for rating in (None, 4.0, None, 4.0, 3.5, None, 5.0):
+        make_rated(A, make_stylist, rating)
+    copy_to_replica()
+    monkeypatch.setitem(A.app.config, 'STYLIST_READ_MODEL', read_model)
+    A.stylist_read_model.invalidate()
+
+    active = {row[0] for row in A.db.session.query(A.Coiffeur.user_id).filter(A.Coiffeur.status == 'active')}
+    ids = all_pages(A, sort_by=sort_by)
+    assert len(ids) == len(set(ids))
+    assert set(ids) == active
+
+
+def test_unrated_stylists_come_last(A, make_stylist, copy_to_replica):
+    unrated = make_rated(A, make_stylist, None)
+    make_rated(A, make_stylist, 1.0)
+    copy_to_replica()
+    ids = all_pages(A)
+    assert unrated.user_id in ids
+    ratings = dict(A.db.session.query(A.Coiffeur.user_id, A.Coiffeur.rating))
+    unrated_flags = [ratings[i] is None for i in ids]
+    assert unrated_flags == sorted(unrated_flags)
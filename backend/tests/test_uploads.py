@@ -0,0 +1,94 @@
+import io
+import threading
+
+import boto3
+import pytest
+import requests
+from moto import mock_aws
+from werkzeug.datastructures import FileStorage
+
+BUCKET = 'myhair-test-uploads'
+
+
+@pytest.fixture
+def s3(A, ctx, monkeypatch):
+    """A moto bucket behind the app's s3_client."""
+    for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN'):
+        monkeypatch.setenv(name, 'testing')
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        monkeypatch.setattr(A, 's3_client', client)
+        monkeypatch.setitem(A.app.config, 'BUCKET_NAME', BUCKET)
+        monkeypatch.setitem(A.app.config, 'AWS_REGION', 'us-east-1')
+        yield client
+
+
+def login(A, user_id, user_type='coiffeur'):
+    http = A.app.test_client()
+    with http.session_transaction() as session:
+        session['user_id'] = user_id
+        session['user_type'] = user_type
+    return http
+
+
+def test_files_upload_in_parallel(A, s3, make_stylist, monkeypatch):
+    stylist = make_stylist()
+    files = [FileStorage(io.BytesIO(f'image {i}'.encode()), filename=f'photo{i}.jpg', content_type='image/jpeg')
+             for i in range(3)]
+    # Each upload waits until all three are in flight: a serial upload times out
+    in_flight = threading.Barrier(len(files), timeout=5)
+    upload = s3.upload_fileobj
+
+    def upload_together(*args, **kwargs):
+        in_flight.wait()
+        return upload(*args, **kwargs)
+    monkeypatch.setattr(s3, 'upload_fileobj', upload_together)
+
+    with A.app.test_request_context():
+        A.session['user_id'] = stylist.user_id
+        urls = A.upload_files_to_s3(files, prefix='pub')
+
+    assert None not in urls
+    for i, url in enumerate(urls):
+        key = url.rsplit('/', 1)[-1]
+        assert key.startswith(f'pub_{stylist.user_id}_') and key.endswith(f'_photo{i}.jpg')
+        obj = s3.get_object(Bucket=BUCKET, Key=key)
+        assert (obj['Body'].read(), obj['ContentType']) == (f'image {i}'.encode(), 'image/jpeg')
+
+
+@pytest.mark.parametrize('filename, content_type', [('photo.PNG', 'image/png'), ('photo.jpeg', 'image/jpeg')])
+def test_presign_signs_the_content_type_of_the_extension(A, s3, make_stylist, filename, content_type):
+    stylist = make_stylist()
+    response = login(A, stylist.user_id).post('/api/uploads/presign', json={
+        'filename': filename, 'prefix': 'pub', 'content_type': 'text/html'})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['fields']['Content-Type'] == content_type
+    assert body['key'].startswith(f'pub_{stylist.user_id}_')
+
+
+def test_presign_refuses_other_file_types(A, s3, make_stylist):
+    http = login(A, make_stylist().user_id)
+    assert http.post('/api/uploads/presign', json={'filename': 'page.svg', 'prefix': 'pub'}).status_code == 400
+    assert http.post('/api/uploads/presign', json={'filename': 'a.png', 'prefix': 'other'}).status_code == 400
+
+
+def test_publication_from_presigned_keys(A, s3, make_stylist):
+    stylist, other = make_stylist(), make_stylist()
+    http = login(A, stylist.user_id)
+    presigned = http.post('/api/uploads/presign', json={'filename': 'cut.png', 'prefix': 'pub'}).get_json()
+    uploaded = requests.post(presigned['url'], data=presigned['fields'], files={'file': ('cut.png', b'png bytes')})
+    assert uploaded.ok
+
+    # Someone else's key, or a key that was never uploaded
+    other_key = presigned['key'].replace(f'pub_{stylist.user_id}_', f'pub_{other.user_id}_')
+    response = http.post('/api/publications', json={'text': 'x', 'image_keys': [other_key]})
+    assert response.status_code == 400 and response.get_json()['error'] == 'Invalid upload key'
+    response = http.post('/api/publications', json={'text': 'x', 'image_keys': [presigned['key'] + '.missing']})
+    assert response.status_code == 400 and response.get_json()['error'] == 'Upload not found'
+
+    response = http.post('/api/publications', json={'text': 'fresh cut', 'image_keys': [presigned['key']]})
+    assert response.status_code == 201
+    pub = A.db.session.get(A.Publication, response.get_json()['id'])
+    assert pub.images == f'["{presigned["public_url"]}"]'
@@ -0,0 +1,74 @@
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+
+def login(A, stylist):
+    client = A.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = stylist.user_id
+        session['user_type'] = 'coiffeur'
+    return client
+
+
+def next_monday():
+    day = date.today() + timedelta(days=1)
+    return day + timedelta(days=-day.weekday() % 7)
+
+
+def open_slots(A, stylist_id):
+    # Straight from the primary: the availability endpoint reads the replica
+    return sum(len(slots) for _, slots in A.compute_availability(stylist_id, next_monday(), 7, A.SLOT_DEFAULT_DURATION))
+
+
+def test_default_hours_until_set(A, make_stylist):
+    stylist = make_stylist()
+    assert A.working_hours_for(stylist.user_id) == A.DEFAULT_WORKING_HOURS
+    assert open_slots(A, stylist.user_id) > 0
+
+
+def test_saving_no_hours_closes_the_salon(A, make_stylist, make_client):
+    stylist = make_stylist()
+    http = login(A, stylist)
+    response = http.put('/api/coiffeur/working-hours', json={'hours': [{'weekday': 0, 'opens': '10:00', 'closes': '12:00'}]})
+    assert response.get_json()['hours'] == [{'weekday': 0, 'opens': '10:00', 'closes': '12:00'}]
+
+    response = http.put('/api/coiffeur/working-hours', json={'hours': []})
+    assert response.status_code == 200
+    assert response.get_json()['hours'] == []
+    assert open_slots(A, stylist.user_id) == 0
+
+    client = make_client()
+    booking = A.app.test_client()
+    with booking.session_transaction() as session:
+        session['user_id'] = client.id
+        session['user_type'] = 'client'
+    response = booking.post('/api/reserve', json={'coiffeur_id': stylist.user_id, 'date': next_monday().isoformat(),
+                                                  'time': '10:00'})
+    assert response.status_code == 400, response.get_json()
+    assert response.get_json()['error'] == 'The salon is not open for this slot'
+
+
+def test_today_is_the_salons_date(A, make_stylist, copy_to_replica, monkeypatch):
+    stylist = make_stylist()
+    copy_to_replica()
+    # 25 hours apart: never the same date, so at most one can match the server's
+    for zone in ('Pacific/Kiritimati', 'Pacific/Pago_Pago'):
+        monkeypatch.setitem(A.app.config, 'SALON_TIMEZONE', zone)
+        response = A.app.test_client().get(f'/api/stylists/{stylist.user_id}/availability?days=1')
+        assert response.get_json()['days'][0]['date'] == datetime.now(ZoneInfo(zone)).date().isoformat()
+
+
+def test_past_slots_follow_the_salon_clock(A, make_stylist, make_client, monkeypatch):
+    stylist = make_stylist()
+    A.db.session.add_all(A.WorkingHours(coiffeur_id=stylist.user_id, weekday=weekday, opens_at=time(0),
+                                        closes_at=time(23, 30)) for weekday in range(7))
+    A.db.session.commit()
+    monkeypatch.setitem(A.app.config, 'SALON_TIMEZONE', 'Pacific/Kiritimati')
+    yesterday = A.salon_now().date() - timedelta(days=1)
+    with pytest.raises(ValueError, match='in the past'):
+        A.book_reservation(make_client().id, stylist.user_id, yesterday, time(23))
+    now = A.salon_now()
+    (_, slots), = A.compute_availability(stylist.user_id, now.date(), 1, A.SLOT_DEFAULT_DURATION)
+    assert all(start >= A.minutes_of(now) for start in slots)
@@ -14,6 +14,7 @@ import Button3D from '../UI/Button3D';
 const CoiffeurDashboard = ({ user, onNavigate }) => {
   const [stats, setStats] = useState(null); 
   const [reservations, setReservations] = useState([]);
+  const [reservationsCursor, setReservationsCursor] = useState(null);
   const [menuItems, setMenuItems] = useState([]);
   const [activeTab, setActiveTab] = useState('overview');
   const isLeafletLoaded = useLeaflet();
@@ -41,10 +42,24 @@ const CoiffeurDashboard = ({ user, onNavigate }) => {
     fetch(`${import.meta.env.VITE_API_URL || ''}/api/coiffeur/${user.id}/reservations`)
       .then(res => res.json())
       .then(data => {
-        if(Array.isArray(data)) setReservations(data);
+        if(Array.isArray(data.reservations)) {
+          setReservations(data.reservations);
+          setReservationsCursor(data.next_cursor);
+        }
       });
   }, [user]);
 
+  const loadMoreReservations = () => {
+    fetch(`${import.meta.env.VITE_API_URL || ''}/api/coiffeur/${user.id}/reservations?cursor=${reservationsCursor}`)
+      .then(res => res.json())
+      .then(data => {
+        if(Array.isArray(data.reservations)) {
+          setReservations(prev => [...prev, ...data.reservations]);
+          setReservationsCursor(data.next_cursor);
+        }
+      });
+  };
+
   const handleImageUpload = async (e) => {
     const file = e.target.files[0];
     if (!file) return;
@@ -688,6 +703,14 @@ const CoiffeurDashboard = ({ user, onNavigate }) => {
                       <p className="text-sm text-gray-600">New bookings will appear here</p>
                     </div>
                   )}
+                  {reservationsCursor && (
+                    <button
+                      onClick={loadMoreReservations}
+                      className="w-full py-3 rounded-xl bg-black/30 border border-white/5 text-sm font-bold text-pink-400 hover:border-pink-500/30 transition-all"
+                    >
+                      Load more
+                    </button>
+                  )}
                 </div>
               </GlassCard>
 
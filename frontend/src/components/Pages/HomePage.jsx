@@ -21,10 +21,10 @@ const HomePage = ({ onNavigate }) => {
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-    fetch(`${import.meta.env.VITE_API_URL || ''}/api/stylists`)
+    fetch(`${import.meta.env.VITE_API_URL || ''}/api/stylists?limit=4`)
       .then(res => res.json())
       .then(data => {
-        setStylists(Array.isArray(data) ? data : []);
+        setStylists(Array.isArray(data.stylists) ? data.stylists : []);
         setLoading(false);
       })
       .catch(err => {
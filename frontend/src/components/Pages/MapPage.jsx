@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { 
   MapPin, 
   Loader, 
@@ -16,21 +16,83 @@ import { useLeaflet } from '../../hooks/useLeaflet';
 import GlassCard from '../UI/GlassCard';
 import Button3D from '../UI/Button3D';
 
+// A stream the server refused (503 at capacity) is not retried by the browser
+const LIVE_FALLBACK_RETRY_MS = 15000;
+
 const MapPage = ({ onNavigate }) => {
   const isLeafletLoaded = useLeaflet();
   const [stylists, setStylists] = useState([]);
   const [loading, setLoading] = useState(true);
   const [selectedStylist, setSelectedStylist] = useState(null);
   const [searchTerm, setSearchTerm] = useState('');
+  const markersRef = useRef({});
+  const liveRef = useRef(null);
+
+  // Live positions and waiting counts for the stylists in the visible area
+  const subscribeToViewport = (map) => {
+    if (liveRef.current) liveRef.current.close();
+    const bounds = map.getBounds();
+    const bbox = [
+      Math.max(bounds.getSouth(), -90), Math.max(bounds.getWest(), -180),
+      Math.min(bounds.getNorth(), 90), Math.min(bounds.getEast(), 180)
+    ].map(v => v.toFixed(4)).join(',');
+    const source = new EventSource(`${import.meta.env.VITE_API_URL || ''}/api/live?bbox=${bbox}`);
+    source.addEventListener('location', (e) => {
+      const update = JSON.parse(e.data);
+      const marker = markersRef.current[update.id];
+      if (marker && update.lat != null && update.lng != null) {
+        marker.setLatLng([update.lat, update.lng]);
+      }
+    });
+    source.addEventListener('waiting', (e) => {
+      const update = JSON.parse(e.data);
+      setStylists(prev => prev.map(s => (
+        s.id === update.id ? { ...s, waiting: update.waiting, capacity: update.capacity } : s
+      )));
+    });
+    const reloadPositions = () => {
+      fetch(`${import.meta.env.VITE_API_URL || ''}/api/coiffeurs/locations`)
+        .then(res => res.json())
+        .then(locations => locations.forEach(loc => {
+          const marker = markersRef.current[loc.id];
+          if (marker && loc.lat && loc.lng) marker.setLatLng([loc.lat, loc.lng]);
+        }))
+        .catch(err => console.error("Map data fetch error:", err));
+    };
+    // Missed updates could not be replayed after a long disconnect: reload positions
+    source.addEventListener('reset', reloadPositions);
+    // Refused or failed for good: catch up, then subscribe again later unless
+    // the viewport changed (or the page closed) meanwhile
+    source.onerror = () => {
+      if (source.readyState !== EventSource.CLOSED) return;
+      reloadPositions();
+      setTimeout(() => {
+        if (liveRef.current === source) subscribeToViewport(map);
+      }, LIVE_FALLBACK_RETRY_MS * (1 + Math.random()));
+    };
+    liveRef.current = source;
+  };
 
+  // The map shows every stylist, so the side list follows next_cursor to the
+  // last page, showing each page as it arrives
   useEffect(() => {
-    fetch(`${import.meta.env.VITE_API_URL || ''}/api/stylists`)
-      .then(res => res.json())
-      .then(data => {
-        setStylists(Array.isArray(data) ? data : []);
-        setLoading(false);
-      })
-      .catch(() => setLoading(false));
+    let cancelled = false;
+    const loadPage = (cursor) => {
+      const params = new URLSearchParams({ limit: 100 });
+      if (cursor) params.set('cursor', cursor);
+      fetch(`${import.meta.env.VITE_API_URL || ''}/api/stylists?${params}`)
+        .then(res => res.json())
+        .then(data => {
+          if (cancelled) return;
+          const page = Array.isArray(data.stylists) ? data.stylists : [];
+          setStylists(prev => cursor ? [...prev, ...page] : page);
+          setLoading(false);
+          if (data.next_cursor) loadPage(data.next_cursor);
+        })
+        .catch(() => setLoading(false));
+    };
+    loadPage(null);
+    return () => { cancelled = true; };
   }, []);
   
   useEffect(() => {
@@ -165,6 +227,7 @@ const MapPage = ({ onNavigate }) => {
                 });
 
                 markers.push(marker);
+                markersRef.current[loc.id] = marker;
               }
             });
             
@@ -172,10 +235,17 @@ const MapPage = ({ onNavigate }) => {
               const group = new window.L.featureGroup(markers);
               map.fitBounds(group.getBounds().pad(0.1));
             }
+
+            subscribeToViewport(map);
+            map.on('moveend', () => subscribeToViewport(map));
           }
         })
         .catch(err => console.error("Map data fetch error:", err));
     }
+    return () => {
+      if (liveRef.current) liveRef.current.close();
+      liveRef.current = null;
+    };
   }, [isLeafletLoaded]);
 
   const filteredStylists = stylists.filter(stylist => 
@@ -3,8 +3,12 @@ import { MapPin, Star, Heart, MessageSquare, Clock, Scissors, Calendar } from 'l
 import Button3D from '../UI/Button3D';
 import GlassCard from '../UI/GlassCard';
 
+// A stream the server refused (503 at capacity) is not retried by the browser
+const LIVE_FALLBACK_RETRY_MS = 15000;
+
 const ProfilePage = ({ stylistId, onNavigate, currentUser }) => {
   const [stylist, setStylist] = useState(null);
+  const [liveAttempt, setLiveAttempt] = useState(0);
   const [activeTab, setActiveTab] = useState('portfolio');
   const [isFollowing, setIsFollowing] = useState(false);
   const [loading, setLoading] = useState(true);
@@ -25,6 +29,47 @@ const ProfilePage = ({ stylistId, onNavigate, currentUser }) => {
       });
   }, [stylistId]);
 
+  // Live waiting count: small pushes instead of refetching the whole profile
+  useEffect(() => {
+    const source = new EventSource(`${import.meta.env.VITE_API_URL || ''}/api/live?stylists=${stylistId}`);
+    source.addEventListener('waiting', (e) => {
+      const update = JSON.parse(e.data);
+      setStylist(prev => prev && ({ ...prev, waiting: update.waiting, capacity: update.capacity }));
+    });
+    const refreshWaiting = () => {
+      fetch(`${import.meta.env.VITE_API_URL || ''}/api/stylists/${stylistId}`)
+        .then(res => res.json())
+        .then(data => setStylist(prev => prev && ({ ...prev, waiting: data.waiting, capacity: data.capacity })))
+        .catch(err => console.error(err));
+    };
+    // Sent after a long disconnect, when missed updates can no longer be replayed
+    source.addEventListener('reset', refreshWaiting);
+    // Refused or failed for good: catch up, then open a new stream later
+    let retryTimer = null;
+    source.onerror = () => {
+      if (source.readyState !== EventSource.CLOSED) return;
+      refreshWaiting();
+      retryTimer = setTimeout(() => setLiveAttempt(n => n + 1), LIVE_FALLBACK_RETRY_MS * (1 + Math.random()));
+    };
+    return () => {
+      clearTimeout(retryTimer);
+      source.close();
+    };
+  }, [stylistId, liveAttempt]);
+
+  const loadMorePosts = () => {
+    fetch(`${import.meta.env.VITE_API_URL || ''}/api/stylists/${stylistId}/publications?cursor=${stylist.feed_next_cursor}`)
+      .then(res => res.json())
+      .then(data => {
+        setStylist(prev => ({
+          ...prev,
+          feed: [...prev.feed, ...(data.publications || [])],
+          feed_next_cursor: data.next_cursor
+        }));
+      })
+      .catch(err => console.error(err));
+  };
+
   const handleBook = () => {
     if (!currentUser) {
       onNavigate('login');
@@ -190,7 +235,7 @@ const ProfilePage = ({ stylistId, onNavigate, currentUser }) => {
                               <Heart className="w-4 h-4" /> {post.likes || 0}
                             </span>
                             <span className="flex items-center gap-1 hover:text-blue-500 cursor-pointer">
-                              <MessageSquare className="w-4 h-4" /> {post.comments || 0}
+                              <MessageSquare className="w-4 h-4" /> {post.comments_count || 0}
                             </span>
                           </div>
                         </div>
@@ -201,6 +246,13 @@ const ProfilePage = ({ stylistId, onNavigate, currentUser }) => {
                       <p className="text-gray-500">No posts shared yet.</p>
                     </div>
                   )}
+                  {stylist.feed_next_cursor && (
+                    <div className="flex justify-center">
+                      <Button3D variant="outline" onClick={loadMorePosts}>
+                        Load more posts
+                      </Button3D>
+                    </div>
+                  )}
                 </div>
               ) : (
                 <div className="space-y-4">
@@ -6,15 +6,21 @@ import Button3D from '../UI/Button3D';
 const ReservationPage = ({ stylistId, onNavigate, currentUser }) => {
   const [stylist, setStylist] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [serviceId, setServiceId] = useState('');
+  const [availability, setAvailability] = useState([]);
+  const [date, setDate] = useState('');
+  const [time, setTime] = useState('');
+  const [slotsVersion, setSlotsVersion] = useState(0);
 
   useEffect(() => {
     fetch(`${import.meta.env.VITE_API_URL || ''}/api/stylists/${stylistId}`)
       .then(res => res.json())
       .then(data => {
-        setStylist({
-          ...data,
-          services: data.menu ? data.menu.map((m, i) => ({ id: i, service_name: m.name, price: m.price })) : [] 
-        });
+        // Real services carry an id and a duration; the menu is only a fallback for display
+        const services = data.services && data.services.length
+          ? data.services.map(s => ({ id: s.id, service_name: s.name, price: s.price, duration: s.duration }))
+          : (data.menu || []).map(m => ({ id: '', service_name: m.name, price: m.price }));
+        setStylist({ ...data, services });
         setLoading(false);
       })
       .catch(err => {
@@ -23,8 +29,29 @@ const ReservationPage = ({ stylistId, onNavigate, currentUser }) => {
       });
   }, [stylistId]);
 
+  // Free slots for the next two weeks, in one call, for the chosen service's duration
+  useEffect(() => {
+    const params = new URLSearchParams({ days: 14 });
+    if (serviceId) params.set('service_id', serviceId);
+    fetch(`${import.meta.env.VITE_API_URL || ''}/api/stylists/${stylistId}/availability?${params}`)
+      .then(res => res.json())
+      .then(data => {
+        const days = (data.days || []).filter(d => d.slots.length);
+        setAvailability(days);
+        setDate(current => days.some(d => d.date === current) ? current : (days[0] ? days[0].date : ''));
+        setTime('');
+      })
+      .catch(err => console.error(err));
+  }, [stylistId, serviceId, slotsVersion]);
+
+  const slots = (availability.find(d => d.date === date) || { slots: [] }).slots;
+
   const handleReservation = async (e) => {
     e.preventDefault();
+    if (!time) {
+      alert("Please choose a time slot.");
+      return;
+    }
     const formData = new FormData(e.target);
     
     try {
@@ -37,6 +64,10 @@ const ReservationPage = ({ stylistId, onNavigate, currentUser }) => {
       if (response.ok) {
         alert("Reservation Request Sent!");
         onNavigate(currentUser && currentUser.type === 'coiffeur' ? 'dashboard' : 'home');
+      } else if (response.status === 409) {
+        // Someone else just took this slot: offer the remaining ones
+        alert("This slot was just booked by someone else. Please pick another time.");
+        setSlotsVersion(v => v + 1);
       } else {
         alert("Error: " + (data.error || "Unknown error"));
       }
@@ -70,41 +101,56 @@ const ReservationPage = ({ stylistId, onNavigate, currentUser }) => {
             <label className="block text-sm font-medium text-pink-500">Select Service</label>
             <select 
               name="service" 
-              required 
+              required={stylist.services.some(s => s.id !== '')}
+              value={serviceId}
+              onChange={e => setServiceId(e.target.value)}
               className="w-full px-4 py-3 rounded-lg bg-zinc-800 border border-pink-500/50 text-white focus:outline-none focus:ring-2 focus:ring-pink-500/20 transition duration-300"
             >
-              <option value="" disabled selected>-- Choose a Service --</option>
-              {stylist.services && stylist.services.map(s => (
-                <option key={s.id} value={s.id}>
-                  {s.service_name} ({s.price}€)
+              <option value="">-- Choose a Service --</option>
+              {stylist.services && stylist.services.map((s, i) => (
+                <option key={i} value={s.id}>
+                  {s.service_name} ({s.price}€{s.duration ? `, ${s.duration} min` : ''})
                 </option>
               ))}
             </select>
           </div>
           
-          <div className="grid grid-cols-1 md:grid-cols-2 gap-4 md:gap-6">
-            <div className="space-y-2">
-              <label className="block text-sm font-medium text-pink-500 flex items-center gap-2">
-                <Calendar className="w-4 h-4" /> Date
-              </label>
-              <input 
-                type="date" 
-                name="date" 
-                required 
-                className="w-full px-4 py-3 rounded-lg bg-zinc-800 border border-pink-500/50 text-white focus:outline-none focus:ring-2 focus:ring-pink-500/20"
-              />
-            </div>
-            
-            <div className="space-y-2">
-              <label className="block text-sm font-medium text-pink-500 flex items-center gap-2">
-                <Clock className="w-4 h-4" /> Time
-              </label>
-              <input 
-                type="time" 
-                name="time" 
-                required 
-                className="w-full px-4 py-3 rounded-lg bg-zinc-800 border border-pink-500/50 text-white focus:outline-none focus:ring-2 focus:ring-pink-500/20"
-              />
+          <div className="space-y-2">
+            <label className="block text-sm font-medium text-pink-500 flex items-center gap-2">
+              <Calendar className="w-4 h-4" /> Date
+            </label>
+            <select 
+              name="date" 
+              required 
+              value={date}
+              onChange={e => { setDate(e.target.value); setTime(''); }}
+              className="w-full px-4 py-3 rounded-lg bg-zinc-800 border border-pink-500/50 text-white focus:outline-none focus:ring-2 focus:ring-pink-500/20"
+            >
+              {availability.length === 0 && <option value="">No availability in the next two weeks</option>}
+              {availability.map(d => (
+                <option key={d.date} value={d.date}>
+                  {new Date(`${d.date}T00:00`).toLocaleDateString(undefined, { weekday: 'long', day: 'numeric', month: 'long' })}
+                </option>
+              ))}
+            </select>
+          </div>
+
+          <div className="space-y-2">
+            <label className="block text-sm font-medium text-pink-500 flex items-center gap-2">
+              <Clock className="w-4 h-4" /> Time
+            </label>
+            <input type="hidden" name="time" value={time} />
+            <div className="grid grid-cols-4 md:grid-cols-6 gap-2">
+              {slots.map(slot => (
+                <button
+                  key={slot}
+                  type="button"
+                  onClick={() => setTime(slot)}
+                  className={`py-2 rounded-lg border text-sm transition duration-300 ${time === slot ? 'bg-pink-500 border-pink-500 text-white' : 'bg-zinc-800 border-pink-500/50 text-gray-300 hover:border-pink-500'}`}
+                >
+                  {slot}
+                </button>
+              ))}
             </div>
           </div>
 
@@ -23,8 +23,10 @@ const SearchPage = ({ onNavigate }) => {
   const [allStylists, setAllStylists] = useState([]);
   const [filteredStylists, setFilteredStylists] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
   const [viewMode, setViewMode] = useState('grid'); // 'grid' or 'list'
   const [showFilters, setShowFilters] = useState(true);
+  const [query, setQuery] = useState('');
   const [filters, setFilters] = useState({ 
     city: '', 
     category: 'all', 
@@ -33,36 +35,30 @@ const SearchPage = ({ onNavigate }) => {
     availability: 'all'
   });
 
-  useEffect(() => {
-    fetch(`${import.meta.env.VITE_API_URL || ''}/api/stylists`)
+  // Text search, city and category run on the server (/api/search ranks by
+  // relevance); rating, availability and "popular" refine the loaded pages
+  const fetchPage = (cursor) => {
+    const params = new URLSearchParams({ limit: 48 });
+    if (cursor) params.set('cursor', cursor);
+    if (filters.city) params.set('city', filters.city);
+    if (filters.category !== 'all') params.set('category', filters.category);
+    let endpoint = 'stylists';
+    if (query.trim()) {
+      endpoint = 'search';
+      params.set('q', query.trim());
+    } else if (filters.sort === 'waiting') {
+      params.set('sort_by', 'waiting');
+    }
+    return fetch(`${import.meta.env.VITE_API_URL || ''}/api/${endpoint}?${params}`)
       .then(res => res.json())
       .then(data => {
-        const list = Array.isArray(data) ? data : [];
-        setAllStylists(list);
-        setFilteredStylists(list);
-        setLoading(false);
-      })
-      .catch(() => setLoading(false));
-  }, []);
-
-  const handleFilterChange = (e) => {
-    const { name, value } = e.target;
-    setFilters(prev => ({ ...prev, [name]: value }));
+        setNextCursor(data.next_cursor || null);
+        return Array.isArray(data.stylists) ? data.stylists : [];
+      });
   };
 
-  const applyFilters = (e) => {
-    if (e) e.preventDefault();
-    let result = [...allStylists];
-
-    // Filter by city
-    if (filters.city) {
-      result = result.filter(s => s.city === filters.city);
-    }
-
-    // Filter by category
-    if (filters.category !== 'all') {
-      result = result.filter(s => s.category === filters.category);
-    }
+  const refine = (list) => {
+    let result = [...list];
 
     // Filter by minimum rating
     if (filters.minRating > 0) {
@@ -76,16 +72,46 @@ const SearchPage = ({ onNavigate }) => {
       result = result.filter(s => (s.waiting || 0) >= 5);
     }
 
-    // Sort results
-    if (filters.sort === 'rating') {
-      result.sort((a, b) => (b.rating || 0) - (a.rating || 0));
-    } else if (filters.sort === 'waiting') {
-      result.sort((a, b) => (a.waiting || 0) - (b.waiting || 0));
-    } else if (filters.sort === 'popular') {
+    if (filters.sort === 'popular') {
       result.sort((a, b) => (b.capacity || 0) - (a.capacity || 0));
     }
+    return result;
+  };
+
+  useEffect(() => {
+    fetchPage()
+      .then(list => {
+        setAllStylists(list);
+        setFilteredStylists(list);
+        setLoading(false);
+      })
+      .catch(() => setLoading(false));
+  }, []);
+
+  const loadMore = () => {
+    fetchPage(nextCursor)
+      .then(list => {
+        setAllStylists(prev => [...prev, ...list]);
+        setFilteredStylists(prev => [...prev, ...refine(list)]);
+      })
+      .catch(() => {});
+  };
+
+  const handleFilterChange = (e) => {
+    const { name, value } = e.target;
+    setFilters(prev => ({ ...prev, [name]: value }));
+  };
 
-    setFilteredStylists(result);
+  const applyFilters = (e) => {
+    if (e) e.preventDefault();
+    setLoading(true);
+    fetchPage()
+      .then(list => {
+        setAllStylists(list);
+        setFilteredStylists(refine(list));
+        setLoading(false);
+      })
+      .catch(() => setLoading(false));
   };
 
   const clearFilters = () => {
@@ -96,10 +122,22 @@ const SearchPage = ({ onNavigate }) => {
       minRating: 0,
       availability: 'all'
     });
-    setFilteredStylists(allStylists);
+    setQuery('');
+    setLoading(true);
+    const params = new URLSearchParams({ limit: 48 });
+    fetch(`${import.meta.env.VITE_API_URL || ''}/api/stylists?${params}`)
+      .then(res => res.json())
+      .then(data => {
+        const list = Array.isArray(data.stylists) ? data.stylists : [];
+        setNextCursor(data.next_cursor || null);
+        setAllStylists(list);
+        setFilteredStylists(list);
+        setLoading(false);
+      })
+      .catch(() => setLoading(false));
   };
 
-  const hasActiveFilters = filters.city || filters.category !== 'all' || filters.minRating > 0 || filters.availability !== 'all';
+  const hasActiveFilters = query.trim() || filters.city || filters.category !== 'all' || filters.minRating > 0 || filters.availability !== 'all';
 
   return (
     <div className="min-h-screen">
@@ -227,6 +265,18 @@ const SearchPage = ({ onNavigate }) => {
               </div>
 
               <form onSubmit={applyFilters} className="space-y-6">
+                {/* Full-text search */}
+                <div className="relative">
+                  <input
+                    type="search"
+                    value={query}
+                    onChange={e => setQuery(e.target.value)}
+                    placeholder="Search a stylist, a service or a menu (e.g. kératine, dégradé)..."
+                    className="w-full px-4 py-3 pl-11 rounded-xl bg-black/50 border border-white/10 text-white focus:outline-none focus:border-pink-500/50 focus:bg-black/70 transition-all"
+                  />
+                  <Search className="absolute left-3.5 top-1/2 transform -translate-y-1/2 w-4 h-4 text-gray-500 pointer-events-none" />
+                </div>
+
                 <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-4 gap-4">
                   {/* Location */}
                   <div className="space-y-2">
@@ -506,6 +556,14 @@ const SearchPage = ({ onNavigate }) => {
             </div>
           </div>
         )}
+
+        {!loading && nextCursor && (
+          <div className="flex justify-center mt-10">
+            <Button3D variant="secondary" onClick={loadMore}>
+              Load more stylists
+            </Button3D>
+          </div>
+        )}
       </div>
 
       {/* Bottom Spacing */}